@@ -0,0 +1,112 @@
+import random
+from datetime import datetime
+from bson import ObjectId
+from backend.utils.data_access import find_one, insert_one
+from backend.utils.helpers import is_valid_object_id
+
+# Route logic shared by the Flask routes and the ASGI app (backend/asgi.py).
+# Each handler is a generator of data-access steps (see backend/utils/data_access.py)
+# returning (payload, status, headers). Repository reads join in through their
+# `*_steps` methods.
+
+
+# Function to get a train's live position, generating demo data the first time
+def train_location(repos, train_id):
+    if not is_valid_object_id(train_id):
+        return {'error': 'Invalid train id'}, 400, {}
+    train_id = ObjectId(train_id)
+    # In a real application, this would fetch real-time GPS data
+    tracking_info = yield find_one('tracking', {'train_id': train_id})
+    # One train lookup serves both the mock data and the route points
+    train = yield from repos.trains.get_steps(train_id)
+
+    if not tracking_info:
+        # Generate mock data for demo
+        if not train:
+            return {'error': 'Train not found'}, 404, {}
+        tracking_info = {
+            'train_id': train_id,
+            'status': 'Running',
+            'current_station': train.get('source'),
+            'next_station': train.get('destination'),
+            'progress': random.randint(10, 90),  # Random progress between 10-90%
+            'speed': random.randint(60, 120),  # Random speed in km/h
+            'delay': random.randint(0, 30),  # Random delay 0-30 minutes
+            'distance': train.get('distance', 1000),  # Default 1000km if not set
+            'duration': train.get('duration', '16h 30m'),
+            'updated_at': datetime.utcnow()
+        }
+        # Save mock data
+        yield insert_one('tracking', tracking_info)
+
+    # Add route points for map
+    if train:
+        tracking_info['source'] = train.get('source')
+        tracking_info['destination'] = train.get('destination')
+    return {'tracking': tracking_info}, 200, {}
+
+
+# Function to queue an OTP for a passenger's phone
+def send_otp(messaging, data):
+    phone = (data or {}).get('phone')
+    if not phone:
+        return {'error': 'Phone number required for OTP'}, 400, {}
+    if not messaging.otp_enabled:
+        return {'error': 'Twilio service not configured'}, 500, {}
+
+    tracking_id, retry_after = yield from messaging.send_otp_steps(phone)
+    if tracking_id is None:
+        return {
+            'error': 'An OTP was sent to this number recently',
+            'retry_after': retry_after
+        }, 429, {'Retry-After': str(retry_after)}
+    return {
+        'message': 'OTP is being sent to phone number',
+        'tracking_id': str(tracking_id),
+        'status': 'queued'
+    }, 202, {}
+
+
+def otp_status(messaging, tracking_id):
+    if not is_valid_object_id(tracking_id):
+        return {'error': 'Invalid tracking id'}, 400, {}
+    otp_request = yield from messaging.get_otp_request_steps(ObjectId(tracking_id))
+    if not otp_request:
+        return {'error': 'OTP request not found'}, 404, {}
+    return {'otp': otp_request}, 200, {}
+
+
+# Function to check a passenger's OTP and find or create their user
+def verify_otp(messaging, data):
+    data = data or {}
+    phone = data.get('phone')
+    otp = data.get('otp')
+    if not phone or not otp:
+        return {'error': 'Phone number and OTP required'}, 400, {}
+    if not messaging.otp_enabled:
+        return {'error': 'Twilio service not configured'}, 500, {}
+
+    try:
+        approved = yield from messaging.verify_otp_steps(phone, otp)
+    except Exception as e:
+        return {'error': f'Failed to verify OTP: {str(e)}'}, 500, {}
+    if not approved:
+        return {'error': 'Invalid OTP'}, 401, {}
+
+    # Find or create user
+    user = yield find_one('users', {'phone': phone})
+    if not user:
+        user = {
+            'name': 'Passenger',
+            'phone': phone,
+            'role': 'passenger',
+            'created_at': datetime.utcnow()
+        }
+        user_id = (yield insert_one('users', user)).inserted_id
+    else:
+        user_id = user['_id']
+    return {
+        'message': 'Phone number verified successfully',
+        'user_id': str(user_id),
+        'role': 'passenger'
+    }, 200, {}
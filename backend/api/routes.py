@@ -1,21 +1,56 @@
+from flask import Blueprint, Response, g, request, stream_with_context
+from bson import ObjectId
+import atexit
+import queue
+from datetime import datetime
+from backend.api import handlers
+from backend.models.repositories import BOOKING_VIEWS, Repositories
+from backend.utils.helpers import (
+    FULL_ROUTE_MASK, MAX_SEGMENTS, SEAT_WORD_BITS, coach_seat_map, decode_keyset_cursor, encode_keyset_cursor,
+    encode_seat_map, format_sse, is_valid_object_id, journey_segment_mask, parse_booking_seats, route_stops,
+    seat_bits_booked
+)
+from backend.services.alerts_feed import ALERT_BUFFER_SIZE, AlertFeed, parse_alert_cursor
+from backend.services.availability import RECONCILE_INTERVAL_SECONDS, AvailabilityIndex
+from backend.services.bulk_bookings import MAX_BULK_BOOKINGS, create_bulk_bookings
+from backend.services.cache import build_cache
+from backend.services.fares import DEFAULT_RATE_PER_KM, FARE_REFRESH_SECONDS, FareEngine
+from backend.services.messaging import OTP_THROTTLE_SECONDS, MessagingService, build_messaging_backend
+from backend.services.notifications import JOB_STALE_SECONDS, JOB_SWEEP_SECONDS, NotificationDispatcher
+from backend.services.provisioning import create_coaches, parse_consist
+from backend.services.quota_allocation import QuotaAllocator
+from backend.services.seat_allocation import BERTH_TYPES, KEEP_TOGETHER, MAX_PARTY_SIZE, SeatAllocator
+from backend.services.seat_holds import SeatHoldEngine
+from backend.services.segment_availability import free_seats_by_coach
+from backend.services.telemetry import (
+    COALESCE_WINDOW_SECONDS, HISTORY_CAPPED_BYTES, HISTORY_RETENTION_SECONDS, MAX_BATCH_RECORDS,
+    TelemetryIngest, ensure_history_collection
+)
+from backend.services.tracking_stream import DEFAULT_POLL_INTERVAL, TrackingHub
+from backend.services.waitlist import MAX_WAITLIST_SEATS, RAC_LIMIT, TIER_NAMES, WaitlistEngine
+from backend.utils.data_access import run
+from backend.utils.serialization import dumps, json_response, loads, parse_fields, project
 
-def register_routes(app, db):
-    api = Blueprint('api', __name__)
+# Train search pagination limits
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
 
-    @api.route('/api/users/by_email')
-    def get_user_by_email():
-        email = request.args.get('email')
-        if not email:
-            return jsonify({'error': 'Email required'}), 400
-        user = db.users.find_one({'email': email})
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-        return jsonify({'user_id': str(user['_id'])}), 200
+# Seconds between SSE keep-alive comments on idle streams
+SSE_HEARTBEAT_SECONDS = 15
 
-from flask import Blueprint, request, jsonify
-from bson import ObjectId
-import json
-from datetime import datetime
+# Admin bookings report page size
+BOOKINGS_PAGE_SIZE = 500
+BOOKINGS_MAX_PAGE_SIZE = 5000
+
+# Most counter documents one quota can be split over
+MAX_QUOTA_SHARDS = 64
+
+# "My bookings" page size
+USER_BOOKINGS_PAGE_SIZE = 20
+USER_BOOKINGS_MAX_PAGE_SIZE = 100
+
+# Booking fields a user's history may ask for with ?fields=
+USER_BOOKING_FIELDS = set(BOOKING_VIEWS['history']) | {'user_id', 'segments'}
 
 # Function to register all routes
 def register_routes(app, db):
@@ -23,120 +58,135 @@ def register_routes(app, db):
     # Create API blueprint FIRST so 'api' is defined before use
     api = Blueprint('api', __name__)
 
-    # --- Passenger Phone/OTP Login ---
-    from twilio.rest import Client
-    from flask import current_app
+    # Seat holds live in their own collection with a TTL index
+    seat_holds = SeatHoldEngine(db)
+    # Seats for a whole party are chosen server-side and held together
+    seat_allocator = SeatAllocator(db, seat_holds)
+
+    # One messaging backend (pooled Twilio client or stub) per process, shared
+    # by OTP login and passenger notifications
+    messaging = MessagingService(
+        db, build_messaging_backend(app.config),
+        max_workers=app.config.get('OTP_WORKERS', 8),
+        throttle_seconds=app.config.get('OTP_THROTTLE_SECONDS', OTP_THROTTLE_SECONDS)
+    )
+
+    # Route deviation SMS fan-out runs on a background worker pool
+    notifications = NotificationDispatcher(
+        db, messaging.backend,
+        max_workers=app.config.get('NOTIFICATION_WORKERS', 8),
+        rate_per_second=app.config.get('NOTIFICATION_RATE_PER_SECOND', 20),
+        stale_seconds=app.config.get('NOTIFICATION_STALE_SECONDS', JOB_STALE_SECONDS)
+    )
+    # Jobs left queued, or running with a stale heartbeat, by a stopped process are picked up again
+    notifications.resume_pending()
+    notifications.start_sweeper(app.config.get('NOTIFICATION_SWEEP_SECONDS', JOB_SWEEP_SECONDS))
+
+    # One shared watcher per tracked train feeds every SSE subscriber
+    tracking_hub = TrackingHub(
+        db,
+        poll_interval=app.config.get('TRACKING_POLL_INTERVAL', DEFAULT_POLL_INTERVAL),
+        use_change_streams=app.config.get('TRACKING_CHANGE_STREAMS', True)
+    )
+
+    # Recent alerts served from memory; new alerts are pushed to SSE subscribers
+    alert_feed = AlertFeed(
+        db,
+        size=app.config.get('ALERT_BUFFER_SIZE', ALERT_BUFFER_SIZE),
+        poll_interval=app.config.get('TRACKING_POLL_INTERVAL', DEFAULT_POLL_INTERVAL),
+        use_change_streams=app.config.get('TRACKING_CHANGE_STREAMS', True)
+    ).start()
+
+    # Read-through cache for hot timetable documents; every write path below
+    # that changes a cached document invalidates its key
+    cache = build_cache(app.config)
+
+    # Repositories for the current request. They share one identity map, so a
+    # document read twice while handling a request is fetched once.
+    def repos():
+        if 'repos' not in g:
+            g.repos = Repositories(db, cache=cache)
+        return g.repos
 
+    # Quota counters (tatkal, general, ...) consumed atomically at booking time
+    quotas = QuotaAllocator(db, fallback_order=app.config.get('QUOTA_FALLBACK_ORDER'))
+
+    # Batched coach position / tracking ingest; buffered reports are flushed on exit
+    if app.config.get('TELEMETRY_HISTORY'):
+        ensure_history_collection(
+            db,
+            retention_seconds=app.config.get('TELEMETRY_HISTORY_SECONDS', HISTORY_RETENTION_SECONDS),
+            capped_bytes=app.config.get('TELEMETRY_HISTORY_CAPPED_BYTES', HISTORY_CAPPED_BYTES)
+        )
+    telemetry = TelemetryIngest(
+        db,
+        window=app.config.get('TELEMETRY_COALESCE_SECONDS', COALESCE_WINDOW_SECONDS),
+        history=app.config.get('TELEMETRY_HISTORY', False),
+        on_flush=lambda keys: cache.invalidate(*{f'positions:{train_id}' for kind, train_id, _ in keys if kind == 'coach_position'})
+    )
+    atexit.register(telemetry.shutdown)
+
+    # Station-pair distance and fare tables; new trains are merged in by every worker
+    fares = FareEngine(
+        db, rate_per_km=app.config.get('FARE_PER_KM', DEFAULT_RATE_PER_KM),
+        refresh_seconds=app.config.get('FARE_REFRESH_SECONDS', FARE_REFRESH_SECONDS)
+    ).load()
+
+    # RAC/waitlist queues per (train, date, class), promoted when bookings are cancelled
+    waitlist = WaitlistEngine(db, rac_limit=app.config.get('WAITLIST_RAC_LIMIT', RAC_LIMIT), fares=fares)
+
+    # Seat counts per (train, class), kept up to date by every booking and cancellation
+    # and rebuilt from the coaches by a background job
+    availability = AvailabilityIndex(db)
+    availability.start_reconciler(app.config.get('AVAILABILITY_RECONCILE_SECONDS', RECONCILE_INTERVAL_SECONDS))
+
+    # --- Passenger Phone/OTP Login ---
+    # OTPs are sent from the messaging worker pool; the request only queues them
     @api.route('/api/passenger/send_otp', methods=['POST'])
     def send_passenger_otp():
-        data = request.get_json()
-        phone = data.get('phone')
-        
-        if not phone:
-            return jsonify({'error': 'Phone number required for OTP'}), 400
-            
-        try:
-            # Initialize Twilio client
-            account_sid = current_app.config['TWILIO_ACCOUNT_SID']
-            auth_token = current_app.config['TWILIO_AUTH_TOKEN']
-            verify_sid = current_app.config['TWILIO_VERIFY_SID']
-            
-            if not all([account_sid, auth_token, verify_sid]):
-                return jsonify({'error': 'Twilio service not configured'}), 500
-                
-            client = Client(account_sid, auth_token)
-            
-            # Send verification code via Twilio Verify
-            verification = client.verify \
-                .v2.services(verify_sid) \
-                .verifications \
-                .create(to=phone, channel='sms')
-                
-            return jsonify({
-                'message': 'OTP sent to phone number',
-                'status': verification.status
-            }), 200
-            
-        except Exception as e:
-            return jsonify({'error': f'Failed to send OTP: {str(e)}'}), 500
+        body, status, headers = run(handlers.send_otp(messaging, request.get_json()), db)
+        return json_response(body), status, headers
+
+    @api.route('/api/passenger/otp/<tracking_id>', methods=['GET'])
+    def get_otp_status(tracking_id):
+        body, status, headers = run(handlers.otp_status(messaging, tracking_id), db)
+        return json_response(body), status, headers
 
     @api.route('/api/passenger/verify_otp', methods=['POST'])
     def verify_passenger_otp():
-        data = request.get_json()
-        phone = data.get('phone')
-        otp = data.get('otp')
-        
-        if not phone or not otp:
-            return jsonify({'error': 'Phone number and OTP required'}), 400
-            
-        try:
-            # Initialize Twilio client
-            account_sid = current_app.config['TWILIO_ACCOUNT_SID']
-            auth_token = current_app.config['TWILIO_AUTH_TOKEN']
-            verify_sid = current_app.config['TWILIO_VERIFY_SID']
-            
-            client = Client(account_sid, auth_token)
-            
-            # Verify the code
-            verification_check = client.verify \
-                .v2.services(verify_sid) \
-                .verification_checks \
-                .create(to=phone, code=otp)
-                
-            if verification_check.status == 'approved':
-                # Find or create user
-                user = db.users.find_one({'phone': phone})
-                if not user:
-                    user = {
-                        'name': 'Passenger',
-                        'phone': phone,
-                        'role': 'passenger',
-                        'created_at': datetime.utcnow()
-                    }
-                    user_id = db.users.insert_one(user).inserted_id
-                else:
-                    user_id = user['_id']
-                
-                return jsonify({
-                    'message': 'Phone number verified successfully',
-                    'user_id': str(user_id),
-                    'role': 'passenger'
-                }), 200
-            else:
-                return jsonify({'error': 'Invalid OTP'}), 401
-                
-        except Exception as e:
-            return jsonify({'error': f'Failed to verify OTP: {str(e)}'}), 500
+        body, status, headers = run(handlers.verify_otp(messaging, request.get_json()), db)
+        return json_response(body), status, headers
 
     # --- Admin: Clear All Bookings ---
     @api.route('/api/admin/bookings/clear', methods=['POST'])
     def clear_all_bookings():
-        db.bookings.delete_many({})
-        return jsonify({'message': 'All bookings cleared'}), 200
+        repos().bookings.delete_all()
+        return json_response({'message': 'All bookings cleared'}), 200
 
     # Admin: Get all bookings (with user and train info, price, distance, duration)
-    @api.route('/api/bookings/all', methods=['GET'])
-    def get_all_bookings():
-        bookings = list(db.bookings.find())
-        result = []
+    def build_booking_rows(bookings):
+        # Prefetch users and trains for the whole batch with one $in query each
+        users = repos().users.get_many((b['user_id'] for b in bookings if b.get('user_id')), view='contact')
+        trains = repos().trains.get_many((b['train_id'] for b in bookings if b.get('train_id')), view='report')
+        # Prices are stored at booking time; older bookings are priced as one batch
+        unpriced = [b for b in bookings if 'price' not in b]
+        priced = dict(zip((id(b) for b in unpriced), fares.price_journeys([
+            (b.get('train_id'), b.get('from'), b.get('to'), len(b['seats']) if isinstance(b.get('seats'), list) else 1)
+            for b in unpriced
+        ])))
+
+        rows = []
         for b in bookings:
-            # Get user info
-            user = db.users.find_one({'_id': b.get('user_id')}) if b.get('user_id') else None
-            # Get train info
-            train = db.trains.find_one({'_id': b.get('train_id')}) if b.get('train_id') else None
-            # Calculate distance and duration if train info available
-            distance = train.get('distance') if train and 'distance' in train else b.get('distance', '-')
+            user = users.get(b.get('user_id'))
+            train = trains.get(b.get('train_id'))
+            fare = b if 'price' in b else priced.get(id(b)) or {}
+            distance = fare.get('distance', '-')
+            price = fare.get('price', '-')
             duration = train.get('duration') if train and 'duration' in train else b.get('duration', '-')
-            # Calculate price: ₹10/km/seat as example
-            num_seats = len(b['seats']) if isinstance(b.get('seats'), list) else 1
-            try:
-                price = int(distance) * 10 * num_seats if distance and str(distance).isdigit() else '-'
-            except:
-                price = '-'
-            result.append({
+            rows.append({
                 '_id': str(b.get('_id')),
                 'user_name': user.get('name') if user else '-',
-                'user_phone': user.get('phone') if user else user.get('email') if user else '-',
+                'user_phone': (user.get('phone') or user.get('email') or '-') if user else '-',
                 'train_name': train.get('name') if train else b.get('train_name','-'),
                 'from': train.get('source') if train else b.get('from','-'),
                 'to': train.get('destination') if train else b.get('to','-'),
@@ -148,36 +198,114 @@ def register_routes(app, db):
                 'price': price,
                 'status': b.get('status','-')
             })
-        return jsonify({'bookings': result}), 200
-    # Create API blueprint FIRST so 'api' is defined before use
-    api = Blueprint('api', __name__)
+        return rows
+
+    @api.route('/api/bookings/all', methods=['GET'])
+    def get_all_bookings():
+        try:
+            limit = min(max(int(request.args.get('limit', BOOKINGS_PAGE_SIZE)), 1), BOOKINGS_MAX_PAGE_SIZE)
+        except ValueError:
+            return json_response({'error': 'limit must be an integer'}), 400
+        after = request.args.get('after')
+        if after and not is_valid_object_id(after):
+            return json_response({'error': 'Invalid cursor'}), 400
+        after = ObjectId(after) if after else None
+
+        # Streaming mode: one NDJSON line per booking, fetched and joined batch by batch
+        if request.args.get('format') == 'ndjson':
+            def generate():
+                batch = []
+                for booking in repos().bookings.scan(after, batch_size=limit):
+                    batch.append(booking)
+                    if len(batch) == limit:
+                        for row in build_booking_rows(batch):
+                            yield dumps(row) + b'\n'
+                        batch = []
+                for row in build_booking_rows(batch):
+                    yield dumps(row) + b'\n'
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+        # Cursor pagination on _id: fetch one extra row to know whether there is a next page
+        bookings = list(repos().bookings.scan(after, limit=limit + 1))
+        page = bookings[:limit]
+        next_cursor = str(page[-1]['_id']) if len(bookings) > limit else None
+        return json_response({'bookings': build_booking_rows(page), 'next_cursor': next_cursor}), 200
 
     # --- Coach Seat Map Endpoints ---
     @api.route('/api/trains/<train_id>/coaches', methods=['GET'])
     def get_coaches(train_id):
-        coaches = list(db.coaches.find({'train_id': ObjectId(train_id)}))
-        return jsonify({'coaches': json.loads(json.dumps(coaches, default=str))}), 200
+        coaches = repos().coaches.for_train(ObjectId(train_id))
+        return json_response({'coaches': coaches}), 200
+
+    @api.route('/api/trains/<train_id>/availability', methods=['GET'])
+    def get_segment_availability(train_id):
+        train = repos().trains.get(ObjectId(train_id))
+        if not train:
+            return json_response({'error': 'Train not found'}), 404
+        try:
+            segments = journey_segment_mask(train, request.args.get('from'), request.args.get('to'))
+        except ValueError as e:
+            return json_response({'error': str(e)}), 400
+        free = free_seats_by_coach(repos().coaches.for_train(ObjectId(train_id), view='availability'), segments)
+        return json_response({
+            'stops': route_stops(train),
+            'coaches': [
+                {'coach_number': coach_number, 'free_seats': len(seats), 'seats': seats}
+                for coach_number, seats in free.items()
+            ],
+            'total_free': sum(len(seats) for seats in free.values())
+        }), 200
+
+    @api.route('/api/trains/<train_id>/availability/summary', methods=['GET'])
+    def get_availability_summary(train_id):
+        summary = availability.get([ObjectId(train_id)]).get(ObjectId(train_id), [])
+        return json_response({
+            'classes': summary,
+            'available_seats': sum(c['available'] for c in summary)
+        }), 200
 
     @api.route('/api/trains/<train_id>/coaches/<coach_number>/seatmap', methods=['GET'])
     def get_seat_map(train_id, coach_number):
-        coach = db.coaches.find_one({'train_id': ObjectId(train_id), 'coach_number': coach_number})
+        coach = repos().coaches.get(ObjectId(train_id), coach_number, view='seat_map')
         if not coach:
-            return jsonify({'error': 'Coach not found'}), 404
-        return jsonify({'seat_map': coach.get('seat_map', {})}), 200
+            return json_response({'error': 'Coach not found'}), 404
+        segments = None
+        if 'segment_bits' in coach and (request.args.get('from') or request.args.get('to')):
+            train = repos().trains.get(ObjectId(train_id))
+            try:
+                segments = journey_segment_mask(train or {}, request.args.get('from'), request.args.get('to'))
+            except ValueError as e:
+                return json_response({'error': str(e)}), 400
+        return json_response({
+            'seat_map': coach_seat_map(coach, segments),
+            'held': seat_holds.active_holds(ObjectId(train_id), coach_number)
+        }), 200
 
     @api.route('/api/trains/<train_id>/coaches/<coach_number>/seatmap', methods=['POST'])
     def update_seat_map(train_id, coach_number):
         data = request.get_json()
         seat_map = data.get('seat_map')
         if seat_map is None:
-            return jsonify({'error': 'Missing seat_map'}), 400
-        result = db.coaches.update_one(
-            {'train_id': ObjectId(train_id), 'coach_number': coach_number},
-            {'$set': {'seat_map': seat_map}}
-        )
-        if result.matched_count == 0:
-            return jsonify({'error': 'Coach not found'}), 404
-        return jsonify({'message': 'Seat map updated'}), 200
+            return json_response({'error': 'Missing seat_map'}), 400
+        coach = repos().coaches.get(ObjectId(train_id), coach_number, view='seat_map')
+        if not coach:
+            return json_response({'error': 'Coach not found'}), 404
+        # Store the compact bitmap instead of the JSON map
+        total_seats = data.get('total_seats') or coach.get('total_seats')
+        seat_bits = encode_seat_map(seat_map, total_seats)
+        total_seats = total_seats or len(seat_bits) * SEAT_WORD_BITS
+        update = {'total_seats': total_seats}
+        if 'segment_bits' in coach:
+            # Segment-aware coach: a seat booked in the map is sold on every segment
+            update['segment_bits'] = [FULL_ROUTE_MASK if booked else 0 for booked in seat_bits_booked(seat_bits, total_seats)]
+        else:
+            update['seat_bits'] = seat_bits
+        if data.get('coach_type'):
+            update['coach_type'] = data['coach_type']
+        repos().coaches.update(ObjectId(train_id), coach_number, {'$set': update, '$unset': {'seat_map': ''}})
+        rewritten = dict({k: v for k, v in coach.items() if k != 'seat_map'}, **update)
+        availability.record_coaches(ObjectId(train_id), [(coach, rewritten)])
+        return json_response({'message': 'Seat map updated'}), 200
 
     # --- Seat Selection/Locking ---
     @api.route('/api/bookings/lock', methods=['POST'])
@@ -186,41 +314,195 @@ def register_routes(app, db):
         required_fields = ['train_id', 'coach_number', 'seat_number']
         for field in required_fields:
             if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-        # Lock seat (set as unavailable in seat_map)
-        coach = db.coaches.find_one({'train_id': ObjectId(data['train_id']), 'coach_number': data['coach_number']})
-        if not coach:
-            return jsonify({'error': 'Coach not found'}), 404
-        seat_map = coach.get('seat_map', {})
-        if seat_map.get(data['seat_number']) == 'unavailable':
-            return jsonify({'error': 'Seat already locked'}), 409
-        seat_map[data['seat_number']] = 'unavailable'
-        db.coaches.update_one({'_id': coach['_id']}, {'$set': {'seat_map': seat_map}})
-        return jsonify({'message': 'Seat locked'}), 200
+                return json_response({'error': f'Missing required field: {field}'}), 400
+        segments = None
+        if data.get('from') or data.get('to'):
+            train = repos().trains.get(ObjectId(data['train_id']))
+            try:
+                segments = journey_segment_mask(train or {}, data.get('from'), data.get('to'))
+            except ValueError as e:
+                return json_response({'error': str(e)}), 400
+        # Hold the seat with a single atomic insert; the hold expires on its own
+        hold, error = seat_holds.hold(
+            ObjectId(data['train_id']), data['coach_number'], data['seat_number'],
+            holder=data.get('user_id'), segments=segments
+        )
+        if error == 'invalid_seat':
+            return json_response({'error': 'Invalid seat number'}), 400
+        if error == 'coach_not_found':
+            return json_response({'error': 'Coach not found'}), 404
+        if error:
+            return json_response({'error': 'Seat already locked'}), 409
+        return json_response({'message': 'Seat locked', 'expires_at': hold['expires_at'].isoformat()}), 200
+
+    # Choose and hold seats for a party: berth preferences (one per passenger, e.g.
+    # 'lower', 'side lower') and how closely the party must sit together. The seats
+    # come back as "<coach>-<seat>" strings ready for POST /api/bookings.
+    @api.route('/api/bookings/allocate', methods=['POST'])
+    def allocate_seats():
+        data = request.get_json()
+        for field in ['train_id', 'party_size']:
+            if field not in data:
+                return json_response({'error': f'Missing required field: {field}'}), 400
+        if not is_valid_object_id(data['train_id']):
+            return json_response({'error': 'Invalid train ID'}), 400
+        party_size = data['party_size']
+        if not isinstance(party_size, int) or not 0 < party_size <= MAX_PARTY_SIZE:
+            return json_response({'error': f'party_size must be between 1 and {MAX_PARTY_SIZE}'}), 400
+        preferences = data.get('preferences') or []
+        if not isinstance(preferences, list) or len(preferences) > party_size:
+            return json_response({'error': 'preferences must be a list with at most one berth per passenger'}), 400
+        unknown = [p for p in preferences if p not in BERTH_TYPES]
+        if unknown:
+            return json_response({'error': f'Unknown berth type: {unknown[0]}', 'berth_types': BERTH_TYPES}), 400
+        keep_together = data.get('keep_together') or 'coach'
+        if keep_together not in KEEP_TOGETHER:
+            return json_response({'error': f'keep_together must be one of: {", ".join(KEEP_TOGETHER)}'}), 400
+
+        train = repos().trains.get(ObjectId(data['train_id']))
+        if not train:
+            return json_response({'error': 'Train not found'}), 404
+        try:
+            segments = journey_segment_mask(train, data.get('from'), data.get('to'))
+        except ValueError as e:
+            return json_response({'error': str(e)}), 400
+
+        allocation, error = seat_allocator.allocate(
+            train['_id'], party_size, preferences, keep_together=keep_together,
+            coach_type=data.get('coach_type'), segments=segments, holder=data.get('user_id'),
+            require_preferences=bool(data.get('require_preferences'))
+        )
+        if error == 'no_seats':
+            return json_response({'error': 'Not enough free seats together for this party'}), 409
+        if error == 'preferences_unavailable':
+            return json_response({'error': 'The requested berths are not available together'}), 409
+        if error:
+            return json_response({'error': 'Seats were taken while allocating, please try again'}), 409
+        seats = [f'{coach}-{seat}' for coach, seat in allocation['seats']]
+        return json_response({
+            'seats': seats,
+            'passengers': [
+                {'seat': seats[k], 'type': allocation['types'][k],
+                 'preference': preferences[n] if n < len(preferences) else None}
+                for n, k in enumerate(allocation['passengers'])
+            ],
+            'preferences_met': allocation['preferences_met'],
+            'expires_at': allocation['expires_at'].isoformat()
+        }), 200
+
+    @api.route('/api/bookings/unlock', methods=['POST'])
+    def unlock_seat():
+        data = request.get_json()
+        # Only the passenger holding a seat may release it
+        required_fields = ['train_id', 'coach_number', 'seat_number', 'user_id']
+        for field in required_fields:
+            if field not in data:
+                return json_response({'error': f'Missing required field: {field}'}), 400
+        if not seat_holds.release(ObjectId(data['train_id']), data['coach_number'], data['seat_number'], data['user_id']):
+            return json_response({'error': 'Seat is not locked'}), 404
+        return json_response({'message': 'Seat unlocked'}), 200
 
     # --- Booking Cancellation ---
     @api.route('/api/bookings/<booking_id>/cancel', methods=['POST'])
     def cancel_booking(booking_id):
-        booking = db.bookings.find_one({'_id': ObjectId(booking_id)})
+        booking = repos().bookings.get(ObjectId(booking_id))
         if not booking:
-            return jsonify({'error': 'Booking not found'}), 404
-        db.bookings.update_one({'_id': ObjectId(booking_id)}, {'$set': {'status': 'cancelled'}})
-        # Release seats in coach seat_map
+            return json_response({'error': 'Booking not found'}), 404
+        # Cancel, promote waiting passengers into the freed seats and release the rest together
+        outcome = waitlist.cancel_booking(booking)
+        if outcome is None:
+            return json_response({'message': 'Booking already cancelled'}), 200
         train_id = booking['train_id']
-        for seat in booking['seats']:
-            coach_number, seat_number = seat.split('-')  # e.g., 'A1-12'
-            coach = db.coaches.find_one({'train_id': train_id, 'coach_number': coach_number})
-            if coach:
-                seat_map = coach.get('seat_map', {})
-                seat_map[seat_number] = 'available'
-                db.coaches.update_one({'_id': coach['_id']}, {'$set': {'seat_map': seat_map}})
-        return jsonify({'message': 'Booking cancelled and seats released'}), 200
+        # Quota seats go back only once, and only for seats nobody on the waitlist took over
+        for allocation in outcome['quota_released']:
+            quotas.release(train_id, allocation)
+        cache.invalidate(*{f'quotas:{train_id}:{a["coach_number"]}' for a in outcome['quota_released']})
+        cache.invalidate(f'coaches:{train_id}')
+        # Seats handed to the waitlist stay booked; only seats now free on every segment change the counts
+        availability.record(train_id, outcome['vacated'], booked=False, quota=outcome['quota_released'])
+        return json_response({
+            'message': 'Booking cancelled and seats released',
+            'promoted': [
+                {'waitlist_id': str(entry['_id']), 'booking_id': str(promoted['_id']), 'seats': promoted['seats']}
+                for entry, promoted in outcome['promoted']
+            ],
+            'released_seats': sum(len(seats) for seats in outcome['released'].values())
+        }), 200
+
+    # --- Waitlist / RAC ---
+    @api.route('/api/waitlist', methods=['POST'])
+    def join_waitlist():
+        data = request.get_json()
+        required_fields = ['user_id', 'train_id', 'date', 'coach_type']
+        for field in required_fields:
+            if field not in data:
+                return json_response({'error': f'Missing required field: {field}'}), 400
+        seats = data.get('seats', 1)
+        if not isinstance(seats, int) or not 1 <= seats <= MAX_WAITLIST_SEATS:
+            return json_response({'error': f'seats must be between 1 and {MAX_WAITLIST_SEATS}'}), 400
+
+        train = repos().trains.get(ObjectId(data['train_id']))
+        if not train:
+            return json_response({'error': 'Train not found'}), 404
+        if not repos().users.get(ObjectId(data['user_id']), view='exists'):
+            return json_response({'error': 'User not found'}), 404
+        try:
+            segments = journey_segment_mask(train, data.get('from'), data.get('to'))
+        except ValueError as e:
+            return json_response({'error': str(e)}), 400
+
+        entry = waitlist.join(
+            ObjectId(data['user_id']), train['_id'], data['date'], data['coach_type'], seats,
+            segments=segments,
+            journey={'from': data.get('from'), 'to': data.get('to')} if segments is not None else None
+        )
+        entry = waitlist.describe(entry)
+        return json_response({
+            'message': f'Added to {entry["queue"]}',
+            'waitlist_id': str(entry['_id']),
+            'queue': entry['queue'],
+            'position': entry['position']
+        }), 201
+
+    @api.route('/api/waitlist/<train_id>', methods=['GET'])
+    def get_waitlist(train_id):
+        date, coach_type = request.args.get('date'), request.args.get('coach_type')
+        if not date or not coach_type:
+            return json_response({'error': 'date and coach_type are required'}), 400
+        entries = waitlist.queue(ObjectId(train_id), date, coach_type)
+        return json_response({
+            'waitlist': [
+                {'waitlist_id': str(e['_id']), 'queue': TIER_NAMES[e['tier']],
+                 'position': n, 'seats': e['seats'], 'user_id': e['user_id']}
+                for n, e in enumerate(entries, start=1)
+            ]
+        }), 200
+
+    @api.route('/api/waitlist/entry/<entry_id>', methods=['GET'])
+    def get_waitlist_entry(entry_id):
+        if not ObjectId.is_valid(entry_id):
+            return json_response({'error': 'Invalid waitlist id'}), 400
+        entry = waitlist.get(ObjectId(entry_id))
+        if not entry:
+            return json_response({'error': 'Waitlist entry not found'}), 404
+        return json_response({'waitlist': waitlist.describe(entry)}), 200
+
+    @api.route('/api/waitlist/entry/<entry_id>', methods=['DELETE'])
+    def leave_waitlist(entry_id):
+        if not ObjectId.is_valid(entry_id):
+            return json_response({'error': 'Invalid waitlist id'}), 400
+        if not waitlist.leave(ObjectId(entry_id)):
+            return json_response({'error': 'Waitlist entry not found or no longer waiting'}), 404
+        return json_response({'message': 'Removed from waitlist'}), 200
 
     # --- Quota Management ---
     @api.route('/api/quotas/<train_id>/<coach_number>', methods=['GET'])
     def get_quota(train_id, coach_number):
-        quotas = list(db.quotas.find({'train_id': ObjectId(train_id), 'coach_number': coach_number}))
-        return jsonify({'quotas': json.loads(json.dumps(quotas, default=str))}), 200
+        summary = cache.get_or_load(
+            f'quotas:{train_id}:{coach_number}',
+            lambda: repos().quotas.summary(ObjectId(train_id), coach_number)
+        )
+        return json_response({'quotas': summary}), 200
 
     @api.route('/api/quotas/<train_id>/<coach_number>', methods=['POST'])
     def update_quota(train_id, coach_number):
@@ -228,19 +510,27 @@ def register_routes(app, db):
         required_fields = ['quota_type', 'total_seats', 'available_seats']
         for field in required_fields:
             if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-        db.quotas.update_one(
-            {'train_id': ObjectId(train_id), 'coach_number': coach_number, 'quota_type': data['quota_type']},
-            {'$set': {'total_seats': data['total_seats'], 'available_seats': data['available_seats'], 'updated_at': datetime.utcnow()}},
-            upsert=True
+                return json_response({'error': f'Missing required field: {field}'}), 400
+        # Optional 'shards' splits a hot quota (tatkal) over several counter documents
+        try:
+            shards = min(max(int(data.get('shards', 1)), 1), MAX_QUOTA_SHARDS)
+        except (TypeError, ValueError):
+            return json_response({'error': 'shards must be an integer'}), 400
+        change = quotas.set_quota(
+            ObjectId(train_id), coach_number, data['quota_type'],
+            data['total_seats'], data['available_seats'], shards=shards
         )
-        return jsonify({'message': 'Quota updated'}), 200
+        cache.invalidate(f'quotas:{train_id}:{coach_number}')
+        availability.record_quota(ObjectId(train_id), coach_number, data['quota_type'], change)
+        return json_response({'message': 'Quota updated'}), 200
 
     # --- Real-Time Coach Position ---
     @api.route('/api/coach_positions/<train_id>', methods=['GET'])
     def get_coach_positions(train_id):
-        positions = list(db.coach_positions.find({'train_id': ObjectId(train_id)}))
-        return jsonify({'positions': json.loads(json.dumps(positions, default=str))}), 200
+        positions = cache.get_or_load(
+            f'positions:{train_id}', lambda: list(db.coach_positions.find({'train_id': ObjectId(train_id)}))
+        )
+        return json_response({'positions': positions}), 200
 
     @api.route('/api/coach_positions/<train_id>/<coach_number>', methods=['POST'])
     def update_coach_position(train_id, coach_number):
@@ -248,7 +538,7 @@ def register_routes(app, db):
         required_fields = ['platform_number', 'position_on_platform', 'station', 'eta']
         for field in required_fields:
             if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
+                return json_response({'error': f'Missing required field: {field}'}), 400
         update_doc = {
             'platform_number': data['platform_number'],
             'position_on_platform': data['position_on_platform'],
@@ -261,7 +551,53 @@ def register_routes(app, db):
             {'$set': update_doc},
             upsert=True
         )
-        return jsonify({'message': 'Coach position updated'}), 200
+        cache.invalidate(f'positions:{train_id}')
+        return json_response({'message': 'Coach position updated'}), 200
+
+    # Many coach positions and tracking updates per request: a JSON list (or {'records': [...]})
+    # of at most MAX_BATCH_RECORDS, or an NDJSON stream of any length, one record per line
+    @api.route('/api/telemetry', methods=['POST'])
+    def ingest_telemetry():
+        accepted, errors = 0, []
+        if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+            # Errors refer to line numbers (from 0); blank lines are skipped
+            batch, lines = [], []
+
+            def submit_batch():
+                taken, failed = telemetry.submit(batch)
+                return taken, [{'index': lines[e['index']], 'error': e['error']} for e in failed]
+
+            for line_number, line in enumerate(request.stream):
+                if not line.strip():
+                    continue
+                try:
+                    batch.append(loads(line))
+                    lines.append(line_number)
+                except ValueError:
+                    errors.append({'index': line_number, 'error': 'Invalid JSON'})
+                    continue
+                if len(batch) == MAX_BATCH_RECORDS:
+                    taken, failed = submit_batch()
+                    accepted, errors, batch, lines = accepted + taken, errors + failed, [], []
+            taken, failed = submit_batch()
+            accepted, errors = accepted + taken, errors + failed
+        else:
+            data = request.get_json(silent=True)
+            records = data.get('records') if isinstance(data, dict) else data
+            if not isinstance(records, list):
+                return json_response({'error': 'Expected a list of records'}), 400
+            if len(records) > MAX_BATCH_RECORDS:
+                return json_response({'error': f'At most {MAX_BATCH_RECORDS} records per request; stream larger batches as NDJSON'}), 400
+            accepted, errors = telemetry.submit(records)
+        return json_response({
+            'accepted': accepted,
+            'rejected': len(errors),
+            'errors': errors[:100]
+        }), 202
+
+    @api.route('/api/telemetry/stats', methods=['GET'])
+    def get_telemetry_stats():
+        return json_response({'telemetry': telemetry.snapshot()}), 200
 
     # --- Route Deviation Alerts ---
     @api.route('/api/alerts/route_deviation', methods=['POST'])
@@ -270,13 +606,13 @@ def register_routes(app, db):
         required_fields = ['train_id', 'message']
         for field in required_fields:
             if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
+                return json_response({'error': f'Missing required field: {field}'}), 400
 
         # Fetch train info to get affected bookings
         train_id = ObjectId(data['train_id'])
-        train = db.trains.find_one({'_id': train_id})
+        train = repos().trains.get(train_id)
         if not train:
-            return jsonify({'error': 'Train not found'}), 404
+            return json_response({'error': 'Train not found'}), 404
 
         # Create the alert
         new_alert = {
@@ -286,30 +622,25 @@ def register_routes(app, db):
             'created_at': datetime.utcnow()
         }
         alert_id = db.alerts.insert_one(new_alert).inserted_id
+        alert_feed.publish(new_alert)
 
-        # Find all bookings for this train and notify passengers
-        affected_bookings = db.bookings.find({'train_id': train_id, 'status': 'confirmed'})
-        for booking in affected_bookings:
-            user = db.users.find_one({'_id': booking['user_id']})
-            if user and user.get('phone'):
-                # Use Twilio to send SMS alert
-                try:
-                    account_sid = current_app.config['TWILIO_ACCOUNT_SID']
-                    auth_token = current_app.config['TWILIO_AUTH_TOKEN']
-                    client = Client(account_sid, auth_token)
-                    
-                    message = client.messages.create(
-                        body=f"Alert for {train.get('name', '')}: {data['message']}",
-                        from_='+12345678901',  # Your Twilio phone number
-                        to=user['phone']
-                    )
-                except Exception as e:
-                    print(f"Error sending SMS to {user['phone']}: {str(e)}")
-
-        return jsonify({
-            'message': 'Route deviation alert created and notifications sent',
-            'alert_id': str(alert_id)
-        }), 201
+        # Passengers are notified in the background; the job record tracks progress
+        job_id = notifications.submit_route_deviation(train, alert_id, data['message'])
+
+        return json_response({
+            'message': 'Route deviation alert created and notifications queued',
+            'alert_id': str(alert_id),
+            'job_id': str(job_id)
+        }), 202
+
+    @api.route('/api/notifications/jobs/<job_id>', methods=['GET'])
+    def get_notification_job(job_id):
+        if not is_valid_object_id(job_id):
+            return json_response({'error': 'Invalid job id'}), 400
+        job = notifications.get_job(ObjectId(job_id))
+        if not job:
+            return json_response({'error': 'Job not found'}), 404
+        return json_response({'job': job}), 200
 
     
     # User routes
@@ -321,11 +652,11 @@ def register_routes(app, db):
         required_fields = ['name', 'email', 'password']
         for field in required_fields:
             if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
+                return json_response({'error': f'Missing required field: {field}'}), 400
         
         # Check if user already exists
-        if db.users.find_one({'email': data['email']}):
-            return jsonify({'error': 'User with this email already exists'}), 409
+        if repos().users.find_by_email(data['email'], view='exists'):
+            return json_response({'error': 'User with this email already exists'}), 409
         
         # Create new user
         new_user = {
@@ -336,11 +667,11 @@ def register_routes(app, db):
             'created_at': datetime.utcnow()
         }
         
-        result = db.users.insert_one(new_user)
+        user_id = repos().users.insert(new_user)
         
-        return jsonify({
+        return json_response({
             'message': 'User registered successfully',
-            'user_id': str(result.inserted_id)
+            'user_id': str(user_id)
         }), 201
     
     @api.route('/api/users/login', methods=['POST'])
@@ -349,39 +680,129 @@ def register_routes(app, db):
         
         # Validate required fields
         if 'email' not in data or 'password' not in data:
-            return jsonify({'error': 'Email and password are required'}), 400
+            return json_response({'error': 'Email and password are required'}), 400
         
         # Find user
-        user = db.users.find_one({'email': data['email']})
+        user = repos().users.find_by_email(data['email'])
         
         if not user or user['password'] != data['password']:  # In production, verify hashed password
-            return jsonify({'error': 'Invalid credentials'}), 401
+            return json_response({'error': 'Invalid credentials'}), 401
         
         # In production, generate and return JWT token
-        return jsonify({
+        return json_response({
             'message': 'Login successful',
             'user_id': str(user['_id']),
             'name': user['name'],
             'role': user['role']
         }), 200
+
+    # The booking page resolves a passenger's email to their user id
+    @api.route('/api/users/by_email')
+    def get_user_by_email():
+        email = request.args.get('email')
+        if not email:
+            return json_response({'error': 'Email required'}), 400
+        user = repos().users.find_by_email(email, view='exists')
+        if not user:
+            return json_response({'error': 'User not found'}), 404
+        return json_response({'user_id': str(user['_id'])}), 200
     
     # Train routes
     @api.route('/api/trains', methods=['GET'])
     def get_trains():
-        trains = list(db.trains.find())
-        return jsonify({
-            'trains': json.loads(json.dumps(trains, default=str))
+        # ?fields=name,source,... loads only those fields; each field set is cached separately
+        trains = repos().trains.all(parse_fields(request.args.get('fields')))
+        return json_response({
+            'trains': trains
         }), 200
     
+    @api.route('/api/trains/search', methods=['GET', 'POST'])
+    def search_trains():
+        data = request.get_json(silent=True) or request.args
+        source = (data.get('from') or data.get('source') or '').strip()
+        destination = (data.get('to') or data.get('destination') or '').strip()
+        if not source or not destination:
+            return json_response({'error': 'Source and destination are required'}), 400
+
+        try:
+            page = max(int(data.get('page', 1)), 1)
+            limit = min(max(int(data.get('limit', SEARCH_DEFAULT_LIMIT)), 1), SEARCH_MAX_LIMIT)
+            passengers = max(int(data.get('passengers') or 1), 1)
+        except (TypeError, ValueError):
+            return json_response({'error': 'page, limit and passengers must be integers'}), 400
+
+        weekday = None
+        if data.get('date'):
+            try:
+                weekday = datetime.strptime(data['date'], '%Y-%m-%d').strftime('%a')
+            except ValueError:
+                return json_response({'error': 'Date must be in YYYY-MM-DD format'}), 400
+
+        # Fetch one extra document to know whether another page exists
+        trains = repos().trains.search(
+            source, destination, passengers=passengers, weekday=weekday, skip=(page - 1) * limit, limit=limit + 1
+        )
+
+        # Per-seat fares for the whole page from the fare table, unless a train sets its own price
+        quotes = fares.price_journeys([(train['_id'], None, None, 1) for train in trains[:limit]])
+        # Seat counts per class for the whole page in one indexed read
+        summaries = availability.get(train['_id'] for train in trains[:limit])
+        coach_type = data.get('class')
+        results = []
+        for train, quote in zip(trains[:limit], quotes):
+            price = train.get('price')
+            if price is None and quote:
+                price = quote['fare_per_seat']
+            classes = [
+                {'class': c.get('coach_type'), 'available': c['available'], 'quotas': c.get('quotas', {})}
+                for c in summaries.get(train['_id'], []) if not coach_type or c.get('coach_type') == coach_type
+            ]
+            available_seats = sum(c['available'] for c in classes) if train['_id'] in summaries \
+                else train.get('available_seats', 0)
+            results.append({
+                'id': str(train['_id']),
+                'name': train.get('name'),
+                'from': train.get('source'),
+                'to': train.get('destination'),
+                'departure': train.get('departure_time'),
+                'arrival': train.get('arrival_time'),
+                'duration': train.get('duration', '-'),
+                'price': price if price is not None else 0,
+                'available_seats': available_seats,
+                'classes': classes
+            })
+
+        return json_response({
+            'trains': results,
+            'page': page,
+            'limit': limit,
+            'has_more': len(trains) > limit
+        }), 200
+
+    # One train by name, for pages that know only the train number
+    @api.route('/api/trains/lookup', methods=['GET'])
+    def lookup_train():
+        name = (request.args.get('name') or '').strip()
+        if not name:
+            return json_response({'error': 'Name required'}), 400
+        train = repos().trains.find_by_name(name, view='tracking')
+        if not train:
+            return json_response({'error': 'Train not found'}), 404
+        return json_response({'train': train}), 200
+
     @api.route('/api/trains/<train_id>', methods=['GET'])
     def get_train(train_id):
-        train = db.trains.find_one({'_id': ObjectId(train_id)})
+        train = repos().trains.get(ObjectId(train_id))
         
         if not train:
-            return jsonify({'error': 'Train not found'}), 404
+            return json_response({'error': 'Train not found'}), 404
+        fields = parse_fields(request.args.get('fields'))
+        if fields is None or 'available_seats' in fields:
+            # The cached train has no seat count; add the current one
+            train = dict(train, **(repos().trains.get(ObjectId(train_id), view='seats') or {}))
         
-        return jsonify({
-            'train': json.loads(json.dumps(train, default=str))
+        return json_response({
+            'train': project(train, fields)
         }), 200
     
     # Booking routes
@@ -393,17 +814,48 @@ def register_routes(app, db):
         required_fields = ['user_id', 'train_id', 'seats', 'date']
         for field in required_fields:
             if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
+                return json_response({'error': f'Missing required field: {field}'}), 400
         
         # Check if train exists
-        train = db.trains.find_one({'_id': ObjectId(data['train_id'])})
+        train = repos().trains.get(ObjectId(data['train_id']))
         if not train:
-            return jsonify({'error': 'Train not found'}), 404
+            return json_response({'error': 'Train not found'}), 404
         
         # Check if user exists
-        user = db.users.find_one({'_id': ObjectId(data['user_id'])})
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+        if not repos().users.get(ObjectId(data['user_id']), view='exists'):
+            return json_response({'error': 'User not found'}), 404
+        
+        # Optional partial journey: only the segments between 'from' and 'to' are sold
+        try:
+            segments = journey_segment_mask(train, data.get('from'), data.get('to'))
+        except ValueError as e:
+            return json_response({'error': str(e)}), 400
+
+        # Book the listed seats ('<coach>-<seat>'), converting the passenger's own holds
+        if data['seats'] == []:
+            return json_response({'error': 'At least one seat is required'}), 400
+        seats = parse_booking_seats(data['seats'])
+        if seats is None:
+            return json_response({'error': 'Seats must be strings like "A1-12"'}), 400
+
+        # Take quota first: during a tatkal rush most requests stop here on one counter update
+        allocations, error = quotas.allocate_booking(train['_id'], seats, data.get('quota') or 'general')
+        if error:
+            return json_response({'error': 'No seats left in this quota', 'quota': data.get('quota') or 'general'}), 409
+        cache.invalidate(*{f'quotas:{train["_id"]}:{a["coach_number"]}' for a in allocations})
+
+        claimed = []
+        conflicts = seat_holds.confirm(
+            ObjectId(data['train_id']), seats, holder=data['user_id'], segments=segments, claimed=claimed
+        )
+        cache.invalidate(f'coaches:{train["_id"]}')
+        if conflicts:
+            for allocation in allocations:
+                quotas.release(train['_id'], allocation)
+            return json_response({
+                'error': 'Some seats are no longer available',
+                'seats': [f'{coach}-{seat}' for coach, seat in conflicts]
+            }), 409
         
         # Create new booking
         new_booking = {
@@ -415,74 +867,193 @@ def register_routes(app, db):
             'status': 'confirmed',  # Default status
             'created_at': datetime.utcnow()
         }
+        if segments is not None:
+            new_booking.update({'from': data.get('from'), 'to': data.get('to'), 'segments': segments})
+        if allocations:
+            new_booking['quota'] = allocations
+        fares.price_bookings([new_booking])
         
-        result = db.bookings.insert_one(new_booking)
+        booking_id = repos().bookings.insert(new_booking)
+        availability.record(train['_id'], claimed, quota=allocations)
         
-        return jsonify({
+        return json_response({
             'message': 'Booking created successfully',
-            'booking_id': str(result.inserted_id)
+            'booking_id': str(booking_id),
+            'price': new_booking.get('price')
         }), 201
     
+    @api.route('/api/bookings/bulk', methods=['POST'])
+    def create_bulk_booking():
+        data = request.get_json()
+        items = data.get('bookings') if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            return json_response({'error': 'Missing required field: bookings'}), 400
+        if len(items) > MAX_BULK_BOOKINGS:
+            return json_response({'error': f'At most {MAX_BULK_BOOKINGS} bookings per request'}), 400
+
+        results = create_bulk_bookings(
+            db, seat_holds, items, all_or_nothing=bool(data.get('all_or_nothing')), fares=fares, quotas=quotas
+        )
+        cache.invalidate(*{f'coaches:{item["train_id"]}' for item in items if isinstance(item, dict) and 'train_id' in item})
+        created = sum(1 for r in results if r['status'] == 'created')
+
+        # One summary update per train, for the seats each booking took from being free
+        booked_by_train, quota_by_train = {}, {}
+        for r in results:
+            if r['status'] == 'created':
+                train_id = ObjectId(items[r['index']]['train_id'])
+                cache.invalidate(*{f'quotas:{train_id}:{a["coach_number"]}' for a in r.get('quota', [])})
+                booked_by_train.setdefault(train_id, []).extend(r.pop('claimed'))
+                quota_by_train.setdefault(train_id, []).extend(r.get('quota', []))
+        for train_id, seats in booked_by_train.items():
+            availability.record(train_id, seats, quota=quota_by_train[train_id])
+        return json_response({
+            'message': f'{created} of {len(results)} bookings created',
+            'created': created,
+            'failed': len(results) - created,
+            'results': results
+        }), 201 if created == len(results) else 207
+    
     @api.route('/api/bookings/<user_id>', methods=['GET'])
     def get_user_bookings(user_id):
-        bookings = list(db.bookings.find({'user_id': ObjectId(user_id)}))
-        
-        return jsonify({
-            'bookings': json.loads(json.dumps(bookings, default=str))
-        }), 200
+        if not is_valid_object_id(user_id):
+            return json_response({'error': 'Invalid user id'}), 400
+        query = {'user_id': ObjectId(user_id)}
+
+        # Summary mode: booking counts per status, counted on the index
+        if request.args.get('summary') in ('1', 'true'):
+            counts = repos().bookings.status_counts(query['user_id'])
+            return json_response({'summary': counts, 'total': sum(counts.values())}), 200
+
+        try:
+            limit = min(max(int(request.args.get('limit', USER_BOOKINGS_PAGE_SIZE)), 1), USER_BOOKINGS_MAX_PAGE_SIZE)
+        except ValueError:
+            return json_response({'error': 'limit must be an integer'}), 400
+        if request.args.get('status'):
+            query['status'] = request.args['status']
+        # Journey date range (dates are stored as YYYY-MM-DD strings, so they compare in order)
+        date_range = {}
+        for param, operator in (('date_from', '$gte'), ('date_to', '$lte')):
+            if request.args.get(param):
+                try:
+                    datetime.strptime(request.args[param], '%Y-%m-%d')
+                except ValueError:
+                    return json_response({'error': f'{param} must be in YYYY-MM-DD format'}), 400
+                date_range[operator] = request.args[param]
+        if date_range:
+            query['date'] = date_range
+
+        # Keyset pagination, newest first: the next page starts after (created_at, _id)
+        # of the last row, so a page costs the same however long the history is
+        if request.args.get('after'):
+            position = decode_keyset_cursor(request.args['after'])
+            if position is None:
+                return json_response({'error': 'Invalid cursor'}), 400
+            created_at, last_id = position
+            query['$or'] = [
+                {'created_at': {'$lt': created_at}},
+                {'created_at': created_at, '_id': {'$lt': last_id}}
+            ]
+
+        projection = parse_fields(request.args.get('fields'), USER_BOOKING_FIELDS) or BOOKING_VIEWS['history']
+        bookings = repos().bookings.history(query, projection, limit + 1)
+        page = bookings[:limit]
+        next_cursor = encode_keyset_cursor(page[-1]) if len(bookings) > limit else None
+        return json_response({'bookings': page, 'next_cursor': next_cursor}), 200
     
     # Train tracking routes
     @api.route('/api/tracking/<train_id>', methods=['GET'])
     def get_train_location(train_id):
-        # In a real application, this would fetch real-time GPS data
-        tracking_info = db.tracking.find_one({'train_id': ObjectId(train_id)})
-        
-        if not tracking_info:
-            # Generate mock data for demo
-            train = db.trains.find_one({'_id': ObjectId(train_id)})
-            if not train:
-                return jsonify({'error': 'Train not found'}), 404
-                
-            import random
-            tracking_info = {
-                'train_id': ObjectId(train_id),
-                'status': 'Running',
-                'current_station': train.get('source'),
-                'next_station': train.get('destination'),
-                'progress': random.randint(10, 90),  # Random progress between 10-90%
-                'speed': random.randint(60, 120),  # Random speed in km/h
-                'delay': random.randint(0, 30),  # Random delay 0-30 minutes
-                'distance': train.get('distance', 1000),  # Default 1000km if not set
-                'duration': train.get('duration', '16h 30m'),
-                'updated_at': datetime.utcnow()
-            }
-            # Save mock data
-            db.tracking.insert_one(tracking_info)
-        
-        # Add route points for map
-        if train := db.trains.find_one({'_id': ObjectId(train_id)}):
-            tracking_info['source'] = train.get('source')
-            tracking_info['destination'] = train.get('destination')
-            
-        return jsonify({
-            'tracking': json.loads(json.dumps(tracking_info, default=str))
-        }), 200
+        body, status, headers = run(handlers.train_location(repos(), train_id), db, cache)
+        return json_response(body), status, headers
+
+    # Server-Sent Events: pushes tracking changes instead of clients polling.
+    # Each subscriber keeps a worker busy for as long as it is connected, so in
+    # production this route is served by backend.asgi (see README).
+    @api.route('/api/tracking/<train_id>/stream', methods=['GET'])
+    def stream_train_location(train_id):
+        if not is_valid_object_id(train_id):
+            return json_response({'error': 'Invalid train id'}), 400
+        train_oid = ObjectId(train_id)
+        subscriber, snapshot = tracking_hub.subscribe(train_oid)
+
+        def generate():
+            try:
+                if snapshot:
+                    yield format_sse('snapshot', snapshot)
+                while True:
+                    try:
+                        delta = subscriber.get(timeout=SSE_HEARTBEAT_SECONDS)
+                    except queue.Empty:
+                        yield ': keep-alive\n\n'
+                        continue
+                    yield format_sse('delta', delta)
+            finally:
+                tracking_hub.unsubscribe(train_oid, subscriber)
+
+        return Response(
+            stream_with_context(generate()), mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
     
     # Alert routes
+    # ?since=<cursor> returns only alerts newer than the cursor from the previous response
     @api.route('/api/alerts', methods=['GET'])
     def get_alerts():
-        alerts = list(db.alerts.find().sort('created_at', -1).limit(10))
+        alerts, cursor = alert_feed.recent(
+            since=parse_alert_cursor(request.args.get('since')),
+            limit=request.args.get('limit', 10, type=int)
+        )
         
-        return jsonify({
-            'alerts': json.loads(json.dumps(alerts, default=str))
+        return json_response({
+            'alerts': alerts,
+            'cursor': cursor
         }), 200
     
+    # Server-Sent Events: every new alert (or only one train's with ?train_id=) as it is created
+    @api.route('/api/alerts/stream', methods=['GET'])
+    def stream_alerts():
+        train_id = request.args.get('train_id')
+        if train_id is not None and not is_valid_object_id(train_id):
+            return json_response({'error': 'Invalid train id'}), 400
+        train_oid = ObjectId(train_id) if train_id else None
+        since = parse_alert_cursor(request.args.get('since') or request.headers.get('Last-Event-ID'))
+        subscriber = alert_feed.subscribe(train_oid)
+        backlog = alert_feed.recent(train_id=train_oid, since=since)[0] if since else []
+
+        def generate():
+            try:
+                sent = set()
+                for alert in reversed(backlog):
+                    sent.add(alert['_id'])
+                    yield format_sse('alert', alert, event_id=alert['_id'])
+                while True:
+                    try:
+                        alert = subscriber.get(timeout=SSE_HEARTBEAT_SECONDS)
+                    except queue.Empty:
+                        yield ': keep-alive\n\n'
+                        continue
+                    if alert['_id'] not in sent:
+                        yield format_sse('alert', alert, event_id=alert['_id'])
+            finally:
+                alert_feed.unsubscribe(subscriber, train_oid)
+
+        return Response(
+            stream_with_context(generate()), mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+
     @api.route('/api/alerts/<train_id>', methods=['GET'])
     def get_train_alerts(train_id):
-        alerts = list(db.alerts.find({'train_id': ObjectId(train_id)}).sort('created_at', -1))
+        alerts, cursor = alert_feed.recent(
+            train_id=ObjectId(train_id),
+            since=parse_alert_cursor(request.args.get('since')),
+            limit=request.args.get('limit', type=int)
+        )
         
-        return jsonify({
-            'alerts': json.loads(json.dumps(alerts, default=str))
+        return json_response({
+            'alerts': alerts,
+            'cursor': cursor
         }), 200
     
     # Admin routes
@@ -494,7 +1065,7 @@ def register_routes(app, db):
         required_fields = ['name', 'source', 'destination', 'departure_time', 'arrival_time', 'total_seats']
         for field in required_fields:
             if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
+                return json_response({'error': f'Missing required field: {field}'}), 400
         
         # Create new train
         new_train = {
@@ -508,14 +1079,63 @@ def register_routes(app, db):
             'status': 'scheduled',  # Default status
             'created_at': datetime.utcnow()
         }
+        # Optional fields used by the train search and the fare engine
+        for field in ['run_days', 'distance', 'duration', 'stops', 'stop_km']:
+            if field in data:
+                new_train[field] = data[field]
+        if 'stops' in new_train and not 2 <= len(new_train['stops']) <= MAX_SEGMENTS + 1:
+            return json_response({'error': f'A route must have between 2 and {MAX_SEGMENTS + 1} stops'}), 400
+        # stop_km: km from the source to each stop, so fares can be computed between any two stops
+        if 'stop_km' in new_train:
+            stop_km = new_train['stop_km']
+            if not isinstance(stop_km, list) or len(stop_km) != len(route_stops(new_train)) \
+                    or not all(isinstance(km, (int, float)) for km in stop_km) \
+                    or any(b < a for a, b in zip(stop_km, stop_km[1:])):
+                return json_response({'error': 'stop_km must list increasing distances, one per stop'}), 400
         
-        result = db.trains.insert_one(new_train)
+        # The timetable version tells the other workers' fare tables to load this train
+        new_train['timetable_version'] = fares.next_version()
+        train_id = repos().trains.insert(new_train)
+        fares.add_trains([new_train])
         
-        return jsonify({
+        return json_response({
             'message': 'Train added successfully',
-            'train_id': str(result.inserted_id)
+            'train_id': str(train_id)
         }), 201
     
+    # Create a train's coaches from a consist, each with an empty inventory built
+    # from the seat layout tables, in one insert_many
+    @api.route('/api/admin/trains/<train_id>/coaches', methods=['POST'])
+    def provision_coaches(train_id):
+        if not is_valid_object_id(train_id):
+            return json_response({'error': 'Invalid train id'}), 400
+        train = repos().trains.get(ObjectId(train_id))
+        if not train:
+            return json_response({'error': 'Train not found'}), 404
+        data = request.get_json(silent=True) or {}
+        try:
+            consist = parse_consist(data.get('consist'))
+        except ValueError as e:
+            return json_response({'error': str(e)}), 400
+        # Trains with intermediate stops sell partial journeys, so their seats track segments
+        segment_aware = bool(data.get('segment_aware', len(route_stops(train)) > 2))
+
+        coaches = create_coaches(db, train['_id'], consist, segment_aware)
+        if not coaches:
+            return json_response({'error': 'The train already has coaches'}), 409
+        cache.invalidate(f'coaches:{train_id}')
+        availability.record_coaches(train['_id'], [(None, coach) for coach in coaches], new_train=True)
+        return json_response({'message': 'Coaches created', 'coaches_created': len(coaches)}), 201
+
+    @api.route('/api/admin/availability/reconcile', methods=['POST'])
+    def reconcile_availability():
+        data = request.get_json(silent=True) or {}
+        train_id = data.get('train_id')
+        if train_id is not None and not is_valid_object_id(train_id):
+            return json_response({'error': 'Invalid train id'}), 400
+        rebuilt = availability.rebuild([ObjectId(train_id)] if train_id else None)
+        return json_response({'message': 'Availability rebuilt', 'summaries': rebuilt}), 200
+
     @api.route('/api/admin/alerts', methods=['POST'])
     def create_alert():
         data = request.get_json()
@@ -524,7 +1144,7 @@ def register_routes(app, db):
         required_fields = ['message', 'type']
         for field in required_fields:
             if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
+                return json_response({'error': f'Missing required field: {field}'}), 400
         
         # Create new alert
         new_alert = {
@@ -535,21 +1155,31 @@ def register_routes(app, db):
         }
         
         result = db.alerts.insert_one(new_alert)
+        alert_feed.publish(new_alert)
         
-        return jsonify({
+        return json_response({
             'message': 'Alert created successfully',
             'alert_id': str(result.inserted_id)
         }), 201
     
+    @api.route('/api/cache/stats', methods=['GET'])
+    def get_cache_stats():
+        return json_response(cache.stats()), 200
+    
     # Maps API Configuration
     @api.route('/api/config/maps', methods=['GET'])
     def get_maps_config():
         from flask import current_app
-        return jsonify({
+        return json_response({
             'apiKey': current_app.config.get('GOOGLE_MAPS_API_KEY')
         }), 200
 
     # Register blueprint with app
     app.register_blueprint(api)
+
+    # Services the ASGI app (backend/asgi.py) shares with these routes
+    app.extensions['railway'] = {
+        'cache': cache, 'messaging': messaging, 'tracking_hub': tracking_hub, 'alert_feed': alert_feed
+    }
     
     return api
\ No newline at end of file
@@ -1,11 +1,13 @@
 
 from flask import Flask, jsonify, request, render_template
 from flask_cors import CORS
-from pymongo import MongoClient
 import os
 from dotenv import load_dotenv
 from bson import ObjectId
 import json
+from backend.config import get_config
+from backend.utils.database import create_mongo_client
+from backend.utils.db_metrics import DbMetrics
 
 # Load environment variables
 load_dotenv()
@@ -22,6 +24,7 @@ class JSONEncoder(json.JSONEncoder):
 app = Flask(__name__, 
             static_folder='../frontend/static',
             template_folder='../frontend/templates')
+app.config.from_object(get_config())
 
 # Enable CORS
 CORS(app)
@@ -29,10 +32,13 @@ CORS(app)
 
 # Configure MongoDB connection
 # ...existing code...
+# Pool size, timeouts, read preference and write concern come from app.config
+db_metrics = DbMetrics(slow_ms=app.config['SLOW_COMMAND_MS']) if app.config['DB_METRICS_ENABLED'] else None
 try:
-    mongo_uri = os.getenv('MONGO_URI', 'mongodb://localhost:27017/railway_reservation')
-    client = MongoClient(mongo_uri)
+    client = create_mongo_client(app.config, event_listeners=[db_metrics] if db_metrics else None)
     db = client.railway_reservation
+    if db_metrics:
+        db_metrics.init_app(app, headers=app.config['DB_METRICS_HEADERS'])
     print("Connected to MongoDB successfully!")
 except Exception as e:
     print(f"Error connecting to MongoDB: {e}")
@@ -40,9 +46,14 @@ except Exception as e:
 
 # ...existing code...
 from backend.api.routes import register_routes
+from backend.models.indexes import ensure_indexes
 
-# Register API routes only if db is available
+# Create indexes and register API routes only if db is available
 if db is not None:
+    try:
+        ensure_indexes(db)
+    except Exception as e:
+        print(f"Error creating MongoDB indexes: {e}")
     register_routes(app, db)
 else:
     print("API routes not registered due to DB connection failure.")
@@ -0,0 +1,124 @@
+"""
+Async serving mode.
+
+Runs the app under an ASGI server instead of gunicorn sync workers:
+
+    hypercorn backend.asgi:app --bind 0.0.0.0:5000 --workers 2
+    uvicorn backend.asgi:app --port 5000
+
+Tracking and OTP routes are served natively by a Quart app on Motor, so a
+request waiting on MongoDB or Twilio holds a coroutine, not a worker. They run
+the same handlers as the Flask routes (backend/api/handlers.py). Every other
+route is passed to the Flask app, which runs on a thread pool.
+"""
+import asyncio
+from asgiref.wsgi import WsgiToAsgi
+from bson import ObjectId
+from quart import Quart, Response, request
+from werkzeug.exceptions import HTTPException
+from backend.api import handlers
+from backend.api.routes import SSE_HEARTBEAT_SECONDS
+from backend.app import app as flask_app
+from backend.models.repositories import Repositories
+from backend.services.tracking_stream import LoopSubscriber
+from backend.utils.data_access import run_async
+from backend.utils.database import create_motor_client
+from backend.utils.helpers import format_sse, is_valid_object_id
+from backend.utils.serialization import JSON_MIMETYPE, dumps
+
+async_app = Quart(__name__, static_folder=None)
+# Set by register_routes; missing if the Flask app could not reach MongoDB
+services = flask_app.extensions.get('railway')
+
+
+# Motor binds to the event loop, so the client is created once the server has started
+@async_app.before_serving
+async def connect_motor():
+    async_app.motor = create_motor_client(flask_app.config)
+    async_app.db = async_app.motor.railway_reservation
+
+
+@async_app.after_serving
+async def close_motor():
+    async_app.motor.close()
+
+
+async def respond(handler, cache=None):
+    body, status, headers = await run_async(handler, async_app.db, cache)
+    return Response(dumps(body), status=status, headers=headers, mimetype=JSON_MIMETYPE)
+
+
+if services is not None:
+    messaging = services['messaging']
+
+    @async_app.route('/api/tracking/<train_id>', methods=['GET'])
+    async def get_train_location(train_id):
+        cache = services['cache']
+        return await respond(handlers.train_location(Repositories(async_app.db, cache), train_id), cache)
+
+    @async_app.route('/api/tracking/<train_id>/stream', methods=['GET'])
+    async def stream_train_location(train_id):
+        if not is_valid_object_id(train_id):
+            return Response(dumps({'error': 'Invalid train id'}), status=400, mimetype=JSON_MIMETYPE)
+        train_oid = ObjectId(train_id)
+        tracking_hub = services['tracking_hub']
+        subscriber, snapshot = tracking_hub.subscribe(train_oid, LoopSubscriber())
+
+        async def generate():
+            try:
+                if snapshot:
+                    yield format_sse('snapshot', snapshot).encode('utf-8')
+                while True:
+                    try:
+                        delta = await subscriber.get(timeout=SSE_HEARTBEAT_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield b': keep-alive\n\n'
+                        continue
+                    yield format_sse('delta', delta).encode('utf-8')
+            finally:
+                tracking_hub.unsubscribe(train_oid, subscriber)
+
+        response = Response(
+            generate(), mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+        response.timeout = None
+        return response
+
+    @async_app.route('/api/passenger/send_otp', methods=['POST'])
+    async def send_passenger_otp():
+        return await respond(handlers.send_otp(messaging, await request.get_json()))
+
+    @async_app.route('/api/passenger/otp/<tracking_id>', methods=['GET'])
+    async def get_otp_status(tracking_id):
+        return await respond(handlers.otp_status(messaging, tracking_id))
+
+    @async_app.route('/api/passenger/verify_otp', methods=['POST'])
+    async def verify_passenger_otp():
+        return await respond(handlers.verify_otp(messaging, await request.get_json()))
+
+
+class RouteDispatcher:
+    """ASGI app that sends requests matching a route of the async app there and
+    everything else (and lifespan events too) where they belong."""
+
+    def __init__(self, async_app, wsgi_app):
+        self.async_app = async_app
+        self.wsgi_app = WsgiToAsgi(wsgi_app)
+        self.adapter = async_app.url_map.bind('localhost')
+
+    def _is_async(self, scope):
+        try:
+            self.adapter.match(scope['path'], method=scope['method'])
+            return True
+        except HTTPException:
+            return False
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or self._is_async(scope):
+            await self.async_app(scope, receive, send)
+        else:
+            await self.wsgi_app(scope, receive, send)
+
+
+app = RouteDispatcher(async_app, flask_app)
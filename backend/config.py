@@ -14,6 +14,23 @@ class Config:
     # MongoDB settings
     MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/railway_reservation')
     
+    # MongoDB connection pool, timeouts and consistency (passed to MongoClient)
+    MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 100))
+    MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 0))
+    MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', 60000))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 5000))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+    MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', 20000))
+    MONGO_READ_PREFERENCE = os.getenv('MONGO_READ_PREFERENCE', 'primary')
+    MONGO_WRITE_CONCERN = os.getenv('MONGO_WRITE_CONCERN', 'majority')
+    MONGO_WRITE_TIMEOUT_MS = int(os.getenv('MONGO_WRITE_TIMEOUT_MS', 5000))
+    
+    # Per-request DB instrumentation (X-DB-* response headers and /metrics)
+    DB_METRICS_ENABLED = os.getenv('DB_METRICS_ENABLED', 'true').lower() == 'true'
+    DB_METRICS_HEADERS = os.getenv('DB_METRICS_HEADERS', 'true').lower() == 'true'
+    SLOW_COMMAND_MS = int(os.getenv('SLOW_COMMAND_MS', 100))
+    
     # JWT settings
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'jwt-secret-key-change-in-production')
     JWT_ACCESS_TOKEN_EXPIRES = 3600  # 1 hour
@@ -22,6 +39,57 @@ class Config:
     TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
     TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
     TWILIO_VERIFY_SID = os.getenv('TWILIO_VERIFY_SID')
+    TWILIO_FROM_NUMBER = os.getenv('TWILIO_FROM_NUMBER', '+12345678901')
+    
+    # Messaging ('twilio' or 'stub' for offline load tests; the stub accepts STUB_OTP_CODE,
+    # and OTP login stays disabled on the stub while it is unset)
+    SMS_BACKEND = os.getenv('SMS_BACKEND', 'twilio')
+    STUB_OTP_CODE = os.getenv('STUB_OTP_CODE')
+    # Simulated Twilio round trip of the stub backend, for load tests
+    STUB_LATENCY_SECONDS = float(os.getenv('STUB_LATENCY_SECONDS', 0))
+    TWILIO_POOL_SIZE = int(os.getenv('TWILIO_POOL_SIZE', 16))
+    OTP_WORKERS = int(os.getenv('OTP_WORKERS', 8))
+    OTP_THROTTLE_SECONDS = int(os.getenv('OTP_THROTTLE_SECONDS', 30))
+    NOTIFICATION_WORKERS = int(os.getenv('NOTIFICATION_WORKERS', 8))
+    NOTIFICATION_RATE_PER_SECOND = float(os.getenv('NOTIFICATION_RATE_PER_SECOND', 20))
+    # Seconds without progress before a running notification job is resumed elsewhere
+    NOTIFICATION_STALE_SECONDS = int(os.getenv('NOTIFICATION_STALE_SECONDS', 300))
+    # Seconds between checks for notification jobs to resume (0 disables)
+    NOTIFICATION_SWEEP_SECONDS = int(os.getenv('NOTIFICATION_SWEEP_SECONDS', 60))
+    
+    # Live tracking stream (change streams need a replica set; otherwise polled)
+    TRACKING_CHANGE_STREAMS = os.getenv('TRACKING_CHANGE_STREAMS', 'true').lower() == 'true'
+    TRACKING_POLL_INTERVAL = float(os.getenv('TRACKING_POLL_INTERVAL', 2))
+    
+    # Batched telemetry ingest: coalescing window, and optional history of every report
+    TELEMETRY_COALESCE_SECONDS = float(os.getenv('TELEMETRY_COALESCE_SECONDS', 1))
+    TELEMETRY_HISTORY = os.getenv('TELEMETRY_HISTORY', 'false').lower() == 'true'
+    TELEMETRY_HISTORY_SECONDS = int(os.getenv('TELEMETRY_HISTORY_SECONDS', 7 * 24 * 3600))
+    TELEMETRY_HISTORY_CAPPED_BYTES = int(os.getenv('TELEMETRY_HISTORY_CAPPED_BYTES', 256 * 1024 * 1024))
+    
+    # Recent alerts kept in memory for the alerts feed
+    ALERT_BUFFER_SIZE = int(os.getenv('ALERT_BUFFER_SIZE', 200))
+    
+    # Read-through cache ('memory' per worker, or 'redis' shared across workers)
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+    CACHE_TTL_SECONDS = int(os.getenv('CACHE_TTL_SECONDS', 60))
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 10000))
+    REDIS_URL = os.getenv('REDIS_URL')
+    
+    # Quota types in fallback order: booking one also tries every type after it
+    QUOTA_FALLBACK_ORDER = os.getenv('QUOTA_FALLBACK_ORDER', 'premium_tatkal,tatkal,general')
+    
+    # Passengers per (train, date, class) queue who get RAC before the rest are waitlisted
+    WAITLIST_RAC_LIMIT = int(os.getenv('WAITLIST_RAC_LIMIT', 10))
+    
+    # Seconds between rebuilds of the per-class availability summary (0 disables). Deltas keep
+    # it current; the rebuild only corrects drift, in whichever worker holds the reconcile lease
+    AVAILABILITY_RECONCILE_SECONDS = int(os.getenv('AVAILABILITY_RECONCILE_SECONDS', 0))
+    
+    # Fares (₹ per km per seat)
+    FARE_PER_KM = float(os.getenv('FARE_PER_KM', 10))
+    # Seconds between checks for trains added by other workers
+    FARE_REFRESH_SECONDS = float(os.getenv('FARE_REFRESH_SECONDS', 5))
     
     # Google Maps settings
     GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
@@ -40,6 +108,7 @@ class TestingConfig(Config):
     
     # Use a separate database for testing
     MONGO_URI = os.getenv('TEST_MONGO_URI', 'mongodb://localhost:27017/railway_reservation_test')
+    MONGO_MAX_POOL_SIZE = 10
 
 class ProductionConfig(Config):
     """Production configuration"""
@@ -52,6 +121,10 @@ class ProductionConfig(Config):
     
     # MongoDB settings for production
     MONGO_URI = os.getenv('MONGO_URI')
+    
+    # /metrics is not authenticated and X-DB-* headers expose query timings: off unless enabled
+    DB_METRICS_ENABLED = os.getenv('DB_METRICS_ENABLED', 'false').lower() == 'true'
+    DB_METRICS_HEADERS = os.getenv('DB_METRICS_HEADERS', 'false').lower() == 'true'
 
 # Configuration dictionary
 config_by_name = {
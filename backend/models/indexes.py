@@ -0,0 +1,102 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from backend.services.messaging import OTP_RECORD_TTL_SECONDS
+
+# Server error codes for an index that already exists with other options or another name
+INDEX_OPTIONS_CONFLICT = 85
+INDEX_KEY_SPECS_CONFLICT = 86
+
+# Every index the application relies on, by collection. Each one backs a query
+# in routes.py or the services; benchmarks/check_query_plans.py checks that
+# none of those queries falls back to a collection scan.
+INDEXES = {
+    'users': [
+        IndexModel([('email', ASCENDING)], name='user_email'),
+        IndexModel([('phone', ASCENDING)], name='user_phone'),
+    ],
+    'trains': [
+        IndexModel(
+            [('source', ASCENDING), ('destination', ASCENDING), ('run_days', ASCENDING), ('departure_time', ASCENDING)],
+            name='search_route_day'
+        ),
+        IndexModel([('source', ASCENDING), ('destination', ASCENDING), ('departure_time', ASCENDING)], name='search_route'),
+        # Tracking looks trains up by name
+        IndexModel([('name', ASCENDING)], name='train_name'),
+        # Fare tables load the trains added since the version they have
+        IndexModel([('timetable_version', ASCENDING)], name='train_timetable_version', sparse=True),
+    ],
+    'bookings': [
+        # "My bookings": newest first, optionally filtered by status
+        IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)], name='booking_user_recent'),
+        IndexModel(
+            [('user_id', ASCENDING), ('status', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+            name='booking_user_status_recent'
+        ),
+        IndexModel([('train_id', ASCENDING), ('status', ASCENDING)], name='booking_train_status'),
+    ],
+    'coaches': [
+        IndexModel([('train_id', ASCENDING), ('coach_number', ASCENDING)], name='coach_train_number'),
+    ],
+    'quotas': [
+        IndexModel(
+            [('train_id', ASCENDING), ('coach_number', ASCENDING), ('quota_type', ASCENDING), ('shard', ASCENDING)],
+            name='quota_coach_type_shard'
+        ),
+    ],
+    'coach_positions': [
+        IndexModel([('train_id', ASCENDING), ('coach_number', ASCENDING)], name='position_train_coach'),
+    ],
+    'alerts': [
+        IndexModel([('created_at', DESCENDING)], name='alert_recent'),
+        # The alerts feed pages a train's alerts by id
+        IndexModel([('train_id', ASCENDING), ('_id', DESCENDING)], name='alert_train_feed'),
+    ],
+    'tracking': [
+        IndexModel([('train_id', ASCENDING)], name='tracking_train'),
+    ],
+    'seat_holds': [
+        IndexModel(
+            [('train_id', ASCENDING), ('coach_number', ASCENDING), ('seat_number', ASCENDING)],
+            unique=True, name='unique_seat_hold'
+        ),
+        # expireAfterSeconds=0 removes each hold as soon as its own expires_at passes
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0, name='hold_ttl'),
+    ],
+    'availability_summary': [
+        IndexModel([('train_id', ASCENDING), ('coach_type', ASCENDING)], unique=True, name='availability_train_class'),
+    ],
+    'waitlist': [
+        IndexModel(
+            [('train_id', ASCENDING), ('date', ASCENDING), ('coach_type', ASCENDING),
+             ('status', ASCENDING), ('tier', ASCENDING), ('seq', ASCENDING)],
+            name='waitlist_queue_order'
+        ),
+        IndexModel([('user_id', ASCENDING), ('status', ASCENDING)], name='waitlist_user_status'),
+    ],
+    'notification_jobs': [
+        IndexModel([('status', ASCENDING), ('created_at', ASCENDING)], name='job_status'),
+    ],
+    'otp_requests': [
+        IndexModel([('phone', ASCENDING), ('created_at', ASCENDING)], name='otp_phone_recent'),
+        IndexModel([('created_at', ASCENDING)], expireAfterSeconds=OTP_RECORD_TTL_SECONDS, name='otp_ttl'),
+    ],
+}
+
+
+# Function to create the application's indexes; run once at startup.
+# create_indexes is a no-op for indexes that already exist, so every worker can
+# run it concurrently. An index that exists under another name or with other
+# options is left alone and reported rather than failing startup.
+# Returns the list of (collection, error) pairs that could not be created.
+def ensure_indexes(db, collections=None):
+    failures = []
+    for collection in collections or INDEXES:
+        for index in INDEXES[collection]:
+            try:
+                db[collection].create_indexes([index])
+            except OperationFailure as e:
+                if e.code not in (INDEX_OPTIONS_CONFLICT, INDEX_KEY_SPECS_CONFLICT):
+                    raise
+                failures.append((collection, str(e)))
+                print(f"Index {index.document['name']} on {collection} conflicts with an existing index: {e}")
+    return failures
@@ -16,13 +16,16 @@ Quota Model
 - train_id: ObjectId (reference to Train)
 - coach_number: String (coach identifier)
 - quota_type: String (general, tatkal, ladies, etc.)
-- total_seats: Integer
-- available_seats: Integer
+- shard: Integer (counter number; a hot quota is split over `shards` documents)
+- shards: Integer (number of counter documents for this quota)
+- total_seats: Integer (seats of this shard)
+- available_seats: Integer (decremented atomically at booking time, never below 0)
 - updated_at: DateTime
 """
 # This file defines the data models for our MongoDB collections
 # Since MongoDB is schema-less, these are not strict models but serve as documentation
 # and validation reference for our application
+# Indexes for every collection are declared in models/indexes.py and created at startup
 
 """
 User Model
@@ -43,9 +46,16 @@ Train Model
 - departure_time: String (time of departure)
 - arrival_time: String (time of arrival)
 - total_seats: Integer (total number of seats)
-- available_seats: Integer (number of available seats)
+- available_seats: Integer (free seats over all coaches, maintained with availability_summary)
 - status: String (scheduled, delayed, cancelled, completed)
+- run_days: Array (optional, weekdays the train runs e.g. ['Mon', 'Thu']; missing means daily)
+- distance: Integer (optional, route distance in km)
+- duration: String (optional, e.g. '16h 30m')
+- stops: Array (optional, ordered station names of the route, source first; segment k is stops[k] -> stops[k + 1])
+- stop_km: Array (optional, km from the source to each stop, used for fares between intermediate stops)
+- timetable_version: Integer (order in which trains were added, from counters; fare tables load newer ones)
 - created_at: DateTime
+Indexes: (source, destination, run_days, departure_time), (source, destination, departure_time), name, timetable_version
 """
 
 """
@@ -56,8 +66,62 @@ Booking Model
 - train_name: String (name of the train)
 - seats: Array (list of seat numbers)
 - date: String (date of journey)
+- from / to: String (optional, boarding and alighting stations for partial journeys)
+- segments: Integer (optional, mask of route segments the seats are sold for)
+- quota: Array (optional, quota seats taken: {coach_number, quota_type, shard, seats})
+- distance: Integer (km travelled, from the fare table at booking time)
+- fare_per_seat / price: Integer (₹, per seat and for all seats, fixed at booking time)
+- waitlist_id: ObjectId (optional, the Waitlist entry this booking was promoted from)
 - status: String (confirmed, cancelled, completed)
 - created_at: DateTime
+- cancelled_at: DateTime (optional)
+"""
+
+"""
+AvailabilitySummary Model (collection: availability_summary)
+- _id: ObjectId (automatically generated by MongoDB)
+- train_id: ObjectId (reference to Train)
+- coach_type: String (class; one document per class of a train)
+- total_seats / booked / available: Integer (whole-route seat counts over the class's coaches)
+- held: Integer (seats locked at the last rebuild)
+- quotas: Object (quota_type -> available quota seats over the class's coaches)
+- version: Integer (bumped by every change; rebuilds only overwrite the version they counted from)
+- updated_at / reconciled_at: DateTime
+Kept in step by bookings, cancellations and admin edits, rebuilt from the coaches by
+AvailabilityIndex.rebuild. Index: unique (train_id, coach_type)
+"""
+
+"""
+Lease Model (collection: leases)
+- _id: String (name of the job, e.g. availability-reconcile)
+- holder: String (the process running the job)
+- expires_at: DateTime (when another process may take the job over)
+"""
+
+"""
+TelemetryHistory Model (collection: telemetry_history, only with TELEMETRY_HISTORY)
+- ts: DateTime (reported_at of the report, or when it was received)
+- source: Object ({kind: coach_position | tracking, train_id, coach_number})
+- the reported fields (see telemetry.TELEMETRY_FIELDS)
+Time-series collection expiring after TELEMETRY_HISTORY_SECONDS, or a capped
+collection of TELEMETRY_HISTORY_CAPPED_BYTES where time-series is unavailable
+"""
+
+"""
+Waitlist Model
+- _id: ObjectId (automatically generated by MongoDB)
+- train_id: ObjectId (reference to Train)
+- date: String (date of journey)
+- coach_type: String (class waited for; freed seats of this class are offered to the queue)
+- user_id: ObjectId (reference to User)
+- seats: Integer (party size; the party is promoted together or not at all)
+- from / to / segments: optional partial journey, as on Booking
+- tier: Integer (0 = RAC, 1 = WL; RAC is promoted first)
+- seq: Integer (order of joining within the queue, from waitlist_counters)
+- status: String (waiting, promoted, cancelled)
+- booking_id: ObjectId (set once promoted)
+- created_at / promoted_at / cancelled_at: DateTime
+Indexes: (train_id, date, coach_type, status, tier, seq), (user_id, status)
 """
 
 """
@@ -89,7 +153,10 @@ Coach Model
 - coach_type: String (sleeper, AC, general, etc.)
 - total_seats: Integer (total seats in this coach)
 - available_seats: Integer (available seats in this coach)
-- seat_map: Object (mapping of seat numbers to availability)
+- seat_bits: Array (compact inventory: 32-bit words, one bit per seat, set = booked;
+  seat types are derived from helpers.seat_layout, see helpers.coach_seat_map)
+- segment_bits: Array (segment-aware inventory: one integer per seat, bit k set = sold on segment k)
+- seat_map: Object (legacy mapping of seat numbers to availability, replaced by seat_bits)
 """
 
 """
@@ -102,4 +169,42 @@ Payment Model
 - transaction_id: String (payment gateway transaction ID)
 - status: String (pending, completed, failed, refunded)
 - created_at: DateTime
-"""
\ No newline at end of file
+"""
+"""
+SeatHold Model
+- _id: ObjectId (automatically generated by MongoDB)
+- train_id: ObjectId (reference to Train)
+- coach_number: String (coach identifier)
+- seat_number: String (seat number within the coach)
+- holder: String (user id that locked the seat, optional)
+- created_at: DateTime
+- expires_at: DateTime (TTL index removes the hold once this passes)
+Indexes: unique (train_id, coach_number, seat_number), TTL on expires_at
+"""
+
+"""
+NotificationJob Model
+- _id: ObjectId (automatically generated by MongoDB)
+- type: String (route_deviation)
+- train_id: ObjectId (reference to Train)
+- alert_id: ObjectId (reference to Alert)
+- body: String (SMS text sent to every passenger)
+- status: String (queued, running, completed, failed)
+- total / sent / failed: Integer (recipient counts)
+- errors: Array (first few failed sends: {to, error})
+- done: Array (phones already sent to or given up on, skipped when the job is resumed)
+- attempts: Integer (times the job has been started)
+- created_at / started_at / heartbeat_at / finished_at: DateTime
+Indexes: (status, created_at)
+"""
+
+"""
+OtpRequest Model
+- _id: ObjectId (tracking id returned by /api/passenger/send_otp)
+- phone: String (number the OTP was sent to)
+- status: String (queued, sent, failed)
+- provider_status: String (Twilio Verify status once sent)
+- error: String (set when the send failed)
+- created_at / finished_at: DateTime
+Indexes: (phone, created_at) for send throttling, TTL on created_at
+"""
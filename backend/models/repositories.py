@@ -0,0 +1,397 @@
+from pymongo import ASCENDING, DESCENDING
+from backend.services.quota_allocation import summarise_quotas
+from backend.services.segment_availability import AVAILABILITY_PROJECTION
+from backend.utils.data_access import Cached, aggregate, delete_many, find, find_one, insert_one, run, update_one
+
+# Fields each use case reads, by view name (None loads the whole document). Views
+# only include fields, so a document loaded for one view can serve any view whose
+# fields it already has.
+TRAIN_VIEWS = {
+    # Every field but available_seats, which bookings keep changing (see TrainRepository)
+    'full': None,
+    # Train search results
+    'search': {
+        'name': 1, 'source': 1, 'destination': 1, 'departure_time': 1, 'arrival_time': 1,
+        'duration': 1, 'price': 1, 'available_seats': 1
+    },
+    # Admin bookings report
+    'report': {'name': 1, 'source': 1, 'destination': 1, 'duration': 1},
+    # Live tracking page
+    'tracking': {'name': 1, 'source': 1, 'destination': 1, 'departure_time': 1, 'arrival_time': 1, 'stops': 1},
+    # Free seats, always read from the database
+    'seats': {'available_seats': 1},
+}
+# Train fields written on every booking (by AvailabilityIndex), so never cached
+TRAIN_LIVE_FIELDS = {'available_seats': 0}
+COACH_VIEWS = {
+    'full': None,
+    'availability': AVAILABILITY_PROJECTION,
+    'seat_map': {'coach_number': 1, 'seat_bits': 1, 'seat_map': 1, 'segment_bits': 1, 'total_seats': 1, 'coach_type': 1},
+    'layout': {'coach_number': 1, 'total_seats': 1, 'coach_type': 1},
+}
+BOOKING_VIEWS = {
+    'full': None,
+    # "My bookings" rows unless ?fields= asks for others
+    'history': {
+        'train_id': 1, 'train_name': 1, 'seats': 1, 'date': 1, 'from': 1, 'to': 1,
+        'status': 1, 'created_at': 1
+    },
+}
+USER_VIEWS = {
+    'full': None,
+    'exists': {'_id': 1},
+    'contact': {'name': 1, 'phone': 1, 'email': 1},
+}
+
+# Placeholder for "not in the identity map" (None means "known not to exist")
+MISSING = object()
+
+
+class IdentityMap:
+    """Documents already read in the current request, keyed by collection and key.
+
+    A repeated read is answered from here when the earlier read loaded every
+    field the new one needs; otherwise it goes to the database and the fields
+    are merged. Lookups of documents that do not exist are remembered too.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, collection, key, projection=None):
+        entry = self.entries.get((collection, key))
+        if entry is not None:
+            fields, doc = entry
+            if doc is None or fields is None or (projection is not None and set(projection) <= fields):
+                self.hits += 1
+                return doc
+        self.misses += 1
+        return MISSING
+
+    def put(self, collection, key, doc, projection=None):
+        fields = None if projection is None else set(projection) | {'_id'}
+        entry = self.entries.get((collection, key))
+        if doc is not None and entry is not None and entry[1] is not None and fields is not None:
+            old_fields, old_doc = entry
+            # Copy: documents may come from the shared cache and must not be changed in place
+            doc = dict(old_doc, **doc)
+            fields = None if old_fields is None else old_fields | fields
+        self.entries[(collection, key)] = (fields, doc)
+
+    def evict(self, collection, key):
+        self.entries.pop((collection, key), None)
+
+
+class Repository:
+    """Reads and writes one collection by _id through the identity map.
+
+    Each operation is also available as data-access steps (the `*_steps`
+    methods, see backend/utils/data_access.py), so the ASGI app can run the
+    same repository code with Motor; the plain methods run them with pymongo.
+    """
+
+    collection = None
+    views = {'full': None}
+
+    def __init__(self, db, identity_map, cache=None):
+        self.db = db
+        self.coll = db[self.collection]
+        self.identity_map = identity_map
+        self.cache = cache
+
+    def _run(self, steps):
+        return run(steps, self.db, self.cache)
+
+    def _load_steps(self, key, projection):
+        return (yield find_one(self.collection, {'_id': key}, projection))
+
+    # Returns the document with `key` (None if there is none), loading at least the view's fields
+    def get(self, key, view='full'):
+        return self._run(self.get_steps(key, view))
+
+    def get_steps(self, key, view='full'):
+        projection = self.views[view]
+        doc = self.identity_map.get(self.collection, key, projection)
+        if doc is MISSING:
+            doc = yield from self._load_steps(key, projection)
+            self.identity_map.put(self.collection, key, doc, projection)
+        return doc
+
+    # Returns {_id: document} for the ids that exist, with one $in query for those not yet read
+    def get_many(self, keys, view='full'):
+        return self._run(self.get_many_steps(keys, view))
+
+    def get_many_steps(self, keys, view='full'):
+        projection = self.views[view]
+        found, missing = {}, []
+        for key in dict.fromkeys(keys):
+            doc = self.identity_map.get(self.collection, key, projection)
+            if doc is MISSING:
+                missing.append(key)
+            elif doc is not None:
+                found[key] = doc
+        if missing:
+            loaded = {doc['_id']: doc for doc in (yield find(self.collection, {'_id': {'$in': missing}}, projection))}
+            for key in missing:
+                self.identity_map.put(self.collection, key, loaded.get(key), projection)
+                if key in loaded:
+                    found[key] = loaded[key]
+        return found
+
+    def insert(self, document):
+        return self._run(self.insert_steps(document))
+
+    def insert_steps(self, document):
+        key = (yield insert_one(self.collection, document)).inserted_id
+        self.identity_map.put(self.collection, key, document)
+        return key
+
+    def update(self, key, update):
+        return self._run(self.update_steps(key, update))
+
+    def update_steps(self, key, update):
+        result = yield update_one(self.collection, {'_id': key}, update)
+        self.identity_map.evict(self.collection, key)
+        return result.modified_count
+
+
+class TrainRepository(Repository):
+    """Trains change rarely, except for their seat count: cached copies leave out
+    TRAIN_LIVE_FIELDS, and reads that ask for them go to the database."""
+
+    collection = 'trains'
+    views = TRAIN_VIEWS
+
+    def get_steps(self, key, view='full'):
+        projection = self.views[view]
+        doc = self.identity_map.get(self.collection, key, projection)
+        if doc is MISSING:
+            doc = yield from self._load_steps(key, projection)
+            # A 'full' train lacks the live fields, so the map records the fields it does have
+            loaded = dict.fromkeys(doc) if projection is None and doc is not None else projection
+            self.identity_map.put(self.collection, key, doc, loaded)
+        return doc
+
+    # Whole train documents (but for the live fields) come from the app cache
+    def _load_steps(self, key, projection):
+        if projection is None:
+            return (yield Cached(f'train:{key}', find_one(self.collection, {'_id': key}, TRAIN_LIVE_FIELDS)))
+        return (yield from super()._load_steps(key, projection))
+
+    # Every train, optionally only some fields; each field set is cached separately.
+    # Whole trains come without the live fields; asking for one of them reads it fresh.
+    def all(self, projection=None):
+        return self._run(self.all_steps(projection))
+
+    def all_steps(self, projection=None):
+        if projection is not None and set(projection) & set(TRAIN_LIVE_FIELDS):
+            return (yield find(self.collection, {}, projection))
+        key = 'trains:all' + (':' + ','.join(projection) if projection else '')
+        return (yield Cached(key, find(self.collection, {}, projection or TRAIN_LIVE_FIELDS)))
+
+    # Function to find trains between two stations with at least `passengers` seats,
+    # by departure time. `weekday` ('Mon', ...) keeps trains running that day.
+    def search(self, source, destination, passengers=1, weekday=None, skip=0, limit=0):
+        return self._run(self.search_steps(source, destination, passengers, weekday, skip, limit))
+
+    def search_steps(self, source, destination, passengers=1, weekday=None, skip=0, limit=0):
+        query = {'source': source, 'destination': destination}
+        if weekday:
+            # Trains without run_days run daily
+            query['run_days'] = {'$in': [weekday, None]}
+        query['available_seats'] = {'$not': {'$lt': passengers}}
+        return (yield find(
+            self.collection, query, self.views['search'], sort=[('departure_time', ASCENDING)], skip=skip, limit=limit
+        ))
+
+    # Function to find a train by its exact name (the train number passengers know it by)
+    def find_by_name(self, name, view='full'):
+        return self._run(self.find_by_name_steps(name, view))
+
+    def find_by_name_steps(self, name, view='full'):
+        train = yield find_one(self.collection, {'name': name}, self.views[view])
+        if train is not None:
+            self.identity_map.put(self.collection, train['_id'], train, self.views[view])
+        return train
+
+    def insert_steps(self, document):
+        key = yield from super().insert_steps(document)
+        if self.cache is not None:
+            self.cache.invalidate_prefix('trains:all')
+        return key
+
+
+class CoachRepository(Repository):
+    """Coaches are looked up by (train_id, coach_number)."""
+
+    collection = 'coaches'
+    views = COACH_VIEWS
+
+    def get(self, train_id, coach_number, view='full'):
+        return self._run(self.get_steps(train_id, coach_number, view))
+
+    def get_steps(self, train_id, coach_number, view='full'):
+        return (yield from super().get_steps((train_id, coach_number), view))
+
+    def _load_steps(self, key, projection):
+        train_id, coach_number = key
+        return (yield find_one(self.collection, {'train_id': train_id, 'coach_number': coach_number}, projection))
+
+    # Returns {(train_id, coach_number): coach}, with one query per train for coaches not yet read
+    def get_many_steps(self, keys, view='full'):
+        projection = self.views[view]
+        found, missing = {}, {}
+        for key in dict.fromkeys(keys):
+            doc = self.identity_map.get(self.collection, key, projection)
+            if doc is MISSING:
+                missing.setdefault(key[0], []).append(key[1])
+            elif doc is not None:
+                found[key] = doc
+        for train_id, numbers in missing.items():
+            loaded = {
+                coach['coach_number']: coach for coach in (yield find(
+                    self.collection, {'train_id': train_id, 'coach_number': {'$in': numbers}}, self._with_key(projection)
+                ))
+            }
+            for number in numbers:
+                self.identity_map.put(self.collection, (train_id, number), loaded.get(number), projection)
+                if number in loaded:
+                    found[(train_id, number)] = loaded[number]
+        return found
+
+    # Every coach of a train; whole documents come from the app cache
+    def for_train(self, train_id, view='full'):
+        return self._run(self.for_train_steps(train_id, view))
+
+    def for_train_steps(self, train_id, view='full'):
+        projection = self.views[view]
+        if projection is None:
+            coaches = yield Cached(f'coaches:{train_id}', find(self.collection, {'train_id': train_id}))
+        else:
+            coaches = yield find(self.collection, {'train_id': train_id}, self._with_key(projection))
+        for coach in coaches:
+            self.identity_map.put(self.collection, (train_id, coach['coach_number']), coach, projection)
+        return coaches
+
+    def update(self, train_id, coach_number, update):
+        return self._run(self.update_steps(train_id, coach_number, update))
+
+    def update_steps(self, train_id, coach_number, update):
+        result = yield update_one(self.collection, {'train_id': train_id, 'coach_number': coach_number}, update)
+        self.identity_map.evict(self.collection, (train_id, coach_number))
+        if self.cache is not None:
+            self.cache.invalidate(f'coaches:{train_id}')
+        return result.modified_count
+
+    @staticmethod
+    def _with_key(projection):
+        return dict(projection, coach_number=1) if projection is not None else None
+
+
+class BookingRepository(Repository):
+    collection = 'bookings'
+    views = BOOKING_VIEWS
+
+    # Bookings in _id order after `after`, for the admin report (a pymongo cursor, so
+    # callers can stream it; the report is only served by the Flask app)
+    def scan(self, after=None, limit=0, batch_size=None):
+        cursor = self.coll.find({'_id': {'$gt': after}} if after else {}).sort('_id', ASCENDING).limit(limit)
+        return cursor.batch_size(batch_size) if batch_size else cursor
+
+    # A page of a user's bookings, newest first; `query` carries the filters and keyset position
+    def history(self, query, projection, limit):
+        return self._run(self.history_steps(query, projection, limit))
+
+    def history_steps(self, query, projection, limit):
+        return (yield find(
+            self.collection, query, dict(projection, created_at=1),
+            sort=[('created_at', DESCENDING), ('_id', DESCENDING)], limit=limit
+        ))
+
+    # Booking counts per status for one user, counted on the index
+    def status_counts(self, user_id):
+        return self._run(self.status_counts_steps(user_id))
+
+    def status_counts_steps(self, user_id):
+        return {row['_id']: row['count'] for row in (yield aggregate(self.collection, [
+            {'$match': {'user_id': user_id}},
+            {'$group': {'_id': '$status', 'count': {'$sum': 1}}}
+        ]))}
+
+    def delete_all(self):
+        return self._run(self.delete_all_steps())
+
+    def delete_all_steps(self):
+        self.identity_map.entries = {k: v for k, v in self.identity_map.entries.items() if k[0] != self.collection}
+        return (yield delete_many(self.collection, {})).deleted_count
+
+
+class UserRepository(Repository):
+    collection = 'users'
+    views = USER_VIEWS
+
+    def find_by_email(self, email, view='full'):
+        return self._run(self.find_by_email_steps(email, view))
+
+    def find_by_email_steps(self, email, view='full'):
+        user = yield find_one(self.collection, {'email': email}, self.views[view])
+        if user is not None:
+            self.identity_map.put(self.collection, user['_id'], user, self.views[view])
+        return user
+
+
+class QuotaRepository(Repository):
+    """Quota counters are read per coach: every (quota type, shard) document at once.
+    Consuming and releasing seats stays with QuotaAllocator's atomic updates."""
+
+    collection = 'quotas'
+
+    def for_coach(self, train_id, coach_number):
+        return self.get((train_id, coach_number))
+
+    def _load_steps(self, key, projection):
+        train_id, coach_number = key
+        return (yield find(self.collection, {'train_id': train_id, 'coach_number': coach_number}))
+
+    # Returns {coach_number: [counter documents]} for coaches of one train, in one query
+    def get_many(self, train_id, coach_numbers, view='full'):
+        return self._run(self.get_many_steps(train_id, coach_numbers, view))
+
+    def get_many_steps(self, train_id, coach_numbers, view='full'):
+        found, missing = {}, []
+        for number in dict.fromkeys(coach_numbers):
+            docs = self.identity_map.get(self.collection, (train_id, number))
+            if docs is MISSING:
+                missing.append(number)
+            else:
+                found[number] = docs
+        if missing:
+            for number in missing:
+                found[number] = []
+            for doc in (yield find(self.collection, {'train_id': train_id, 'coach_number': {'$in': missing}})):
+                found[doc['coach_number']].append(doc)
+            for number in missing:
+                self.identity_map.put(self.collection, (train_id, number), found[number])
+        return found
+
+    # Quotas of a coach with the shard counters added up, one entry per quota type
+    def summary(self, train_id, coach_number):
+        return summarise_quotas(self.for_coach(train_id, coach_number))
+
+    def invalidate(self, train_id, coach_number):
+        self.identity_map.evict(self.collection, (train_id, coach_number))
+
+
+class Repositories:
+    """The repositories used by one request, sharing one identity map. `db` is a
+    pymongo database, or a Motor one when only the `*_steps` methods are used."""
+
+    def __init__(self, db, cache=None):
+        self.identity_map = IdentityMap()
+        self.trains = TrainRepository(db, self.identity_map, cache)
+        self.coaches = CoachRepository(db, self.identity_map, cache)
+        self.bookings = BookingRepository(db, self.identity_map, cache)
+        self.users = UserRepository(db, self.identity_map, cache)
+        self.quotas = QuotaRepository(db, self.identity_map, cache)
@@ -0,0 +1,172 @@
+import queue
+import threading
+from collections import OrderedDict, deque
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+# Most recent alerts kept in memory for GET /api/alerts
+ALERT_BUFFER_SIZE = 200
+# Most recent alerts kept per train, and how many trains keep a buffer at once
+TRAIN_ALERT_BUFFER_SIZE = 50
+MAX_TRAIN_BUFFERS = 1000
+# Seconds between reads for alerts written by other workers when change streams are unavailable
+DEFAULT_POLL_INTERVAL = 2.0
+# Alerts buffered per SSE subscriber before the oldest are dropped for a slow client
+SUBSCRIBER_QUEUE_SIZE = 64
+
+
+# Function to parse a `since` cursor (an alert id); returns None if it is not one
+def parse_alert_cursor(cursor):
+    return ObjectId(cursor) if cursor and ObjectId.is_valid(cursor) else None
+
+
+class AlertFeed:
+    """Recent alerts served from bounded in-memory ring buffers.
+
+    One buffer holds the latest alerts overall and one per train (loaded from
+    the database the first time a train is asked for). Alerts created by this
+    worker are published straight into the buffers; alerts from other workers
+    arrive through a change stream on `alerts`, or by polling for newer ids
+    where change streams are not available. The cursor is the alert id, so
+    clients fetch only what is newer than the last alert they saw.
+    """
+
+    def __init__(self, db, size=ALERT_BUFFER_SIZE, train_size=TRAIN_ALERT_BUFFER_SIZE,
+                 poll_interval=DEFAULT_POLL_INTERVAL, use_change_streams=True):
+        self.db = db
+        self.size = size
+        self.train_size = train_size
+        self.poll_interval = poll_interval
+        self.use_change_streams = use_change_streams
+        self.recent_alerts = deque(maxlen=size)
+        self.train_alerts = OrderedDict()
+        self.seen = OrderedDict()
+        self.subscribers = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='alert-feed', daemon=True)
+        self._newest_id = None
+
+    # Prime the global buffer from the database and start following new alerts
+    def start(self):
+        alerts = list(self.db.alerts.find().sort('_id', -1).limit(self.size))
+        with self.lock:
+            for alert in reversed(alerts):
+                self._remember(alert)
+                self.recent_alerts.append(alert)
+        self._newest_id = alerts[0]['_id'] if alerts else None
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def _remember(self, alert):
+        self.seen[alert['_id']] = True
+        while len(self.seen) > self.size + self.train_size * MAX_TRAIN_BUFFERS:
+            self.seen.popitem(last=False)
+
+    def _train_buffer(self, train_id):
+        with self.lock:
+            buffer = self.train_alerts.get(train_id)
+            if buffer is not None:
+                self.train_alerts.move_to_end(train_id)
+                return buffer
+        alerts = list(self.db.alerts.find({'train_id': train_id}).sort('_id', -1).limit(self.train_size))
+        with self.lock:
+            buffer = self.train_alerts.get(train_id)
+            if buffer is None:
+                buffer = self.train_alerts[train_id] = deque(reversed(alerts), maxlen=self.train_size)
+                if len(self.train_alerts) > MAX_TRAIN_BUFFERS:
+                    self.train_alerts.popitem(last=False)
+            return buffer
+
+    # Add a new alert to the buffers and push it to subscribers; duplicates are ignored
+    def publish(self, alert):
+        with self.lock:
+            if alert['_id'] in self.seen:
+                return
+            self._remember(alert)
+            self.recent_alerts.append(alert)
+            train_id = alert.get('train_id')
+            buffer = self.train_alerts.get(train_id)
+            # A buffer loaded from the database just now may already hold this alert
+            if buffer is not None and all(a['_id'] != alert['_id'] for a in buffer):
+                buffer.append(alert)
+            subscribers = list(self.subscribers.get(None, ()))
+            if train_id is not None:
+                subscribers += self.subscribers.get(train_id, ())
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(alert)
+            except queue.Full:
+                # Slow client: drop its oldest alert rather than block the publisher
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    pass
+                subscriber.put_nowait(alert)
+
+    # Function to list alerts newest first, optionally only those after the `since` cursor.
+    # Returns (alerts, cursor for the next call).
+    def recent(self, train_id=None, since=None, limit=None):
+        buffer = self._train_buffer(train_id) if train_id is not None else self.recent_alerts
+        with self.lock:
+            alerts = list(reversed(buffer))
+            full = len(buffer) == buffer.maxlen
+        if since is not None:
+            newer = [a for a in alerts if a['_id'] > since]
+            if full and len(newer) == len(alerts):
+                # The cursor is older than everything buffered; some alerts may have rolled off
+                query = {'_id': {'$gt': since}}
+                if train_id is not None:
+                    query['train_id'] = train_id
+                newer = list(self.db.alerts.find(query).sort('_id', -1).limit(limit or buffer.maxlen))
+            alerts = newer
+        if limit:
+            alerts = alerts[:limit]
+        cursor = str(alerts[0]['_id']) if alerts else (str(since) if since else None)
+        return alerts, cursor
+
+    # Returns a queue that receives every new alert (for one train, or all if train_id is None)
+    def subscribe(self, train_id=None):
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.setdefault(train_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber, train_id=None):
+        with self.lock:
+            subscribers = self.subscribers.get(train_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self.subscribers[train_id]
+
+    def subscriber_count(self):
+        with self.lock:
+            return sum(len(subscribers) for subscribers in self.subscribers.values())
+
+    def _run(self):
+        if self.use_change_streams:
+            try:
+                self._watch_change_stream()
+                return
+            except (OperationFailure, NotImplementedError):
+                pass  # change streams need a replica set; poll instead
+        self._poll()
+
+    def _watch_change_stream(self):
+        pipeline = [{'$match': {'operationType': 'insert'}}]
+        with self.db.alerts.watch(pipeline, max_await_time_ms=1000) as stream:
+            while not self.stopped.is_set():
+                change = stream.try_next()
+                if change:
+                    self.publish(change['fullDocument'])
+
+    def _poll(self):
+        while not self.stopped.wait(self.poll_interval):
+            query = {'_id': {'$gt': self._newest_id}} if self._newest_id else {}
+            for alert in self.db.alerts.find(query).sort('_id', 1).limit(self.size):
+                self.publish(alert)
+                self._newest_id = alert['_id']
@@ -0,0 +1,234 @@
+import threading
+import uuid
+from datetime import datetime, timedelta
+import numpy as np
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from backend.services.segment_availability import AVAILABILITY_PROJECTION, coach_occupancy
+
+# Seconds between full rebuilds of the availability summary from the coaches (0 disables)
+RECONCILE_INTERVAL_SECONDS = 0
+
+# Lease document in `leases` naming the one process that runs the reconcile job
+RECONCILE_LEASE = 'availability-reconcile'
+
+# Summary fields returned to clients
+SUMMARY_PROJECTION = {
+    '_id': 0, 'train_id': 1, 'coach_type': 1, 'total_seats': 1, 'booked': 1,
+    'available': 1, 'held': 1, 'quotas': 1, 'updated_at': 1
+}
+
+
+# Function to count the seats of a coach for the summary: (total seats, seats booked on any segment)
+def coach_counts(coach):
+    occupancy = coach_occupancy(coach)
+    return len(occupancy), int(np.count_nonzero(occupancy))
+
+
+class AvailabilityIndex:
+    """Seat counts per (train, class) kept in `availability_summary`.
+
+    Every write to the coach inventory applies `$inc` deltas to the summary (and
+    to the train's `available_seats`) right after it, so search can show real
+    availability with one indexed read instead of loading every coach. Bookings
+    and cancellations report the seats whose whole-seat status changed (a
+    partial journey on a seat already sold elsewhere on the route does not),
+    admin edits report the coaches before and after. Seat holds, which expire
+    on their own through the TTL index, are not tracked by deltas: rebuild()
+    recounts them from the coaches, which stay the source of truth, and the
+    optional reconcile job runs it for every train to correct any drift.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._coach_types = {}
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lease_holder = uuid.uuid4().hex
+
+    # coach_number -> coach_type for coaches of a train, remembered between calls
+    def coach_types(self, train_id, coach_numbers):
+        missing = [n for n in coach_numbers if (train_id, n) not in self._coach_types]
+        if missing:
+            for coach in self.db.coaches.find(
+                {'train_id': train_id, 'coach_number': {'$in': missing}}, {'coach_number': 1, 'coach_type': 1}
+            ):
+                self._coach_types[(train_id, coach['coach_number'])] = coach.get('coach_type')
+        return {n: self._coach_types.get((train_id, n)) for n in coach_numbers}
+
+    def get(self, train_ids):
+        summaries = {}
+        for doc in self.db.availability_summary.find({'train_id': {'$in': list(train_ids)}}, SUMMARY_PROJECTION):
+            summaries.setdefault(doc['train_id'], []).append(doc)
+        return summaries
+
+    # Function to apply a booking (booked=True) or a release of seats to the summary.
+    # `seats` is a list of (coach_number, seat_number) whose whole-seat status changed
+    # (see SeatHoldEngine.confirm and release_seats); `quota` the quota allocations
+    # taken or given back with them.
+    def record(self, train_id, seats, booked=True, quota=None):
+        sign = 1 if booked else -1
+        quota = quota or []
+        types = self.coach_types(train_id, list({c for c, _ in seats} | {a['coach_number'] for a in quota}))
+        increments = {}
+        for coach_number, _ in seats:
+            inc = increments.setdefault(types[coach_number], {})
+            inc['booked'] = inc.get('booked', 0) + sign
+            inc['available'] = inc.get('available', 0) - sign
+        for allocation in quota:
+            inc = increments.setdefault(types[allocation['coach_number']], {})
+            field = f"quotas.{allocation['quota_type']}"
+            inc[field] = inc.get(field, 0) - sign * allocation['seats']
+        return self.adjust(train_id, increments)
+
+    # Function to apply the seat count changes of coaches an admin created or rewrote.
+    # `coaches` is a list of (before, after) coach documents with the AVAILABILITY_PROJECTION
+    # fields, None for a coach that did not exist. `new_train` writes the summaries
+    # outright for a train that had no coaches.
+    def record_coaches(self, train_id, coaches, new_train=False):
+        increments = {}
+        for before, after in coaches:
+            for coach, sign in ((before, -1), (after, 1)):
+                if coach is None:
+                    continue
+                total, booked = coach_counts(coach)
+                inc = increments.setdefault(coach.get('coach_type'), {})
+                for field, count in (('total_seats', total), ('booked', booked), ('available', total - booked)):
+                    inc[field] = inc.get(field, 0) + sign * count
+            if after is not None:
+                self._coach_types[(train_id, after['coach_number'])] = after.get('coach_type')
+        return self.adjust(train_id, increments, upsert=new_train)
+
+    # Function to apply a change in a coach's quota seats, e.g. from QuotaAllocator.set_quota
+    def record_quota(self, train_id, coach_number, quota_type, change):
+        coach_type = self.coach_types(train_id, [coach_number])[coach_number]
+        return self.adjust(train_id, {coach_type: {f'quotas.{quota_type}': change}})
+
+    # Function to apply `$inc` deltas to the summary: `increments` maps a class to
+    # {field: delta}, and `available` deltas also move the train's available_seats.
+    # Each write bumps the summary's version, which rebuild() checks. A class with no
+    # summary yet gets one from a recount, or from the deltas themselves with `upsert`.
+    # Returns the number of (train, class) summaries changed.
+    def adjust(self, train_id, increments, upsert=False):
+        increments = {coach_type: inc for coach_type, inc in increments.items() if any(inc.values())}
+        if not increments:
+            return 0
+
+        now = datetime.utcnow()
+        result = self.db.availability_summary.bulk_write([
+            UpdateOne(
+                {'train_id': train_id, 'coach_type': coach_type},
+                {'$inc': dict(inc, version=1), '$set': {'updated_at': now}}, upsert=upsert
+            )
+            for coach_type, inc in increments.items()
+        ], ordered=False)
+        if result.matched_count + result.upserted_count < len(increments):
+            # First change since the train's coaches were set up: build its summary now
+            return self.rebuild([train_id])
+        available = sum(inc.get('available', 0) for inc in increments.values())
+        if available:
+            self.db.trains.update_one({'_id': train_id}, {'$inc': {'available_seats': available}})
+        return len(increments)
+
+    # Function to recount the summary of some trains (or all of them) from the coach
+    # inventory, active seat holds and quota counters. Also resets each train's
+    # available_seats. A summary or train total that a delta moves while the count
+    # runs is left for the next rebuild rather than overwritten with an older count.
+    # Returns the number of (train, class) summaries written.
+    def rebuild(self, train_ids=None):
+        scope = {'train_id': {'$in': list(train_ids)}} if train_ids is not None else {}
+        now = datetime.utcnow()
+        existing = {
+            (doc['train_id'], doc.get('coach_type')): doc
+            for doc in self.db.availability_summary.find(scope, {'train_id': 1, 'coach_type': 1, 'version': 1})
+        }
+        train_scope = {'_id': {'$in': list(train_ids)}} if train_ids is not None else {}
+        available_before = {
+            train['_id']: train.get('available_seats') for train in self.db.trains.find(train_scope, {'available_seats': 1})
+        }
+
+        summaries, coach_types = {}, {}
+        for coach in self.db.coaches.find(scope, dict(AVAILABILITY_PROJECTION, train_id=1)):
+            total, booked = coach_counts(coach)
+            key = (coach['train_id'], coach.get('coach_type'))
+            summary = summaries.setdefault(key, {'total_seats': 0, 'booked': 0, 'held': 0, 'quotas': {}})
+            summary['total_seats'] += total
+            summary['booked'] += booked
+            coach_types[(coach['train_id'], coach['coach_number'])] = coach.get('coach_type')
+
+        for hold in self.db.seat_holds.find(
+            dict(scope, expires_at={'$gt': now}), {'train_id': 1, 'coach_number': 1}
+        ):
+            coach = (hold['train_id'], hold['coach_number'])
+            if coach in coach_types:
+                summaries[(hold['train_id'], coach_types[coach])]['held'] += 1
+        for quota in self.db.quotas.find(scope, {'train_id': 1, 'coach_number': 1, 'quota_type': 1, 'available_seats': 1}):
+            coach = (quota['train_id'], quota['coach_number'])
+            if coach in coach_types:
+                quotas = summaries[(quota['train_id'], coach_types[coach])]['quotas']
+                quotas[quota['quota_type']] = quotas.get(quota['quota_type'], 0) + quota.get('available_seats', 0)
+
+        operations, train_available = [], {}
+        for (train_id, coach_type), summary in summaries.items():
+            summary.update(available=summary['total_seats'] - summary['booked'], updated_at=now, reconciled_at=now)
+            current = existing.get((train_id, coach_type))
+            if current is not None:
+                # Compare-and-set on the version the count started from
+                operations.append(UpdateOne(
+                    {'_id': current['_id'], 'version': current.get('version')},
+                    {'$set': summary, '$inc': {'version': 1}}
+                ))
+            else:
+                operations.append(UpdateOne(
+                    {'train_id': train_id, 'coach_type': coach_type}, {'$setOnInsert': summary}, upsert=True
+                ))
+            train_available[train_id] = train_available.get(train_id, 0) + summary['available']
+        # Classes whose coaches are gone
+        stale = [doc['_id'] for key, doc in existing.items() if key not in summaries]
+        written = 0
+        if operations:
+            result = self.db.availability_summary.bulk_write(operations, ordered=False)
+            written = result.modified_count + result.upserted_count
+            self.db.trains.bulk_write([
+                UpdateOne({'_id': train_id, 'available_seats': available_before.get(train_id)},
+                          {'$set': {'available_seats': available}})
+                for train_id, available in train_available.items()
+            ], ordered=False)
+        if stale:
+            self.db.availability_summary.delete_many({'_id': {'$in': stale}})
+        self._coach_types.update(coach_types)
+        return written
+
+    # Start the background job that rebuilds every train's summary every `interval`
+    # seconds. Every worker may start it; a lease lets only one of them run the rebuilds.
+    def start_reconciler(self, interval=RECONCILE_INTERVAL_SECONDS):
+        if interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._reconcile_loop, args=(interval,), name='availability-reconcile', daemon=True)
+        self._thread.start()
+
+    def stop_reconciler(self):
+        self._stopped.set()
+
+    # Function to take or renew the reconcile lease. It lasts two intervals, so it
+    # passes to another process only once its holder has stopped renewing it.
+    def _acquire_lease(self, interval):
+        now = datetime.utcnow()
+        try:
+            lease = self.db.leases.find_one_and_update(
+                {'_id': RECONCILE_LEASE, '$or': [{'holder': self._lease_holder}, {'expires_at': {'$lt': now}}]},
+                {'$set': {'holder': self._lease_holder, 'expires_at': now + timedelta(seconds=2 * interval)}},
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another process holds a live lease
+            return False
+        return lease is not None
+
+    def _reconcile_loop(self, interval):
+        while not self._stopped.wait(interval):
+            try:
+                if self._acquire_lease(interval):
+                    self.rebuild()
+            except Exception as e:
+                print(f"Availability reconcile failed: {e}")
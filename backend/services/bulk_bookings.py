@@ -0,0 +1,163 @@
+from datetime import datetime
+from bson import ObjectId
+from backend.services.seat_inventory import release_seats
+from backend.utils.helpers import is_valid_object_id, journey_segment_mask, parse_booking_seats
+from backend.utils.transactions import run_in_transaction
+
+# Largest manifest accepted by /api/bookings/bulk
+MAX_BULK_BOOKINGS = 1000
+
+REQUIRED_FIELDS = ['user_id', 'train_id', 'seats', 'date']
+
+
+# Function to validate a manifest in one pass. Trains and users for the whole
+# manifest are fetched with a single $in query each.
+# Returns (list of (index, booking doc, seats) ready to book, {index: error}).
+def validate_manifest(db, items):
+    errors = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors[index] = 'Booking must be an object'
+            continue
+        missing = [field for field in REQUIRED_FIELDS if field not in item]
+        if missing:
+            errors[index] = f'Missing required field: {missing[0]}'
+        elif not is_valid_object_id(item['train_id']) or not is_valid_object_id(item['user_id']):
+            errors[index] = 'Invalid train_id or user_id'
+        elif item['seats'] == []:
+            errors[index] = 'At least one seat is required'
+        elif parse_booking_seats(item['seats']) is None:
+            errors[index] = 'Seats must be strings like "A1-12"'
+
+    candidates = [(index, item) for index, item in enumerate(items) if index not in errors]
+    train_ids = list({ObjectId(item['train_id']) for _, item in candidates})
+    user_ids = list({ObjectId(item['user_id']) for _, item in candidates})
+    trains = {t['_id']: t for t in db.trains.find(
+        {'_id': {'$in': train_ids}}, {'name': 1, 'stops': 1, 'source': 1, 'destination': 1}
+    )} if train_ids else {}
+    users = {u['_id'] for u in db.users.find({'_id': {'$in': user_ids}}, {'_id': 1})} if user_ids else set()
+
+    valid = []
+    for index, item in candidates:
+        train = trains.get(ObjectId(item['train_id']))
+        if not train:
+            errors[index] = 'Train not found'
+            continue
+        if ObjectId(item['user_id']) not in users:
+            errors[index] = 'User not found'
+            continue
+        try:
+            segments = journey_segment_mask(train, item.get('from'), item.get('to'))
+        except ValueError as e:
+            errors[index] = str(e)
+            continue
+        booking = {
+            'user_id': ObjectId(item['user_id']),
+            'train_id': train['_id'],
+            'train_name': train['name'],
+            'seats': item['seats'],
+            'date': item['date'],
+            'status': 'confirmed',
+            'created_at': datetime.utcnow()
+        }
+        if segments is not None:
+            booking.update({'from': item.get('from'), 'to': item.get('to'), 'segments': segments})
+        valid.append((index, booking, parse_booking_seats(item['seats'])))
+    return valid, errors
+
+
+# Function to reserve seats for and insert a whole manifest.
+# All seat reservations and the insert_many run in one multi-document transaction
+# where the deployment supports it. With all_or_nothing, any failed item cancels
+# the whole manifest; otherwise each item succeeds or fails on its own.
+# With a QuotaAllocator, each item first takes its quota ('quota', default general)
+# with the allocator's atomic decrement, as single bookings do; quota taken by items
+# that end up not booked is given back. With a FareEngine, every booking is priced
+# in one batch before it is stored.
+# Returns one result dict per input item, in order.
+def create_bulk_bookings(db, seat_holds, items, all_or_nothing=False, fares=None, quotas=None):
+    valid, errors = validate_manifest(db, items)
+    if all_or_nothing and errors:
+        valid = []
+
+    # Quota counters are separate atomic documents, taken before the transaction
+    # so that a transaction retry does not take them twice
+    taken = {}
+
+    def give_back(indexes):
+        for index in indexes:
+            train_id, allocations = taken.pop(index)
+            for allocation in allocations:
+                quotas.release(train_id, allocation)
+
+    if quotas is not None:
+        for index, booking, seats in valid:
+            quota_type = items[index].get('quota') or 'general'
+            allocations, error = quotas.allocate_booking(booking['train_id'], seats, quota_type)
+            if error:
+                errors[index] = f'No seats left in the {quota_type} quota'
+                if all_or_nothing:
+                    break
+                continue
+            taken[index] = (booking['train_id'], allocations)
+            if allocations:
+                booking['quota'] = allocations
+        if all_or_nothing and errors:
+            give_back(list(taken))
+            valid = []
+        valid = [entry for entry in valid if entry[0] not in errors]
+    if fares is not None:
+        fares.price_bookings([booking for _, booking, _ in valid])
+
+    def commit(session):
+        conflicts, booked, claimed = {}, [], {}
+        for index, booking, seats in valid:
+            claimed[index] = []
+            failed = seat_holds.confirm(
+                booking['train_id'], seats, holder=str(booking['user_id']),
+                segments=booking.get('segments'), session=session, claimed=claimed[index]
+            )
+            if failed:
+                conflicts[index] = [f'{coach}-{seat}' for coach, seat in failed]
+                if all_or_nothing:
+                    break
+            else:
+                booked.append((index, booking, seats))
+
+        if all_or_nothing and conflicts:
+            # Undo the items already reserved so nothing from this manifest sticks
+            for _, booking, seats in booked:
+                seats_by_coach = {}
+                for coach_number, seat_number in seats:
+                    seats_by_coach.setdefault(coach_number, []).append(seat_number)
+                for coach_number, seat_numbers in seats_by_coach.items():
+                    release_seats(db, booking['train_id'], coach_number, seat_numbers, booking.get('segments'), session)
+            booked = []
+
+        docs = [dict(booking) for _, booking, _ in booked]
+        inserted_ids = db.bookings.insert_many(docs, session=session).inserted_ids if docs else []
+        return conflicts, [index for index, _, _ in booked], inserted_ids, claimed
+
+    try:
+        conflicts, booked_indexes, inserted_ids, claimed = run_in_transaction(db, commit) if valid else ({}, [], [], {})
+    except Exception:
+        give_back(list(taken))
+        raise
+    give_back([index for index in list(taken) if index not in booked_indexes])
+
+    results = [None] * len(items)
+    for index, booking_id in zip(booked_indexes, inserted_ids):
+        results[index] = {'index': index, 'status': 'created', 'booking_id': str(booking_id)}
+        # Quota taken and seats that became occupied, so callers can update availability counts
+        _, allocations = taken.get(index, (None, []))
+        if allocations:
+            results[index]['quota'] = allocations
+        results[index]['claimed'] = claimed[index]
+    for index, seats in conflicts.items():
+        results[index] = {'index': index, 'status': 'failed', 'error': 'Some seats are no longer available', 'seats': seats}
+    for index, error in errors.items():
+        results[index] = {'index': index, 'status': 'failed', 'error': error}
+    for index, result in enumerate(results):
+        if result is None:
+            results[index] = {'index': index, 'status': 'failed', 'error': 'Not booked because another booking in the manifest failed'}
+    return results
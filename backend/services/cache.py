@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import OrderedDict
+
+import bson
+
+# Defaults used when the app config does not set them
+DEFAULT_TTL_SECONDS = 60
+DEFAULT_MAX_ENTRIES = 10000
+
+
+class MemoryCacheBackend:
+    """In-process LRU with a per-entry TTL. Values are shared, not copied,
+    so callers must treat cached documents as read-only."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self.lock:
+            for key in [k for k in self.entries if k.startswith(prefix)]:
+                del self.entries[key]
+
+    def size(self):
+        return len(self.entries)
+
+
+class RedisCacheBackend:
+    """Shared cache for multi-worker deployments, so an invalidation in one
+    worker is seen by all of them. Values are stored BSON-encoded."""
+
+    def __init__(self, url, namespace='railway:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.namespace = namespace
+        self.evictions = 0
+
+    def get(self, key):
+        raw = self.client.get(self.namespace + key)
+        return bson.decode(raw)['v'] if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.namespace + key, bson.encode({'v': value}), ex=max(int(ttl), 1))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.namespace + key for key in keys])
+
+    def delete_prefix(self, prefix):
+        keys = list(self.client.scan_iter(match=f'{self.namespace}{prefix}*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def size(self):
+        return sum(1 for _ in self.client.scan_iter(match=f'{self.namespace}*'))
+
+
+class ReadThroughCache:
+    """Read-through cache with hit/miss counters per key namespace ('train', 'coaches', ...)."""
+
+    def __init__(self, backend, ttl=DEFAULT_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = {}
+        self.misses = {}
+        self.lock = threading.Lock()
+
+    def _count(self, counters, key):
+        namespace = key.split(':', 1)[0]
+        with self.lock:
+            counters[namespace] = counters.get(namespace, 0) + 1
+
+    # Returns the cached value, or calls loader() and caches what it returns.
+    # None results are not cached so a missing document is looked up again.
+    def get_or_load(self, key, loader, ttl=None):
+        value = self.lookup(key)
+        if value is None:
+            value = loader()
+            self.store(key, value, ttl)
+        return value
+
+    # The two halves of get_or_load, for callers whose loader has to be awaited
+    def lookup(self, key):
+        value = self.backend.get(key)
+        self._count(self.hits if value is not None else self.misses, key)
+        return value
+
+    def store(self, key, value, ttl=None):
+        if value is not None:
+            self.backend.set(key, value, ttl or self.ttl)
+
+    def invalidate(self, *keys):
+        self.backend.delete(*keys)
+
+    def invalidate_prefix(self, prefix):
+        self.backend.delete_prefix(prefix)
+
+    def stats(self):
+        with self.lock:
+            hits, misses = dict(self.hits), dict(self.misses)
+        total_hits, total_misses = sum(hits.values()), sum(misses.values())
+        lookups = total_hits + total_misses
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': self.backend.size(),
+            'evictions': self.backend.evictions,
+            'hits': total_hits,
+            'misses': total_misses,
+            'hit_ratio': round(total_hits / lookups, 4) if lookups else None,
+            'by_namespace': {
+                namespace: {'hits': hits.get(namespace, 0), 'misses': misses.get(namespace, 0)}
+                for namespace in sorted(set(hits) | set(misses))
+            }
+        }
+
+
+# Function to build the app cache from config (CACHE_BACKEND = 'memory' or 'redis')
+def build_cache(config):
+    ttl = config.get('CACHE_TTL_SECONDS') or DEFAULT_TTL_SECONDS
+    if config.get('CACHE_BACKEND') == 'redis' and config.get('REDIS_URL'):
+        try:
+            return ReadThroughCache(RedisCacheBackend(config['REDIS_URL']), ttl=ttl)
+        except ImportError:
+            print("CACHE_BACKEND=redis but the redis package is not installed; using the in-process cache.")
+    return ReadThroughCache(MemoryCacheBackend(config.get('CACHE_MAX_ENTRIES') or DEFAULT_MAX_ENTRIES), ttl=ttl)
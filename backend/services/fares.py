@@ -0,0 +1,199 @@
+import threading
+import time
+import numpy as np
+from pymongo import ReturnDocument
+from backend.utils.helpers import route_stops
+
+# Fare per km per seat (₹), the rate the admin report has always used
+DEFAULT_RATE_PER_KM = 10
+# Seconds between checks for trains added by other workers
+FARE_REFRESH_SECONDS = 5
+# Least seconds between checks made because a booking named a train not in the tables
+UNKNOWN_TRAIN_REFRESH_SECONDS = 1
+# Counter document whose seq is the timetable version of the newest train
+TIMETABLE_COUNTER = 'timetable'
+
+# Train fields needed to build the fare tables
+FARE_PROJECTION = {'source': 1, 'destination': 1, 'stops': 1, 'stop_km': 1, 'distance': 1, 'timetable_version': 1}
+# Station pairs are keyed by origin index * PAIR_KEY + destination index
+PAIR_KEY = np.int64(1 << 32)
+
+
+# Function to work out the km from the first stop to each stop of a train.
+# Uses the train's stop_km when present; otherwise the route distance is spread
+# evenly over the stops. Returns None when the train has no usable distance.
+def cumulative_km(train):
+    stops = route_stops(train)
+    stop_km = train.get('stop_km')
+    if isinstance(stop_km, list) and len(stop_km) == len(stops):
+        return np.asarray(stop_km, dtype=np.float64)
+    distance = train.get('distance')
+    if distance is None or not str(distance).replace('.', '', 1).isdigit():
+        return None
+    return np.linspace(0, float(distance), len(stops))
+
+
+# Function to keep the shortest km of each station pair.
+# Returns (keys, km) sorted by key with one entry per pair.
+def merge_pairs(keys, km):
+    order = np.lexsort((km, keys))
+    keys, km = keys[order], km[order]
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    return keys[first], km[first]
+
+
+class FareEngine:
+    """Station-pair distance and fare tables, built from the timetable.
+
+    Every station gets an integer index. Only the pairs some train serves are
+    stored: sorted pair keys with the shortest distance any train covers between
+    them and the per-seat fare, so a whole batch of bookings is priced with one
+    vectorised search and no train documents read per booking.
+
+    Trains added later are merged in without a rebuild. Each new train takes the
+    next timetable version from the `counters` collection; every worker checks
+    that counter every FARE_REFRESH_SECONDS (sooner for a train it does not know)
+    and loads only the trains above the version it has.
+    """
+
+    def __init__(self, db, rate_per_km=DEFAULT_RATE_PER_KM, refresh_seconds=FARE_REFRESH_SECONDS):
+        self.db = db
+        self.rate_per_km = rate_per_km
+        self.refresh_seconds = refresh_seconds
+        self.stations = {}
+        self.train_routes = {}
+        self.pair_keys = np.empty(0, dtype=np.int64)
+        self.pair_km = np.empty(0, dtype=np.float32)
+        self.pair_fares = np.empty(0, dtype=np.float32)
+        # Every version up to this one is loaded; later ones seen so far are kept apart
+        self.version = 0
+        self._later_versions = set()
+        self._checked_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    # Build the tables from the whole trains collection
+    def load(self):
+        with self._lock:
+            self.stations, self.train_routes = {}, {}
+            self.pair_keys = np.empty(0, dtype=np.int64)
+            self.pair_km = np.empty(0, dtype=np.float32)
+            self.pair_fares = np.empty(0, dtype=np.float32)
+            self.version, self._later_versions = 0, set()
+        self.add_trains(list(self.db.trains.find({}, FARE_PROJECTION)))
+        self._checked_at = time.monotonic()
+        return self
+
+    # Function to take the timetable version for a train about to be inserted
+    def next_version(self):
+        counter = self.db.counters.find_one_and_update(
+            {'_id': TIMETABLE_COUNTER}, {'$inc': {'seq': 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return counter['seq']
+
+    # Merge trains into the tables; pairs they serve keep the shorter distance
+    def add_trains(self, trains):
+        with self._lock:
+            stations, train_routes = dict(self.stations), dict(self.train_routes)
+            keys, km = [self.pair_keys], [self.pair_km]
+            for train in trains:
+                stops = route_stops(train)
+                if None in stops:
+                    continue
+                for stop in stops:
+                    stations.setdefault(stop, len(stations))
+                index = np.fromiter((stations[stop] for stop in stops), dtype=np.int64, count=len(stops))
+                train_routes[train['_id']] = (index[0], index[-1])
+                offsets = cumulative_km(train)
+                if offsets is None:
+                    continue
+                # Every ordered pair of stops on this route
+                keys.append((index[:, None] * PAIR_KEY + index[None, :]).ravel())
+                km.append(np.abs(offsets[None, :] - offsets[:, None]).astype(np.float32).ravel())
+            pair_keys, pair_km = merge_pairs(np.concatenate(keys), np.concatenate(km))
+            self.stations, self.train_routes = stations, train_routes
+            self.pair_keys, self.pair_km, self.pair_fares = pair_keys, pair_km, np.round(pair_km * self.rate_per_km)
+        self._advance(train['timetable_version'] for train in trains if train.get('timetable_version'))
+        return self
+
+    def _advance(self, versions):
+        with self._lock:
+            self._later_versions.update(v for v in versions if v > self.version)
+            while self.version + 1 in self._later_versions:
+                self.version += 1
+                self._later_versions.discard(self.version)
+
+    # Load trains other workers added since the last check, at most once per `max_age` seconds
+    def refresh(self, max_age=None):
+        max_age = self.refresh_seconds if max_age is None else max_age
+        if time.monotonic() - self._checked_at < max_age or not self._refresh_lock.acquire(blocking=False):
+            return self
+        try:
+            self._checked_at = time.monotonic()
+            counter = self.db.counters.find_one({'_id': TIMETABLE_COUNTER}) or {}
+            if counter.get('seq', 0) > self.version:
+                self.add_trains([
+                    train for train in self.db.trains.find({'timetable_version': {'$gt': self.version}}, FARE_PROJECTION)
+                    if train['timetable_version'] not in self._later_versions
+                ])
+        finally:
+            self._refresh_lock.release()
+        return self
+
+    # Per-seat fare and distance between two stations, or (None, None) if unknown
+    def quote(self, source, destination):
+        priced = self.price_journeys([(None, source, destination, 1)])[0]
+        return (priced['fare_per_seat'], priced['distance']) if priced else (None, None)
+
+    # Function to price many journeys in one vectorised pass.
+    # `journeys` is a list of (train_id, from, to, seats); a missing from/to falls
+    # back to the train's own source/destination. Returns one
+    # {'distance', 'fare_per_seat', 'price'} per journey, or None if it cannot be priced.
+    def price_journeys(self, journeys):
+        unknown = any(train_id is not None and train_id not in self.train_routes for train_id, _, _, _ in journeys)
+        self.refresh(UNKNOWN_TRAIN_REFRESH_SECONDS if unknown else None)
+        with self._lock:
+            stations, train_routes = self.stations, self.train_routes
+            pair_keys, pair_km, pair_fares = self.pair_keys, self.pair_km, self.pair_fares
+        count = len(journeys)
+        origin = np.full(count, -1, dtype=np.int64)
+        target = np.full(count, -1, dtype=np.int64)
+        seats = np.zeros(count, dtype=np.int64)
+        for n, (train_id, source, destination, seat_count) in enumerate(journeys):
+            route = train_routes.get(train_id, (-1, -1))
+            origin[n] = stations.get(source, -1) if source else route[0]
+            target[n] = stations.get(destination, -1) if destination else route[1]
+            seats[n] = seat_count
+
+        # Find each journey's pair among the sorted keys
+        keys = origin * PAIR_KEY + target
+        slot = np.searchsorted(pair_keys, keys)
+        found = slot < len(pair_keys)
+        found[found] = pair_keys[slot[found]] == keys[found]
+        known = (origin >= 0) & (target >= 0) & found
+        distance = np.full(count, np.nan, dtype=np.float32)
+        per_seat = np.full(count, np.nan, dtype=np.float32)
+        distance[known] = pair_km[slot[known]]
+        per_seat[known] = pair_fares[slot[known]]
+        total = per_seat * seats
+
+        return [
+            None if np.isnan(per_seat[n]) else {
+                'distance': int(round(float(distance[n]))),
+                'fare_per_seat': int(per_seat[n]),
+                'price': int(total[n])
+            }
+            for n in range(count)
+        ]
+
+    # Function to price booking documents in place (sets distance, fare_per_seat and price)
+    def price_bookings(self, bookings):
+        journeys = [
+            (b.get('train_id'), b.get('from'), b.get('to'), len(b['seats']) if isinstance(b.get('seats'), list) else 1)
+            for b in bookings
+        ]
+        for booking, priced in zip(bookings, self.price_journeys(journeys)):
+            if priced:
+                booking.update(priced)
+        return bookings
@@ -0,0 +1,199 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from backend.utils.data_access import call, find_one, insert_one, run
+
+# Minimum seconds between two OTPs sent to the same phone
+OTP_THROTTLE_SECONDS = 30
+# OTP request records are kept this long for status lookups, then expire
+OTP_RECORD_TTL_SECONDS = 3600
+# HTTP connections kept open to the Twilio API, shared by all threads
+TWILIO_POOL_SIZE = 16
+
+
+class TwilioBackend:
+    """SMS and Verify calls through one Twilio client per process.
+
+    The client's HTTP session keeps a pool of keep-alive connections, so calls
+    after the first skip the TCP and TLS handshakes.
+    """
+
+    def __init__(self, account_sid, auth_token, verify_sid=None, from_number=None,
+                 pool_size=TWILIO_POOL_SIZE, timeout=10):
+        from requests.adapters import HTTPAdapter
+        from twilio.http.http_client import TwilioHttpClient
+        from twilio.rest import Client
+        http_client = TwilioHttpClient(pool_connections=True, timeout=timeout)
+        http_client.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.client = Client(account_sid, auth_token, http_client=http_client)
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.timeout = timeout
+        self.verify_sid = verify_sid
+        self.from_number = from_number
+        self._async_client = None
+
+    @property
+    def verification_enabled(self):
+        return bool(self.verify_sid)
+
+    def send(self, to, body):
+        return self.client.messages.create(body=body, from_=self.from_number, to=to).sid
+
+    # Returns the Twilio verification status ('pending' once the code is sent)
+    def start_verification(self, to):
+        return self.client.verify.v2.services(self.verify_sid).verifications.create(to=to, channel='sms').status
+
+    # Returns the Twilio verification status ('approved' if the code matches)
+    def check_verification(self, to, code):
+        return self.client.verify.v2.services(self.verify_sid).verification_checks.create(to=to, code=code).status
+
+    # check_verification for the ASGI app: awaits Twilio on the event loop through a
+    # second client with an aiohttp session, created on first use inside the loop
+    async def check_verification_async(self, to, code):
+        if self._async_client is None:
+            from twilio.http.async_http_client import AsyncTwilioHttpClient
+            from twilio.rest import Client
+            self._async_client = Client(
+                self.account_sid, self.auth_token, http_client=AsyncTwilioHttpClient(timeout=self.timeout)
+            )
+        check = await self._async_client.verify.v2.services(self.verify_sid).verification_checks.create_async(
+            to=to, code=code
+        )
+        return check.status
+
+
+class StubBackend:
+    """Offline backend for load tests and local development: records messages
+    instead of sending them, with optional latency and failure injection.
+
+    OTP verification approves `otp_code`; without one, OTP login is disabled.
+    """
+
+    def __init__(self, latency=0.0, fail_every=0, max_recorded=10000, otp_code=None):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.otp_code = otp_code
+        self.sent = deque(maxlen=max_recorded)
+        self.attempts = 0
+        self._lock = threading.Lock()
+
+    @property
+    def verification_enabled(self):
+        return self.otp_code is not None
+
+    def send(self, to, body):
+        with self._lock:
+            self.attempts += 1
+            attempt = self.attempts
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail_every and attempt % self.fail_every == 0:
+            raise RuntimeError('Injected send failure')
+        with self._lock:
+            self.sent.append((to, body))
+        return f'stub-{attempt}'
+
+    def start_verification(self, to):
+        self.send(to, f'Your verification code is {self.otp_code}')
+        return 'pending'
+
+    def check_verification(self, to, code):
+        if self.latency:
+            time.sleep(self.latency)
+        return 'approved' if code == self.otp_code else 'pending'
+
+    async def check_verification_async(self, to, code):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return 'approved' if code == self.otp_code else 'pending'
+
+
+class MessagingService:
+    """App-scoped messaging: one backend and one worker pool per process.
+
+    OTP sends are recorded in `otp_requests` and handed to the pool, so the
+    request returns a tracking id straight away instead of waiting on Twilio.
+    """
+
+    def __init__(self, db, backend, max_workers=8, throttle_seconds=OTP_THROTTLE_SECONDS):
+        self.db = db
+        self.backend = backend
+        self.throttle_seconds = throttle_seconds
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='otp-send')
+
+    @property
+    def otp_enabled(self):
+        return self.backend.verification_enabled
+
+    # Queues an OTP for `phone`. Returns (tracking_id, None), or (None, seconds
+    # to wait) if an OTP was sent to this phone less than throttle_seconds ago.
+    def send_otp(self, phone):
+        return run(self.send_otp_steps(phone), self.db)
+
+    # send_otp as data-access steps, so the ASGI app can run it with Motor
+    def send_otp_steps(self, phone):
+        now = datetime.utcnow()
+        recent = yield find_one(
+            'otp_requests',
+            {'phone': phone, 'created_at': {'$gt': now - timedelta(seconds=self.throttle_seconds)}},
+            {'created_at': 1}, sort=[('created_at', -1)]
+        )
+        if recent:
+            elapsed = (now - recent['created_at']).total_seconds()
+            return None, max(int(self.throttle_seconds - elapsed), 1)
+        result = yield insert_one('otp_requests', {'phone': phone, 'status': 'queued', 'created_at': now})
+        self._pool.submit(self._deliver, result.inserted_id, phone)
+        return result.inserted_id, None
+
+    def get_otp_request(self, tracking_id):
+        return run(self.get_otp_request_steps(tracking_id), self.db)
+
+    def get_otp_request_steps(self, tracking_id):
+        return (yield find_one('otp_requests', {'_id': tracking_id}, {'phone': 0}))
+
+    # Verification needs the answer before responding; the sync app waits on the
+    # pooled client, the ASGI app awaits the backend's async variant
+    def verify_otp(self, phone, code):
+        return run(self.verify_otp_steps(phone, code), self.db)
+
+    def verify_otp_steps(self, phone, code):
+        status = yield call(
+            self.backend.check_verification, phone, code,
+            async_func=getattr(self.backend, 'check_verification_async', None)
+        )
+        return status == 'approved'
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+    def _deliver(self, tracking_id, phone):
+        try:
+            status = self.backend.start_verification(phone)
+            update = {'status': 'sent', 'provider_status': status}
+        except Exception as e:
+            update = {'status': 'failed', 'error': str(e)}
+        update['finished_at'] = datetime.utcnow()
+        self.db.otp_requests.update_one({'_id': tracking_id}, {'$set': update})
+
+
+# Function to pick the messaging backend from app config (SMS_BACKEND = 'twilio' or 'stub').
+# Without Twilio credentials SMS goes to a stub that only records messages and
+# OTP login is reported as not configured. The stub only approves OTPs when
+# STUB_OTP_CODE is set explicitly.
+def build_messaging_backend(config):
+    backend = config.get('SMS_BACKEND') or 'twilio'
+    if backend == 'stub':
+        return StubBackend(latency=config.get('STUB_LATENCY_SECONDS') or 0.0, otp_code=config.get('STUB_OTP_CODE') or None)
+    if config.get('TWILIO_ACCOUNT_SID') and config.get('TWILIO_AUTH_TOKEN'):
+        return TwilioBackend(
+            config['TWILIO_ACCOUNT_SID'], config['TWILIO_AUTH_TOKEN'],
+            verify_sid=config.get('TWILIO_VERIFY_SID'),
+            from_number=config.get('TWILIO_FROM_NUMBER') or '+12345678901',
+            pool_size=config.get('TWILIO_POOL_SIZE') or TWILIO_POOL_SIZE
+        )
+    print("Twilio is not configured; SMS notifications will only be logged locally.")
+    return StubBackend()
@@ -0,0 +1,176 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+# Users whose phones are fetched per $in query
+RECIPIENT_BATCH_SIZE = 1000
+# Failed sends kept on the job record for debugging
+MAX_JOB_ERRORS = 20
+# A running job whose heartbeat is older than this is taken to have died with its process
+JOB_STALE_SECONDS = 300
+# Seconds between checks for queued and stale running jobs (0 disables)
+JOB_SWEEP_SECONDS = 60
+
+
+class RateLimiter:
+    """Thread-safe token bucket: at most `rate` acquisitions per second."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class NotificationDispatcher:
+    """Fans passenger notifications out to a bounded worker pool.
+
+    Each fan-out is recorded in `notification_jobs` before the request returns,
+    then processed in the background: phones are fetched in bulk, deduplicated
+    per user, and sent through the app's messaging backend with rate limiting
+    and retries. Every finished recipient is added to the job's `done` list and
+    refreshes its heartbeat. A sweeper thread in every process looks for jobs
+    left queued or running by a dead process; a running job is taken over once
+    its heartbeat is stale and only sends to the recipients still missing.
+    """
+
+    def __init__(self, db, sender, max_workers=8, rate_per_second=20, max_retries=3, backoff_seconds=0.5,
+                 stale_seconds=JOB_STALE_SECONDS):
+        self.db = db
+        self.sender = sender
+        self.stale_seconds = stale_seconds
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.rate_limiter = RateLimiter(rate_per_second) if rate_per_second else None
+        # Jobs and individual sends use separate pools so a job waiting on its
+        # sends can never starve them of workers
+        self._jobs = ThreadPoolExecutor(max_workers=2, thread_name_prefix='notify-job')
+        self._sends = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='notify-send')
+        self._stopped = threading.Event()
+        self._sweeper = None
+
+    # Records the job and schedules it; returns the job id straight away
+    def submit_route_deviation(self, train, alert_id, message):
+        job = {
+            'type': 'route_deviation',
+            'train_id': train['_id'],
+            'alert_id': alert_id,
+            'body': f"Alert for {train.get('name', '')}: {message}",
+            'status': 'queued',
+            'total': 0,
+            'sent': 0,
+            'failed': 0,
+            'errors': [],
+            'done': [],
+            'created_at': datetime.utcnow()
+        }
+        job_id = self.db.notification_jobs.insert_one(job).inserted_id
+        self._jobs.submit(self._run, job_id)
+        return job_id
+
+    # Schedule every job that is queued or whose owner stopped refreshing its heartbeat.
+    # _run claims each job atomically, so a job found by several processes runs once.
+    def resume_pending(self):
+        stale = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        for job in self.db.notification_jobs.find(
+            {'$or': [{'status': 'queued'}, {'status': 'running', 'heartbeat_at': {'$lt': stale}}]}, {'_id': 1}
+        ):
+            self._jobs.submit(self._run, job['_id'])
+
+    # Start the background job that calls resume_pending every `interval` seconds
+    def start_sweeper(self, interval=JOB_SWEEP_SECONDS):
+        if interval <= 0 or self._sweeper is not None:
+            return
+        self._sweeper = threading.Thread(target=self._sweep_loop, args=(interval,), name='notify-sweep', daemon=True)
+        self._sweeper.start()
+
+    def _sweep_loop(self, interval):
+        while not self._stopped.wait(interval):
+            try:
+                self.resume_pending()
+            except Exception as e:
+                print(f"Notification job sweep failed: {e}")
+
+    # The job record without its (possibly long) list of finished recipients
+    def get_job(self, job_id):
+        return self.db.notification_jobs.find_one({'_id': job_id}, {'done': 0})
+
+    def shutdown(self, wait=True):
+        self._stopped.set()
+        self._jobs.shutdown(wait=wait)
+        self._sends.shutdown(wait=wait)
+
+    # Unique phone numbers of every passenger with a confirmed booking on the train
+    def recipients(self, train_id):
+        user_ids = self.db.bookings.distinct('user_id', {'train_id': train_id, 'status': 'confirmed'})
+        phones = set()
+        for start in range(0, len(user_ids), RECIPIENT_BATCH_SIZE):
+            batch = user_ids[start:start + RECIPIENT_BATCH_SIZE]
+            for user in self.db.users.find({'_id': {'$in': batch}, 'phone': {'$nin': [None, '']}}, {'phone': 1}):
+                phones.add(user['phone'])
+        return sorted(phones)
+
+    def send_with_retry(self, to, body):
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            try:
+                self.sender.send(to, body)
+                return None
+            except Exception as e:
+                error = str(e)
+                if attempt < self.max_retries:
+                    time.sleep(self.backoff_seconds * (2 ** attempt))
+        return error
+
+    # Records one finished recipient and refreshes the job's heartbeat
+    def _deliver(self, job_id, phone, body):
+        error = self.send_with_retry(phone, body)
+        update = {'$push': {'done': phone}, '$inc': {'failed' if error else 'sent': 1},
+                  '$set': {'heartbeat_at': datetime.utcnow()}}
+        if error:
+            update['$push']['errors'] = {'$each': [{'to': phone, 'error': error}], '$slice': MAX_JOB_ERRORS}
+        self.db.notification_jobs.update_one({'_id': job_id}, update)
+
+    def _run(self, job_id):
+        now = datetime.utcnow()
+        job = self.db.notification_jobs.find_one_and_update(
+            {'_id': job_id, '$or': [
+                {'status': 'queued'},
+                {'status': 'running', 'heartbeat_at': {'$lt': now - timedelta(seconds=self.stale_seconds)}}
+            ]},
+            {'$set': {'status': 'running', 'started_at': now, 'heartbeat_at': now}, '$inc': {'attempts': 1}}
+        )
+        if not job:
+            return  # already picked up by another worker
+        try:
+            phones = self.recipients(job['train_id'])
+            self.db.notification_jobs.update_one(
+                {'_id': job_id}, {'$set': {'total': len(phones), 'heartbeat_at': datetime.utcnow()}}
+            )
+            # Recipients finished by an earlier attempt are not sent to again
+            done = set(job.get('done') or [])
+            pending = [phone for phone in phones if phone not in done]
+            list(self._sends.map(lambda phone: self._deliver(job_id, phone, job['body']), pending))
+            self.db.notification_jobs.update_one({'_id': job_id}, {'$set': {
+                'status': 'completed', 'finished_at': datetime.utcnow()
+            }})
+        except Exception as e:
+            self.db.notification_jobs.update_one({'_id': job_id}, {'$set': {
+                'status': 'failed', 'finished_at': datetime.utcnow()
+            }, '$push': {'errors': {'$each': [{'error': str(e)}], '$slice': MAX_JOB_ERRORS}}})
@@ -0,0 +1,56 @@
+import numpy as np
+from backend.utils.helpers import SEAT_WORD_BITS
+
+# Largest coach the inventory formats are used with
+MAX_COACH_SEATS = 200
+
+
+# Function to validate a train's consist: a list of {'coach_number', 'coach_type', 'total_seats'}.
+# Returns the coaches in order or raises ValueError.
+def parse_consist(consist):
+    if not isinstance(consist, list) or not consist:
+        raise ValueError('consist must be a non-empty list of coaches')
+    coaches, numbers = [], set()
+    for coach in consist:
+        if not isinstance(coach, dict) or not coach.get('coach_number'):
+            raise ValueError('Every coach needs a coach_number')
+        total_seats = coach.get('total_seats')
+        if not isinstance(total_seats, int) or not 0 < total_seats <= MAX_COACH_SEATS:
+            raise ValueError(f'total_seats must be between 1 and {MAX_COACH_SEATS}')
+        if coach['coach_number'] in numbers:
+            raise ValueError(f'Duplicate coach_number: {coach["coach_number"]}')
+        numbers.add(coach['coach_number'])
+        coaches.append({
+            'coach_number': coach['coach_number'],
+            'coach_type': coach.get('coach_type') or 'general',
+            'total_seats': total_seats
+        })
+    return coaches
+
+
+# Function to build the empty inventory of every coach of a consist in one pass.
+# Returns one template per coach: its fields plus an all-free seat_bits (or
+# segment_bits, one counter per seat). Seat types are not stored: they come
+# from the per-type layout tables (helpers.seat_layout).
+def inventory_templates(consist, segment_aware=False):
+    totals = np.array([coach['total_seats'] for coach in consist])
+    words = (totals + SEAT_WORD_BITS - 1) // SEAT_WORD_BITS
+    templates = []
+    for coach, total_seats, word_count in zip(consist, totals.tolist(), words.tolist()):
+        template = dict(coach)
+        if segment_aware:
+            template['segment_bits'] = [0] * total_seats
+        else:
+            template['seat_bits'] = [0] * word_count
+        templates.append(template)
+    return templates
+
+
+# Function to create the coaches of a train from a consist with one insert_many, unless it has some.
+# Returns the coach documents created.
+def create_coaches(db, train_id, consist, segment_aware=False):
+    if db.coaches.find_one({'train_id': train_id}, {'_id': 1}):
+        return []
+    documents = [dict(template, train_id=train_id) for template in inventory_templates(consist, segment_aware)]
+    db.coaches.insert_many(documents)
+    return documents
@@ -0,0 +1,168 @@
+import random
+from datetime import datetime
+from pymongo import ReturnDocument
+
+# Quota types in fallback order: a request for one type also tries every type after it
+DEFAULT_FALLBACK_ORDER = ['premium_tatkal', 'tatkal', 'general']
+
+
+# Function to parse QUOTA_FALLBACK_ORDER ('premium_tatkal,tatkal,general') from config
+def parse_fallback_order(value):
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [q.strip() for q in (value or '').split(',') if q.strip()] or list(DEFAULT_FALLBACK_ORDER)
+
+
+# Function to split a seat count as evenly as possible over `shards` counters
+def split_seats(seats, shards):
+    return [seats // shards + (1 if k < seats % shards else 0) for k in range(shards)]
+
+
+# Function to add up the shard counters of a coach's quotas, one entry per quota type
+def summarise_quotas(docs):
+    quotas = {}
+    for doc in docs:
+        quota = quotas.setdefault(doc['quota_type'], {
+            'quota_type': doc['quota_type'], 'total_seats': 0, 'available_seats': 0,
+            'shards': 0, 'updated_at': doc.get('updated_at')
+        })
+        quota['total_seats'] += doc.get('total_seats', 0)
+        quota['available_seats'] += doc.get('available_seats', 0)
+        quota['shards'] += 1
+        quota['updated_at'] = max(filter(None, [quota['updated_at'], doc.get('updated_at')]), default=None)
+    return list(quotas.values())
+
+
+class QuotaAllocator:
+    """Consumes quota seats with one atomic, guarded decrement per attempt.
+
+    Each quota is one document per (train, coach, quota type, shard). A booking
+    takes seats with find_one_and_update({available_seats: {$gte: n}}, {$inc: -n}),
+    so concurrent requests can never drive a counter below zero. Hot quotas
+    (tatkal at opening time) can be split over several shard documents; requests
+    start on a random shard so they do not all queue on the same document.
+    """
+
+    def __init__(self, db, fallback_order=None):
+        self.db = db
+        self.fallback_order = parse_fallback_order(fallback_order)
+
+    # Quota types tried, in order, for a request for `quota_type`
+    def candidates(self, quota_type):
+        if quota_type in self.fallback_order:
+            return self.fallback_order[self.fallback_order.index(quota_type):]
+        return [quota_type]
+
+    # Set a quota's seats, spread over `shards` counter documents.
+    # Returns the change in the quota's available seats.
+    def set_quota(self, train_id, coach_number, quota_type, total_seats, available_seats, shards=1):
+        key = {'train_id': train_id, 'coach_number': coach_number, 'quota_type': quota_type}
+        now = datetime.utcnow()
+        previous = sum(doc.get('available_seats', 0) for doc in self.db.quotas.find(key, {'available_seats': 1}))
+        for shard, (total, available) in enumerate(zip(split_seats(total_seats, shards), split_seats(available_seats, shards))):
+            self.db.quotas.update_one(
+                dict(key, shard=shard),
+                {'$set': {'total_seats': total, 'available_seats': available, 'shards': shards, 'updated_at': now}},
+                upsert=True
+            )
+        # Counters left over from an earlier, larger shard count (or legacy unsharded documents)
+        self.db.quotas.delete_many(dict(key, shard={'$not': {'$in': list(range(shards))}}))
+        return available_seats - previous
+
+    # Quotas of a coach with the shard counters added up, one entry per quota type
+    def summary(self, train_id, coach_number):
+        return summarise_quotas(self.db.quotas.find({'train_id': train_id, 'coach_number': coach_number}))
+
+    # Try to take `seats` seats from one shard of one quota type.
+    # Returns the shard number taken from, or None if the quota cannot cover them.
+    def _take(self, train_id, coach_number, quota_type, seats, shards):
+        query = {'train_id': train_id, 'coach_number': coach_number, 'quota_type': quota_type,
+                 'available_seats': {'$gte': seats}}
+        update = {'$inc': {'available_seats': -seats}, '$set': {'updated_at': datetime.utcnow()}}
+        # Random shard first to spread contention, then any shard that still has room
+        attempts = [dict(query, shard=random.randrange(shards)), query] if shards > 1 else [query]
+        for attempt in attempts:
+            doc = self.db.quotas.find_one_and_update(
+                attempt, update, projection={'shard': 1}, return_document=ReturnDocument.AFTER
+            )
+            if doc:
+                return doc.get('shard', 0)
+        return None
+
+    # Take `seats` seats spread over several shards of one quota type, for a party no
+    # single shard has room for. Each part is its own guarded decrement; if the shards
+    # together cannot cover the party, the parts already taken are given back.
+    # Returns [(shard, seats)] or None.
+    def _take_split(self, train_id, coach_number, quota_type, seats):
+        key = {'train_id': train_id, 'coach_number': coach_number, 'quota_type': quota_type}
+        parts, remaining = [], seats
+        for doc in self.db.quotas.find(dict(key, available_seats={'$gt': 0}), {'shard': 1, 'available_seats': 1}):
+            count = min(doc['available_seats'], remaining)
+            if self.db.quotas.find_one_and_update(
+                dict(key, shard=doc.get('shard'), available_seats={'$gte': count}),
+                {'$inc': {'available_seats': -count}, '$set': {'updated_at': datetime.utcnow()}}
+            ):
+                parts.append((doc.get('shard', 0), count))
+                remaining -= count
+            if not remaining:
+                return parts
+        for shard, count in parts:
+            self.release(train_id, {'coach_number': coach_number, 'quota_type': quota_type, 'shard': shard, 'seats': count})
+        return None
+
+    # Function to allocate `seats` seats on a coach, trying `quota_type` and its fallbacks.
+    # Returns ([{'coach_number', 'quota_type', 'shard', 'seats'}], None) on success: one
+    # allocation per shard taken from, usually just one. Returns ([], None) when the coach
+    # has no quotas configured (seats are unrestricted), or ([], 'quota_exhausted').
+    def allocate(self, train_id, coach_number, seats, quota_type='general'):
+        types = self.candidates(quota_type)
+        # Shard 0 of each quota records how many shards it has
+        shard_counts = {
+            doc['quota_type']: doc.get('shards', 1)
+            for doc in self.db.quotas.find(
+                {'train_id': train_id, 'coach_number': coach_number, 'quota_type': {'$in': types},
+                 'shard': {'$in': [0, None]}},
+                {'quota_type': 1, 'shards': 1}
+            )
+        }
+        for candidate in types:
+            if candidate not in shard_counts:
+                continue
+            shard = self._take(train_id, coach_number, candidate, seats, shard_counts[candidate])
+            parts = [(shard, seats)] if shard is not None else None
+            if parts is None and shard_counts[candidate] > 1:
+                parts = self._take_split(train_id, coach_number, candidate, seats)
+            if parts:
+                return [
+                    {'coach_number': coach_number, 'quota_type': candidate, 'shard': shard, 'seats': count}
+                    for shard, count in parts
+                ], None
+        if not shard_counts and not self.db.quotas.find_one({'train_id': train_id, 'coach_number': coach_number}, {'_id': 1}):
+            return [], None
+        return [], 'quota_exhausted'
+
+    # Give seats back to the shard they were taken from (cancellation or a failed booking)
+    def release(self, train_id, allocation):
+        # Shard 0 also matches quotas written before counters were sharded
+        shard = allocation['shard'] if allocation['shard'] else {'$in': [0, None]}
+        self.db.quotas.update_one(
+            {'train_id': train_id, 'coach_number': allocation['coach_number'],
+             'quota_type': allocation['quota_type'], 'shard': shard},
+            {'$inc': {'available_seats': allocation['seats']}, '$set': {'updated_at': datetime.utcnow()}}
+        )
+
+    # Function to allocate quota for every coach of a booking, all or nothing.
+    # `seats` is a list of (coach_number, seat_number). Returns (allocations, error).
+    def allocate_booking(self, train_id, seats, quota_type='general'):
+        per_coach = {}
+        for coach_number, _ in seats:
+            per_coach[coach_number] = per_coach.get(coach_number, 0) + 1
+        allocations = []
+        for coach_number, count in per_coach.items():
+            taken, error = self.allocate(train_id, coach_number, count, quota_type)
+            if error:
+                for allocation in allocations:
+                    self.release(train_id, allocation)
+                return [], error
+            allocations.extend(taken)
+        return allocations, None
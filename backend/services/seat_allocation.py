@@ -0,0 +1,191 @@
+from datetime import datetime
+import numpy as np
+from backend.services.segment_availability import AVAILABILITY_PROJECTION, coach_occupancy
+from backend.utils.helpers import DEFAULT_SEAT_TYPE, FULL_ROUTE_MASK, SEAT_TYPE_CYCLES, seat_layout
+
+# Largest party one allocation request may seat
+MAX_PARTY_SIZE = 6
+# How close together a party must sit, strictest first: consecutive seat numbers,
+# one bay (a compartment of the berth cycle), one coach, or anywhere on the train
+KEEP_TOGETHER = ('adjacent', 'bay', 'coach', 'none')
+# Searches retried when another passenger holds a chosen seat first
+ALLOCATION_ATTEMPTS = 3
+# Berth types a preference may name, indexed by the codes used in the seat index
+BERTH_TYPES = sorted({seat_type for cycle in SEAT_TYPE_CYCLES.values() for seat_type in cycle} | {DEFAULT_SEAT_TYPE})
+BERTH_CODES = {seat_type: code for code, seat_type in enumerate(BERTH_TYPES)}
+
+
+class SeatIndex:
+    """Free seats of a train as flat arrays: one entry per seat of every coach,
+    with its coach, seat number and berth code. Built from one coach query and
+    one seat hold query; free seats are found in a single vectorised pass."""
+
+    def __init__(self, coaches, held, segments=None):
+        self.coaches = [coach['coach_number'] for coach in coaches]
+        self.bay_sizes = [len(SEAT_TYPE_CYCLES.get(coach.get('coach_type'), ())) for coach in coaches]
+        occupancy = [coach_occupancy(coach) for coach in coaches]
+        sizes = [len(seats) for seats in occupancy]
+        self.coach_of = np.repeat(np.arange(len(coaches)), sizes)
+        self.seat_number = np.concatenate([np.arange(1, size + 1) for size in sizes]) if coaches else np.zeros(0, int)
+        self.berth = np.array([
+            BERTH_CODES[seat_type]
+            for coach, size in zip(coaches, sizes) for seat_type in seat_layout(coach.get('coach_type'), size)
+        ], dtype=int)
+        free = (np.concatenate(occupancy) & np.uint64(segments or FULL_ROUTE_MASK)) == 0 if coaches else np.zeros(0, bool)
+        positions = {(coach, seat): n for n, (coach, seat) in enumerate(zip(self.coach_of.tolist(), self.seat_number.tolist()))}
+        coach_index = {number: k for k, number in enumerate(self.coaches)}
+        for coach_number, seat_number in held:
+            n = positions.get((coach_index.get(coach_number), int(seat_number) if str(seat_number).isdigit() else None))
+            if n is not None:
+                free[n] = False
+        self.free = free
+
+    # Yields (coach position, free seat numbers, their berth codes) for each coach with free seats
+    def free_by_coach(self):
+        coach_of, numbers, berths = self.coach_of[self.free], self.seat_number[self.free], self.berth[self.free]
+        bounds = np.flatnonzero(np.diff(coach_of)) + 1
+        for coach, seats, codes in zip(np.split(coach_of, bounds), np.split(numbers, bounds), np.split(berths, bounds)):
+            if len(coach):
+                yield int(coach[0]), seats, codes
+
+
+# Function to choose `n` seats out of `seats` (sorted numbers with berth codes), taking
+# wanted berths first and filling up with the seats closest to them.
+# Returns (positions chosen, preferences met).
+def pick_seats(seats, codes, n, want):
+    chosen = []
+    for code in np.flatnonzero(want):
+        chosen.extend(np.flatnonzero(codes == code)[:want[code]].tolist())
+    met = len(chosen)
+    if len(chosen) < n:
+        centre = np.median(seats[chosen]) if chosen else seats[0]
+        taken = set(chosen)
+        rest = [p for p in np.argsort(np.abs(seats - centre), kind='stable').tolist() if p not in taken]
+        chosen.extend(rest[:n - len(chosen)])
+    return sorted(chosen), met
+
+
+# Function to find the best window of `n` consecutive free seats in one coach.
+# Returns (positions, preferences met) or None.
+def best_window(seats, codes, n, want):
+    if len(seats) < n:
+        return None
+    starts = np.flatnonzero(seats[n - 1:] - seats[:len(seats) - n + 1] == n - 1)
+    if not len(starts):
+        return None
+    # Berths of every window at once, from running counts per berth type
+    counts = np.vstack([np.zeros(len(BERTH_TYPES), int), np.cumsum(np.eye(len(BERTH_TYPES), dtype=int)[codes], axis=0)])
+    met = np.minimum(counts[starts + n] - counts[starts], want).sum(axis=1)
+    start = int(starts[np.argmax(met)])
+    return list(range(start, start + n)), int(met.max())
+
+
+# Function to choose seats for a party from a seat index.
+# Returns {'seats': [(coach_number, seat_number)], 'types', 'preferences_met'} or None.
+def find_seats(index, party_size, preferences=(), keep_together='coach'):
+    want = np.bincount([BERTH_CODES[p] for p in preferences], minlength=len(BERTH_TYPES))[:len(BERTH_TYPES)]
+    candidates = []
+    spare = []
+    for coach, seats, codes in index.free_by_coach():
+        spare.append((coach, seats, codes))
+        groups = [(seats, codes)]
+        if keep_together == 'bay' and index.bay_sizes[coach]:
+            bays = (seats - 1) // index.bay_sizes[coach]
+            bounds = np.flatnonzero(np.diff(bays)) + 1
+            groups = list(zip(np.split(seats, bounds), np.split(codes, bounds)))
+        for group_seats, group_codes in groups:
+            if keep_together == 'adjacent' or (keep_together == 'bay' and not index.bay_sizes[coach]):
+                found = best_window(group_seats, group_codes, party_size, want)
+            elif len(group_seats) >= party_size:
+                found = pick_seats(group_seats, group_codes, party_size, want)
+            else:
+                found = None
+            if found:
+                positions, met = found
+                span = int(group_seats[positions[-1]] - group_seats[positions[0]])
+                # More preferences met first, then the tightest group, then the earliest coach
+                score = (met, -1, -span, -coach)
+                candidates.append((score, [(coach, int(group_seats[p]), int(group_codes[p])) for p in positions]))
+
+    if not candidates and keep_together == 'none':
+        # Nobody can sit together: fill from the coaches with the most free seats
+        chosen, met = [], 0
+        for coach, seats, codes in sorted(spare, key=lambda c: -len(c[1])):
+            remaining = want.copy()
+            for _, _, code in chosen:
+                remaining[code] = max(remaining[code] - 1, 0)
+            positions, taken = pick_seats(seats, codes, min(party_size - len(chosen), len(seats)), remaining)
+            chosen += [(coach, int(seats[p]), int(codes[p])) for p in positions]
+            met += taken
+            if len(chosen) == party_size:
+                candidates.append(((met, -len({c for c, _, _ in chosen}), 0, 0), chosen))
+                break
+    if not candidates:
+        return None
+    score, chosen = max(candidates, key=lambda candidate: candidate[0])
+    return {
+        'seats': [(index.coaches[coach], str(seat)) for coach, seat, _ in chosen],
+        'types': [BERTH_TYPES[code] for _, _, code in chosen],
+        'preferences_met': score[0]
+    }
+
+
+# Function to pair each passenger with a seat: passengers with a preference get a
+# seat of that berth type where one was allocated. Returns one seat index per passenger.
+def assign_passengers(types, preferences, party_size):
+    free = list(range(len(types)))
+    assigned = [None] * party_size
+    for passenger, preference in enumerate(preferences):
+        match = next((k for k in free if types[k] == preference), None)
+        if match is not None:
+            assigned[passenger] = match
+            free.remove(match)
+    for passenger in range(party_size):
+        if assigned[passenger] is None:
+            assigned[passenger] = free.pop(0)
+    return assigned
+
+
+class SeatAllocator:
+    """Chooses seats for a whole party and holds them in one request.
+
+    The search runs over a SeatIndex of the train's current inventory and
+    active holds. The chosen seats are held together with
+    SeatHoldEngine.hold_many, all or nothing; if another passenger holds one
+    of them first the search runs again on a fresh index. Booking the held
+    seats goes through the normal confirm path, which re-checks the inventory.
+    """
+
+    def __init__(self, db, seat_holds):
+        self.db = db
+        self.seat_holds = seat_holds
+
+    def index(self, train_id, segments=None, coach_type=None):
+        query = {'train_id': train_id}
+        if coach_type:
+            query['coach_type'] = coach_type
+        coaches = list(self.db.coaches.find(query, AVAILABILITY_PROJECTION).sort('coach_number', 1))
+        held = [
+            (hold['coach_number'], hold['seat_number']) for hold in self.db.seat_holds.find(
+                {'train_id': train_id, 'expires_at': {'$gt': datetime.utcnow()}},
+                {'coach_number': 1, 'seat_number': 1, '_id': 0}
+            )
+        ]
+        return SeatIndex(coaches, held, segments)
+
+    # Function to find and hold seats for a party.
+    # Returns (allocation with 'expires_at' and 'passengers', None) or (None, error code).
+    def allocate(self, train_id, party_size, preferences=(), keep_together='coach', coach_type=None,
+                 segments=None, holder=None, require_preferences=False):
+        for _ in range(ALLOCATION_ATTEMPTS):
+            allocation = find_seats(self.index(train_id, segments, coach_type), party_size, preferences, keep_together)
+            if allocation is None:
+                return None, 'no_seats'
+            if require_preferences and allocation['preferences_met'] < len(preferences):
+                return None, 'preferences_unavailable'
+            expires_at, conflicts = self.seat_holds.hold_many(train_id, allocation['seats'], holder=holder)
+            if not conflicts:
+                allocation['expires_at'] = expires_at
+                allocation['passengers'] = assign_passengers(allocation['types'], preferences, party_size)
+                return allocation, None
+        return None, 'contention'
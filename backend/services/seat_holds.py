@@ -0,0 +1,161 @@
+from datetime import datetime, timedelta
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from backend.services.seat_inventory import book_seat, find_coach_seat, is_seat_booked, release_seats, seat_exists
+
+# How long a locked seat stays reserved for the passenger before it is released
+HOLD_TTL_SECONDS = 600
+
+
+# Function to normalise a seat number coming from JSON (the frontend sends ints)
+def seat_key(seat_number):
+    return str(seat_number).strip()
+
+
+class SeatHoldEngine:
+    """Short-lived seat holds stored one document per seat in `seat_holds`.
+
+    A unique index on (train_id, coach_number, seat_number) makes acquiring a
+    hold a single atomic insert, and a TTL index on `expires_at` lets MongoDB
+    drop abandoned holds on its own. Booked seats are flipped in the coach
+    inventory one field at a time with a guarded update, never as a whole map.
+    """
+
+    def __init__(self, db, ttl_seconds=HOLD_TTL_SECONDS):
+        self.db = db
+        self.ttl_seconds = ttl_seconds
+
+    # Returns (hold document or None, error code or None)
+    # `segments` is the journey segment mask being booked (None = whole route)
+    def hold(self, train_id, coach_number, seat_number, holder=None, segments=None):
+        seat_number = seat_key(seat_number)
+        if not seat_number.isdigit() or int(seat_number) < 1:
+            return None, 'invalid_seat'
+        coach = find_coach_seat(self.db, train_id, coach_number, seat_number)
+        if not coach:
+            return None, 'coach_not_found'
+        if not seat_exists(coach, seat_number):
+            return None, 'invalid_seat'
+        if is_seat_booked(coach, seat_number, segments):
+            return None, 'seat_booked'
+
+        now = datetime.utcnow()
+        hold = {
+            'train_id': train_id,
+            'coach_number': coach_number,
+            'seat_number': seat_number,
+            'holder': holder,
+            'created_at': now,
+            'expires_at': now + timedelta(seconds=self.ttl_seconds)
+        }
+        try:
+            hold['_id'] = self.db.seat_holds.insert_one(hold).inserted_id
+            return hold, None
+        except DuplicateKeyError:
+            pass
+
+        # The TTL monitor only runs about once a minute, so take over a hold that
+        # has already expired but not been swept yet. The filter keeps this atomic.
+        result = self.db.seat_holds.update_one(
+            {'train_id': train_id, 'coach_number': coach_number, 'seat_number': seat_number,
+             'expires_at': {'$lte': now}},
+            {'$set': {'holder': holder, 'created_at': now, 'expires_at': hold['expires_at']}}
+        )
+        if result.modified_count == 1:
+            return hold, None
+        return None, 'seat_held'
+
+    # Function to hold several seats at once, all or nothing. `seats` is a list of
+    # (coach_number, seat_number) already checked for being free.
+    # Returns (expires_at, []) on success or (None, seats that do not exist or are held by someone else).
+    def hold_many(self, train_id, seats, holder=None):
+        missing = []
+        for coach_number, seat_number in seats:
+            coach = str(seat_number).isdigit() and find_coach_seat(self.db, train_id, coach_number, seat_number)
+            if not coach or not seat_exists(coach, seat_number):
+                missing.append((coach_number, seat_number))
+        if missing:
+            return None, missing
+        # Millisecond precision, as stored, so the rollback below can match on created_at
+        now = datetime.utcnow()
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        expires_at = now + timedelta(seconds=self.ttl_seconds)
+        holds = [
+            {'train_id': train_id, 'coach_number': coach_number, 'seat_number': seat_key(seat_number),
+             'holder': holder, 'created_at': now, 'expires_at': expires_at}
+            for coach_number, seat_number in seats
+        ]
+        taken = []
+        try:
+            self.db.seat_holds.insert_many(holds, ordered=False)
+        except BulkWriteError as e:
+            taken = [holds[error['index']] for error in e.details.get('writeErrors', [])]
+        # Take over holds that have expired but not been swept yet (see hold())
+        conflicts = []
+        for hold in taken:
+            result = self.db.seat_holds.update_one(
+                {'train_id': train_id, 'coach_number': hold['coach_number'], 'seat_number': hold['seat_number'],
+                 'expires_at': {'$lte': now}},
+                {'$set': {'holder': holder, 'created_at': now, 'expires_at': expires_at}}
+            )
+            if result.modified_count != 1:
+                conflicts.append((hold['coach_number'], hold['seat_number']))
+        if conflicts:
+            # Give back every seat this call did get
+            self.db.seat_holds.delete_many({
+                'train_id': train_id, 'holder': holder, 'created_at': now,
+                '$or': [{'coach_number': h['coach_number'], 'seat_number': h['seat_number']} for h in holds]
+            })
+            return None, conflicts
+        return expires_at, []
+
+    # Release a hold; only its holder may, so anonymous holds are left to expire
+    def release(self, train_id, coach_number, seat_number, holder, session=None):
+        query = {'train_id': train_id, 'coach_number': coach_number, 'seat_number': seat_key(seat_number), 'holder': holder}
+        return self.db.seat_holds.delete_one(query, session=session).deleted_count == 1
+
+    # Seat numbers in a coach currently held by anyone
+    def active_holds(self, train_id, coach_number):
+        cursor = self.db.seat_holds.find(
+            {'train_id': train_id, 'coach_number': coach_number, 'expires_at': {'$gt': datetime.utcnow()}},
+            {'seat_number': 1, '_id': 0}
+        )
+        return sorted((h['seat_number'] for h in cursor), key=lambda n: int(n) if n.isdigit() else n)
+
+    # Turn holds into booked seats. `seats` is a list of (coach_number, seat_number).
+    # Returns the list of seats that could not be booked (empty on success); on
+    # failure every seat booked by this call is released again. Anonymous holds
+    # (no holder) can be claimed by whoever books the seat first. On success,
+    # `claimed` (if given) gets the seats that were free on every segment before.
+    def confirm(self, train_id, seats, holder=None, segments=None, session=None, claimed=None):
+        now = datetime.utcnow()
+        seats = [(coach_number, seat_key(seat_number)) for coach_number, seat_number in seats]
+        if not seats:
+            return []
+        # One query for every seat held by someone else
+        conflicts = [(h['coach_number'], h['seat_number']) for h in self.db.seat_holds.find({
+            'train_id': train_id,
+            '$or': [{'coach_number': coach_number, 'seat_number': seat_number} for coach_number, seat_number in seats],
+            'holder': {'$nin': [holder, None]}, 'expires_at': {'$gt': now}
+        }, {'coach_number': 1, 'seat_number': 1}, session=session)]
+        if conflicts:
+            return conflicts
+
+        booked, newly_claimed = [], []
+        for coach_number, seat_number in seats:
+            if not book_seat(self.db, train_id, coach_number, seat_number, segments, session, newly_claimed):
+                conflicts.append((coach_number, seat_number))
+                break
+            booked.append((coach_number, seat_number))
+
+        if conflicts:
+            for coach_number, seat_number in booked:
+                release_seats(self.db, train_id, coach_number, [seat_number], segments, session)
+            return conflicts
+
+        self.db.seat_holds.delete_many({
+            'train_id': train_id,
+            '$or': [{'coach_number': coach_number, 'seat_number': seat_number} for coach_number, seat_number in seats]
+        }, session=session)
+        if claimed is not None:
+            claimed.extend(newly_claimed)
+        return []
@@ -0,0 +1,224 @@
+from pymongo import UpdateOne
+from backend.utils.helpers import FULL_ROUTE_MASK, is_seat_bit_set, is_seat_entry_available, seat_bit_position
+
+# Compare-and-set retries when another seat in the same 32-seat word changed underneath us
+MAX_CAS_RETRIES = 16
+
+# Coaches store seats in one of three formats:
+# - segment_bits: one integer per seat, bit k set = sold on journey segment k
+# - seat_bits:    32-bit words, one bit per seat, set = booked for the whole route
+# - seat_map:     legacy JSON map of seat number to availability
+# `segments` arguments below are segment masks (see helpers.journey_segment_mask);
+# None means the whole route, and they are ignored by coaches that are not segment-aware.
+# `session` lets callers run these writes inside a transaction (see utils.transactions).
+
+
+# Function to check whether a seat is booked, given a coach fetched with find_coach_seat
+def is_seat_booked(coach, seat_number, segments=None):
+    if 'segment_bits' in coach:
+        # find_coach_seat slices segment_bits down to the one seat it asked for
+        return not coach['segment_bits'] or bool(coach['segment_bits'][0] & (segments or FULL_ROUTE_MASK))
+    if 'seat_bits' in coach:
+        return is_seat_bit_set(coach['seat_bits'], seat_number)
+    return not is_seat_entry_available(coach.get('seat_map', {}).get(str(seat_number)))
+
+
+# Function to fetch just what is needed to check one seat of a coach
+def find_coach_seat(db, train_id, coach_number, seat_number, session=None):
+    return db.coaches.find_one(
+        {'train_id': train_id, 'coach_number': coach_number},
+        {'seat_bits': 1, 'total_seats': 1, f'seat_map.{seat_number}': 1,
+         'segment_bits': {'$slice': [int(seat_number) - 1, 1]}},
+        session=session
+    )
+
+
+# Function to check that a seat number exists in a coach fetched with find_coach_seat
+def seat_exists(coach, seat_number):
+    seat_number = str(seat_number)
+    if not seat_number.isdigit() or int(seat_number) < 1:
+        return False
+    if coach.get('total_seats'):
+        return int(seat_number) <= coach['total_seats']
+    if 'segment_bits' in coach:
+        # Sliced down to the one seat asked for: empty means past the end
+        return bool(coach['segment_bits'])
+    if 'seat_bits' in coach:
+        return seat_bit_position(seat_number)[0] < len(coach['seat_bits'])
+    return seat_number in coach.get('seat_map', {})
+
+
+# Function to atomically mark a seat as booked. Returns False if it already was.
+# If `claimed` is given, the seat is appended to it when it was free on every
+# segment before, i.e. when the booking changes its whole-seat status.
+def book_seat(db, train_id, coach_number, seat_number, segments=None, session=None, claimed=None):
+    seat_number = str(seat_number)
+    for _ in range(MAX_CAS_RETRIES):
+        coach = find_coach_seat(db, train_id, coach_number, seat_number, session)
+        if not coach:
+            return False
+        if 'segment_bits' in coach:
+            if not coach['segment_bits']:
+                return False
+            field = f'segment_bits.{int(seat_number) - 1}'
+            current, mask = coach['segment_bits'][0], segments or FULL_ROUTE_MASK
+            if current & mask:
+                return False
+        elif 'seat_bits' in coach:
+            word, mask = seat_bit_position(seat_number)
+            field = f'seat_bits.{word}'
+            if word >= len(coach['seat_bits']):
+                return False
+            current = coach['seat_bits'][word]
+            if current & mask:
+                return False
+        else:
+            # Legacy coach: flip the single seat_map field, guarded against it being booked.
+            # Without total_seats only seats already in the map exist; with it the map may be sparse.
+            if not seat_exists(coach, seat_number):
+                return False
+            field = f'seat_map.{seat_number}'
+            guard = {'$ne': 'unavailable'} if coach.get('total_seats') else {'$exists': True, '$ne': 'unavailable'}
+            result = db.coaches.update_one(
+                {'_id': coach['_id'], 'seat_bits': {'$exists': False}, 'segment_bits': {'$exists': False},
+                 field: guard, f'{field}.available': {'$ne': False}},
+                {'$set': {field: 'unavailable'}},
+                session=session
+            )
+            if result.modified_count == 1 and claimed is not None:
+                claimed.append((coach_number, seat_number))
+            return result.modified_count == 1
+        # The filter on the old value makes this a compare-and-set
+        result = db.coaches.update_one(
+            {'_id': coach['_id'], field: current},
+            {'$set': {field: current | mask}},
+            session=session
+        )
+        if result.modified_count == 1:
+            # A seat_bits word holds other seats; only segment_bits says whether this seat was free
+            if claimed is not None and ('segment_bits' not in coach or current == 0):
+                claimed.append((coach_number, seat_number))
+            return True
+    return False
+
+
+# Function to clear bits in one element of an integer array field with compare-and-set.
+# Returns the value left in the element, or None if none of the bits were set.
+def _clear_bits(db, coach_id, array_field, index, mask, session=None):
+    field = f'{array_field}.{index}'
+    for _ in range(MAX_CAS_RETRIES):
+        coach = db.coaches.find_one({'_id': coach_id}, {array_field: {'$slice': [index, 1]}}, session=session)
+        if not coach or not coach.get(array_field):
+            return None
+        current = coach[array_field][0]
+        if not current & mask:
+            return None
+        result = db.coaches.update_one(
+            {'_id': coach_id, field: current}, {'$set': {field: current & ~mask}}, session=session
+        )
+        if result.modified_count == 1:
+            return current & ~mask
+    return None
+
+
+# Function to mark several seats of one coach as free again. Returns True if it
+# cleared anything. If `freed` is given, seats left free on every segment are
+# appended to it as (coach_number, seat_number).
+def release_seats(db, train_id, coach_number, seat_numbers, segments=None, session=None, freed=None):
+    seat_numbers = [str(n) for n in seat_numbers]
+    coach = db.coaches.find_one(
+        {'train_id': train_id, 'coach_number': coach_number},
+        {'seat_bits': 1, 'segment_bits': {'$slice': 0}},
+        session=session
+    )
+    if not coach:
+        return False
+    if 'segment_bits' in coach:
+        cleared = False
+        for seat_number in seat_numbers:
+            left = _clear_bits(db, coach['_id'], 'segment_bits', int(seat_number) - 1, segments or FULL_ROUTE_MASK, session)
+            cleared = cleared or left is not None
+            if left == 0 and freed is not None:
+                freed.append((coach_number, seat_number))
+        return cleared
+    if freed is not None:
+        # Whole-route coaches: a released seat is free on every segment
+        freed.extend((coach_number, seat_number) for seat_number in seat_numbers)
+    if 'seat_bits' not in coach:
+        db.coaches.update_one(
+            {'_id': coach['_id']},
+            {'$set': {f'seat_map.{n}': 'available' for n in seat_numbers}},
+            session=session
+        )
+        return True
+
+    masks = {}
+    for seat_number in seat_numbers:
+        word, mask = seat_bit_position(seat_number)
+        masks[word] = masks.get(word, 0) | mask
+    cleared = False
+    for word, mask in masks.items():
+        if word < len(coach['seat_bits']):
+            cleared = _clear_bits(db, coach['_id'], 'seat_bits', word, mask, session) is not None or cleared
+    return cleared
+
+
+# Function to free seats of several coaches with a single bulk_write.
+# `seats_by_coach` maps coach_number -> seat numbers. Each coach gets one guarded
+# update that clears all of its seats at once. If another booking changed one of
+# those words in the meantime, the coaches are redone seat by seat with release_seats.
+# `freed` collects the seats left free on every segment, as in release_seats.
+def release_seats_bulk(db, train_id, seats_by_coach, segments=None, session=None, freed=None):
+    if not seats_by_coach:
+        return 0
+    coaches = list(db.coaches.find(
+        {'train_id': train_id, 'coach_number': {'$in': list(seats_by_coach)}},
+        {'coach_number': 1, 'seat_bits': 1, 'segment_bits': 1},
+        session=session
+    ))
+    operations, pending = [], {}
+    for coach in coaches:
+        seat_numbers = [str(n) for n in seats_by_coach[coach['coach_number']]]
+        guard, update = {'_id': coach['_id']}, {}
+        if 'segment_bits' in coach:
+            mask = segments or FULL_ROUTE_MASK
+            pending[coach['coach_number']] = []
+            for seat_number in seat_numbers:
+                index = int(seat_number) - 1
+                if index < len(coach['segment_bits']) and coach['segment_bits'][index] & mask:
+                    current = coach['segment_bits'][index]
+                    guard[f'segment_bits.{index}'] = current
+                    update[f'segment_bits.{index}'] = current & ~mask
+                    if not current & ~mask:
+                        pending[coach['coach_number']].append((coach['coach_number'], seat_number))
+        elif 'seat_bits' in coach:
+            words = {}
+            for seat_number in seat_numbers:
+                word, mask = seat_bit_position(seat_number)
+                if word < len(coach['seat_bits']):
+                    words[word] = words.get(word, coach['seat_bits'][word]) & ~mask
+            for word, value in words.items():
+                if value != coach['seat_bits'][word]:
+                    guard[f'seat_bits.{word}'] = coach['seat_bits'][word]
+                    update[f'seat_bits.{word}'] = value
+        else:
+            update = {f'seat_map.{n}': 'available' for n in seat_numbers}
+        if 'segment_bits' not in coach:
+            pending[coach['coach_number']] = [(coach['coach_number'], n) for n in seat_numbers]
+        if update:
+            operations.append((coach['coach_number'], UpdateOne(guard, {'$set': update})))
+    if not operations:
+        return 0
+
+    result = db.coaches.bulk_write([op for _, op in operations], ordered=False, session=session)
+    if result.matched_count < len(operations):
+        # Some guard no longer matched; clearing bits is idempotent, so redo those coaches safely.
+        # A coach with nothing left to clear took the bulk update, computed from exact values.
+        for coach_number, _ in operations:
+            redone = []
+            if release_seats(db, train_id, coach_number, seats_by_coach[coach_number], segments, session, redone):
+                pending[coach_number] = redone
+    if freed is not None:
+        for coach_number, _ in operations:
+            freed.extend(pending[coach_number])
+    return len(operations)
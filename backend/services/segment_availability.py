@@ -0,0 +1,39 @@
+import numpy as np
+from backend.utils.helpers import FULL_ROUTE_MASK, SEAT_WORD_BITS, encode_seat_map
+
+# Coach fields needed to answer availability queries
+AVAILABILITY_PROJECTION = {
+    'coach_number': 1, 'coach_type': 1, 'total_seats': 1, 'segment_bits': 1, 'seat_bits': 1, 'seat_map': 1
+}
+
+
+# Function to turn any coach inventory format into one occupancy mask per seat
+def coach_occupancy(coach):
+    if 'segment_bits' in coach:
+        return np.asarray(coach['segment_bits'], dtype=np.uint64)
+    if 'seat_bits' in coach:
+        seat_bits = coach['seat_bits']
+        total_seats = coach.get('total_seats') or len(seat_bits) * SEAT_WORD_BITS
+    else:
+        total_seats = coach.get('total_seats')
+        seat_bits = encode_seat_map(coach.get('seat_map', {}), total_seats)
+        total_seats = total_seats or len(seat_bits) * SEAT_WORD_BITS
+    # Whole-route coaches: a booked seat is occupied on every segment
+    words = np.asarray(seat_bits, dtype='<u4').view(np.uint8)
+    booked = np.unpackbits(words, bitorder='little')[:total_seats].astype(bool)
+    return np.where(booked, np.uint64(FULL_ROUTE_MASK), np.uint64(0))
+
+
+# Function to find the free seats of every coach of a train for a journey segment mask
+# (None = whole route). All seats of the train are tested in one vectorised pass.
+def free_seats_by_coach(coaches, segments=None):
+    coaches = list(coaches)
+    if not coaches:
+        return {}
+    occupancy = [coach_occupancy(coach) for coach in coaches]
+    free = (np.concatenate(occupancy) & np.uint64(segments or FULL_ROUTE_MASK)) == 0
+    offsets = np.cumsum([len(seats) for seats in occupancy])[:-1]
+    return {
+        coach['coach_number']: (np.flatnonzero(coach_free) + 1).tolist()
+        for coach, coach_free in zip(coaches, np.split(free, offsets))
+    }
@@ -0,0 +1,239 @@
+import threading
+from datetime import datetime
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, OperationFailure
+
+# Seconds reports wait in the buffer so repeated updates for one coach or train become one write
+COALESCE_WINDOW_SECONDS = 1.0
+# Largest JSON batch accepted by POST /api/telemetry (NDJSON streams are read in chunks of this size)
+MAX_BATCH_RECORDS = 5000
+# Buffered coaches/trains that trigger an early flush
+MAX_BUFFERED_KEYS = 20000
+
+# History of every report (kept only when enabled): retention, and the size cap
+# used where time-series collections are not available
+HISTORY_COLLECTION = 'telemetry_history'
+HISTORY_RETENTION_SECONDS = 7 * 24 * 3600
+HISTORY_CAPPED_BYTES = 256 * 1024 * 1024
+
+# Fields each kind of report may set; anything else in a record is ignored
+TELEMETRY_FIELDS = {
+    'coach_position': ('platform_number', 'position_on_platform', 'station', 'eta'),
+    'tracking': (
+        'current_location', 'current_station', 'next_station', 'estimated_arrival', 'status',
+        'delay', 'delay_minutes', 'speed', 'progress', 'latitude', 'longitude'
+    ),
+}
+TELEMETRY_COLLECTIONS = {'coach_position': 'coach_positions', 'tracking': 'tracking'}
+
+# Write error codes worth retrying at the next flush: transient server states, and
+# duplicate keys from two upserts racing. Any other write error (e.g. 121, document
+# failed validation) rejects the report for good.
+DUPLICATE_KEY = 11000
+RETRYABLE_WRITE_CODES = {6, 7, 50, 89, 91, 112, 189, 262, 9001, 10107, 11600, 11602, 13435, 13436, DUPLICATE_KEY}
+
+
+# Function to validate one telemetry record.
+# Returns ((kind, train_id, coach_number), fields, reported_at) or raises ValueError.
+def parse_record(record):
+    if not isinstance(record, dict):
+        raise ValueError('Record must be an object')
+    kind = record.get('kind', 'coach_position' if 'coach_number' in record else 'tracking')
+    if kind not in TELEMETRY_FIELDS:
+        raise ValueError(f'Unknown kind: {kind}')
+    train_id = record.get('train_id')
+    if not isinstance(train_id, str) or not ObjectId.is_valid(train_id):
+        raise ValueError('Invalid train_id')
+    coach_number = record.get('coach_number') if kind == 'coach_position' else None
+    if kind == 'coach_position' and not coach_number:
+        raise ValueError('Missing required field: coach_number')
+    fields = {field: record[field] for field in TELEMETRY_FIELDS[kind] if field in record}
+    if not fields:
+        raise ValueError('Record has no telemetry fields')
+    reported_at = record.get('reported_at')
+    if reported_at is not None:
+        try:
+            reported_at = datetime.fromisoformat(str(reported_at).replace('Z', '+00:00')).replace(tzinfo=None)
+        except ValueError:
+            raise ValueError('reported_at must be an ISO 8601 timestamp')
+    return (kind, ObjectId(train_id), coach_number), fields, reported_at
+
+
+# Function to sort the write errors of an unordered bulk write. Errors with a code in
+# `done_codes` mean the document is already there. Returns (indexes to retry, number rejected).
+def split_write_errors(error, done_codes=()):
+    retry, rejected = [], 0
+    for write_error in error.details.get('writeErrors', []):
+        if write_error.get('code') in done_codes:
+            continue
+        if write_error.get('code') in RETRYABLE_WRITE_CODES:
+            retry.append(write_error['index'])
+        else:
+            rejected += 1
+    return retry, rejected
+
+
+# Function to create the history collection: a time-series collection that expires
+# old points where the server supports one, otherwise a capped collection
+def ensure_history_collection(db, retention_seconds=HISTORY_RETENTION_SECONDS, capped_bytes=HISTORY_CAPPED_BYTES):
+    if HISTORY_COLLECTION in db.list_collection_names():
+        return
+    try:
+        db.create_collection(
+            HISTORY_COLLECTION,
+            timeseries={'timeField': 'ts', 'metaField': 'source', 'granularity': 'seconds'},
+            expireAfterSeconds=retention_seconds
+        )
+    except CollectionInvalid:
+        pass  # created by another worker
+    except (OperationFailure, NotImplementedError):
+        # MongoDB < 5.0: keep the newest reports within a fixed size
+        try:
+            db.create_collection(HISTORY_COLLECTION, capped=True, size=capped_bytes)
+        except CollectionInvalid:
+            pass
+        except NotImplementedError:
+            pass  # test doubles without collection options; inserts create a plain collection
+
+
+class TelemetryIngest:
+    """Buffers coach position and tracking reports and writes them in batches.
+
+    Reports for the same coach (or train) that arrive within one coalescing
+    window are merged, so only the latest value of each field is written. A
+    background thread flushes the buffer every window with one unordered
+    bulk_write per collection, and every report can also be appended to a
+    history collection. With a window of 0 each submit is written at once.
+    Only writes that failed for a transient reason are put back for the next
+    flush; reports the server rejects are dropped and counted.
+    """
+
+    def __init__(self, db, window=COALESCE_WINDOW_SECONDS, history=False, on_flush=None):
+        self.db = db
+        self.window = window
+        self.history = history
+        self.on_flush = on_flush
+        self.pending = {}
+        self.pending_history = []
+        self.stats = {
+            'received': 0, 'coalesced': 0, 'written': 0, 'history': 0, 'flushes': 0, 'errors': 0, 'rejected': 0
+        }
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        if window > 0:
+            self.thread = threading.Thread(target=self._run, name='telemetry-flush', daemon=True)
+            self.thread.start()
+
+    # Function to validate and buffer a batch of records.
+    # Returns (number accepted, [{'index', 'error'}] for rejected records).
+    def submit(self, records):
+        errors, accepted = [], 0
+        now = datetime.utcnow()
+        with self.lock:
+            for index, record in enumerate(records):
+                try:
+                    key, fields, reported_at = parse_record(record)
+                except ValueError as e:
+                    errors.append({'index': index, 'error': str(e)})
+                    continue
+                accepted += 1
+                buffered = self.pending.get(key)
+                if buffered is None:
+                    self.pending[key] = dict(fields, updated_at=reported_at or now)
+                else:
+                    self.stats['coalesced'] += 1
+                    # A late report must not overwrite a newer one already buffered
+                    if reported_at is None or reported_at >= buffered['updated_at']:
+                        buffered.update(fields, updated_at=reported_at or now)
+                if self.history:
+                    kind, train_id, coach_number = key
+                    # Own _id, so a retried insert of a stored report is a duplicate key, not a copy
+                    self.pending_history.append(dict(
+                        fields, _id=ObjectId(), ts=reported_at or now,
+                        source={'kind': kind, 'train_id': train_id, 'coach_number': coach_number}
+                    ))
+            self.stats['received'] += accepted
+            flush_now = self.window <= 0 or len(self.pending) >= MAX_BUFFERED_KEYS
+        if flush_now:
+            self.flush()
+        return accepted, errors
+
+    # Function to write everything buffered: one unordered bulk_write per collection.
+    # Returns the number of documents written.
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+                history, self.pending_history = self.pending_history, []
+            if not pending and not history:
+                return 0
+            operations = {}
+            for key, fields in pending.items():
+                kind, train_id, coach_number = key
+                selector = {'train_id': train_id}
+                if coach_number is not None:
+                    selector['coach_number'] = coach_number
+                keys, batch = operations.setdefault(TELEMETRY_COLLECTIONS[kind], ([], []))
+                keys.append(key)
+                batch.append(UpdateOne(selector, {'$set': fields}, upsert=True))
+
+            retry, retry_history, rejected, failure = [], [], set(), None
+            for collection, (keys, batch) in operations.items():
+                try:
+                    self.db[collection].bulk_write(batch, ordered=False)
+                except BulkWriteError as e:
+                    indexes, _ = split_write_errors(e)
+                    retry.extend(keys[index] for index in indexes)
+                    rejected.update(keys[write_error['index']] for write_error in e.details.get('writeErrors', [])
+                                    if write_error['index'] not in indexes)
+                except Exception as e:
+                    # Nothing known about this batch; upserts are idempotent, so all of it goes back
+                    failure = failure or e
+                    retry.extend(keys)
+            rejected_history = 0
+            if history:
+                try:
+                    self.db[HISTORY_COLLECTION].insert_many(history, ordered=False)
+                except BulkWriteError as e:
+                    indexes, rejected_history = split_write_errors(e, done_codes=(DUPLICATE_KEY,))
+                    retry_history = [history[index] for index in indexes]
+                except Exception as e:
+                    failure = failure or e
+                    retry_history = history
+
+            with self.lock:
+                # Newer reports buffered meanwhile win over the ones put back
+                for key in retry:
+                    self.pending[key] = dict(pending[key], **self.pending.get(key, {}))
+                self.pending_history[:0] = retry_history
+                unwritten = rejected | set(retry)
+                written = [key for key in pending if key not in unwritten]
+                self.stats['written'] += len(written)
+                self.stats['history'] += len(history) - len(retry_history) - rejected_history
+                self.stats['rejected'] += len(rejected) + rejected_history
+                self.stats['flushes'] += 1
+        if self.on_flush and written:
+            self.on_flush(set(written))
+        if failure is not None:
+            raise failure
+        return len(written)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, pending=len(self.pending), window_seconds=self.window)
+
+    def shutdown(self):
+        self.stopped.set()
+        self.flush()
+
+    def _run(self):
+        while not self.stopped.wait(self.window):
+            try:
+                self.flush()
+            except Exception as e:
+                with self.lock:
+                    self.stats['errors'] += 1
+                print(f"Telemetry flush failed: {e}")
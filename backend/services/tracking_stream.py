@@ -0,0 +1,149 @@
+import asyncio
+import queue
+import threading
+from pymongo.errors import OperationFailure
+
+# Seconds between reads when change streams are not available (standalone mongod, tests)
+DEFAULT_POLL_INTERVAL = 2.0
+# Updates buffered per subscriber before the oldest are dropped for a slow client
+SUBSCRIBER_QUEUE_SIZE = 32
+
+
+# Function to work out which fields of a tracking document changed
+def tracking_delta(previous, current):
+    if previous is None:
+        return dict(current)
+    delta = {k: v for k, v in current.items() if previous.get(k) != v}
+    delta.update({k: None for k in previous if k not in current})
+    return delta
+
+
+class LoopSubscriber:
+    """Subscriber for asyncio code: the watcher thread hands each delta to the
+    event loop, so a waiting client holds a coroutine rather than a thread."""
+
+    def __init__(self, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    # Called from the watcher thread; never blocks and never raises queue.Full
+    def put_nowait(self, delta):
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._put, delta)
+
+    def _put(self, delta):
+        if self.queue.full():
+            # Slow client: drop its oldest update
+            self.queue.get_nowait()
+        self.queue.put_nowait(delta)
+
+    # Returns the next delta; raises asyncio.TimeoutError after `timeout` seconds
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class TrainWatcher:
+    """Watches the tracking document of one train and fans changes out to subscribers.
+
+    Uses a MongoDB change stream when the deployment supports one and falls back
+    to polling `updated_at` otherwise. Exactly one watcher thread runs per train,
+    however many clients are subscribed.
+    """
+
+    def __init__(self, hub, train_id):
+        self.hub = hub
+        self.train_id = train_id
+        self.subscribers = set()
+        self.snapshot = None
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name=f'tracking-{train_id}', daemon=True)
+
+    def publish(self, document):
+        document.pop('_id', None)
+        with self.lock:
+            delta = tracking_delta(self.snapshot, document)
+            self.snapshot = document
+            subscribers = list(self.subscribers)
+        if not delta:
+            return
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(delta)
+            except queue.Full:
+                # Slow client: drop its oldest update rather than block the watcher
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    pass
+                subscriber.put_nowait(delta)
+
+    def _run(self):
+        current = self.hub.db.tracking.find_one({'train_id': self.train_id})
+        if current:
+            self.publish(current)
+        if self.hub.use_change_streams:
+            try:
+                self._watch_change_stream()
+                return
+            except (OperationFailure, NotImplementedError):
+                pass  # change streams need a replica set; poll instead
+        self._poll()
+
+    def _watch_change_stream(self):
+        pipeline = [{'$match': {'fullDocument.train_id': self.train_id}}]
+        with self.hub.db.tracking.watch(pipeline, full_document='updateLookup', max_await_time_ms=1000) as stream:
+            while not self.stopped.is_set():
+                change = stream.try_next()
+                if change and change.get('fullDocument'):
+                    self.publish(change['fullDocument'])
+
+    def _poll(self):
+        while not self.stopped.wait(self.hub.poll_interval):
+            current = self.hub.db.tracking.find_one({'train_id': self.train_id})
+            if current:
+                self.publish(current)
+
+
+class TrackingHub:
+    """Registry of per-train watchers; subscribers get a queue of tracking deltas."""
+
+    def __init__(self, db, poll_interval=DEFAULT_POLL_INTERVAL, use_change_streams=True):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.use_change_streams = use_change_streams
+        self.watchers = {}
+        self.lock = threading.Lock()
+
+    # Returns (queue of deltas, current snapshot or None). Async callers pass a LoopSubscriber.
+    def subscribe(self, train_id, subscriber=None):
+        if subscriber is None:
+            subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self.lock:
+            watcher = self.watchers.get(train_id)
+            if watcher is None:
+                watcher = self.watchers[train_id] = TrainWatcher(self, train_id)
+                watcher.thread.start()
+            with watcher.lock:
+                watcher.subscribers.add(subscriber)
+                snapshot = dict(watcher.snapshot) if watcher.snapshot else None
+        return subscriber, snapshot
+
+    def unsubscribe(self, train_id, subscriber):
+        with self.lock:
+            watcher = self.watchers.get(train_id)
+            if watcher is None:
+                return
+            with watcher.lock:
+                watcher.subscribers.discard(subscriber)
+                idle = not watcher.subscribers
+            if idle:
+                watcher.stopped.set()
+                del self.watchers[train_id]
+
+    def subscriber_count(self, train_id=None):
+        with self.lock:
+            if train_id is not None:
+                watcher = self.watchers.get(train_id)
+                return len(watcher.subscribers) if watcher else 0
+            return sum(len(watcher.subscribers) for watcher in self.watchers.values())
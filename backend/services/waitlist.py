@@ -0,0 +1,213 @@
+from datetime import datetime
+from pymongo import ReturnDocument, UpdateOne
+from backend.services.seat_inventory import release_seats_bulk
+from backend.utils.helpers import parse_booking_seats
+from backend.utils.transactions import run_in_transaction
+
+# Passengers per queue who hold RAC (reservation against cancellation); the rest are waitlisted
+RAC_LIMIT = 10
+# Largest party that can join a waitlist in one entry
+MAX_WAITLIST_SEATS = 6
+
+# Queue tiers: RAC entries are always promoted before waitlisted ones
+RAC = 0
+WAITLIST = 1
+TIER_NAMES = {RAC: 'RAC', WAITLIST: 'WL'}
+
+
+# Function to share quota allocations out between the parts of a cancelled booking.
+# `shares` is a list of {coach_number: seat count}; returns one allocation list per share.
+def divide_quota(allocations, shares):
+    pool = [dict(allocation) for allocation in allocations]
+    divided = []
+    for share in shares:
+        taken = []
+        for coach_number, count in share.items():
+            for allocation in pool:
+                if allocation['coach_number'] != coach_number or not allocation['seats'] or not count:
+                    continue
+                seats = min(allocation['seats'], count)
+                allocation['seats'] -= seats
+                count -= seats
+                taken.append(dict(allocation, seats=seats))
+        divided.append(taken)
+    return divided
+
+
+def count_by_coach(seats):
+    counts = {}
+    for coach_number, _ in seats:
+        counts[coach_number] = counts.get(coach_number, 0) + 1
+    return counts
+
+
+class WaitlistEngine:
+    """Priority queues of passengers waiting for seats, one per (train, date, class).
+
+    Entries are ordered by tier (RAC before WL) and then by a per-queue sequence
+    number handed out atomically on join. When a booking is cancelled its seats
+    go straight to the head of the matching queue: the seats stay booked in the
+    coach inventory and only change hands, so promotion needs no inventory writes.
+    Seats nobody was waiting for are released in one bulk_write.
+    """
+
+    def __init__(self, db, rac_limit=RAC_LIMIT, fares=None):
+        self.db = db
+        self.rac_limit = rac_limit
+        self.fares = fares
+
+    @staticmethod
+    def queue_key(train_id, date, coach_type):
+        return {'train_id': train_id, 'date': date, 'coach_type': coach_type}
+
+    # Returns the entry with its queue name ('RAC' or 'WL') and 1-based position
+    def describe(self, entry):
+        ahead = self.db.waitlist.count_documents(dict(
+            self.queue_key(entry['train_id'], entry['date'], entry['coach_type']),
+            status='waiting',
+            **{'$or': [{'tier': {'$lt': entry['tier']}}, {'tier': entry['tier'], 'seq': {'$lt': entry['seq']}}]}
+        )) if entry['status'] == 'waiting' else None
+        return dict(entry, queue=TIER_NAMES[entry['tier']], position=ahead + 1 if ahead is not None else None)
+
+    def join(self, user_id, train_id, date, coach_type, seats, segments=None, journey=None):
+        key = self.queue_key(train_id, date, coach_type)
+        counter = self.db.waitlist_counters.find_one_and_update(
+            {'_id': f'{train_id}:{date}:{coach_type}'}, {'$inc': {'seq': 1}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        rac_taken = self.db.waitlist.count_documents(dict(key, status='waiting', tier=RAC))
+        entry = dict(
+            key, user_id=user_id, seats=seats, segments=segments, status='waiting',
+            tier=RAC if rac_taken < self.rac_limit else WAITLIST,
+            seq=counter['seq'], created_at=datetime.utcnow()
+        )
+        if journey:
+            entry.update(journey)
+        entry['_id'] = self.db.waitlist.insert_one(entry).inserted_id
+        return entry
+
+    def get(self, entry_id):
+        return self.db.waitlist.find_one({'_id': entry_id})
+
+    def queue(self, train_id, date, coach_type, limit=100):
+        return list(
+            self.db.waitlist.find(dict(self.queue_key(train_id, date, coach_type), status='waiting'))
+            .sort([('tier', 1), ('seq', 1)]).limit(limit)
+        )
+
+    # Returns True if the entry was still waiting and has now left the queue
+    def leave(self, entry_id):
+        entry = self.db.waitlist.find_one_and_update(
+            {'_id': entry_id, 'status': 'waiting'},
+            {'$set': {'status': 'cancelled', 'cancelled_at': datetime.utcnow()}}
+        )
+        if entry:
+            self._fill_rac(self.queue_key(entry['train_id'], entry['date'], entry['coach_type']))
+        return entry is not None
+
+    # Move the oldest WL entries up to RAC while RAC has room
+    def _fill_rac(self, key, session=None):
+        rac_taken = self.db.waitlist.count_documents(dict(key, status='waiting', tier=RAC), session=session)
+        if rac_taken >= self.rac_limit:
+            return
+        ids = [e['_id'] for e in self.db.waitlist.find(
+            dict(key, status='waiting', tier=WAITLIST), {'_id': 1}, session=session
+        ).sort('seq', 1).limit(self.rac_limit - rac_taken)]
+        if ids:
+            self.db.waitlist.update_many({'_id': {'$in': ids}}, {'$set': {'tier': RAC}}, session=session)
+
+    # Function to cancel a booking and hand its seats to waiting passengers.
+    # The cancellation, every promotion and the release of leftover seats commit
+    # together in one transaction where the deployment supports it.
+    # Returns None if the booking was already cancelled, otherwise
+    # {'promoted': [(entry, booking)], 'released': {coach: [seats]}, 'vacated': [(coach, seat)],
+    # 'quota_released': [...]}, where `vacated` are the released seats now free on every segment.
+    def cancel_booking(self, booking):
+        train_id = booking['train_id']
+        seats = parse_booking_seats(booking.get('seats')) or []
+        coach_types = {c['coach_number']: c.get('coach_type') for c in self.db.coaches.find(
+            {'train_id': train_id, 'coach_number': {'$in': list({coach for coach, _ in seats})}},
+            {'coach_number': 1, 'coach_type': 1}
+        )}
+        freed = {}
+        for coach_number, seat_number in seats:
+            freed.setdefault(coach_types.get(coach_number), []).append((coach_number, seat_number))
+
+        def commit(session):
+            now = datetime.utcnow()
+            cancelled = self.db.bookings.update_one(
+                {'_id': booking['_id'], 'status': {'$ne': 'cancelled'}},
+                {'$set': {'status': 'cancelled', 'cancelled_at': now}}, session=session
+            )
+            if not cancelled.modified_count:
+                return None
+
+            promoted, released = [], {}
+            for coach_type, pool in freed.items():
+                key = self.queue_key(train_id, booking.get('date'), coach_type)
+                # Only parties that fit the freed seats; the cursor stops once they are handed out
+                candidates = self.db.waitlist.find(
+                    dict(key, status='waiting', segments=booking.get('segments'), seats={'$lte': len(pool)}),
+                    session=session
+                ).sort([('tier', 1), ('seq', 1)])
+                for entry in candidates:
+                    if not pool:
+                        break
+                    if entry['seats'] > len(pool):
+                        continue  # party too big for what is left; smaller parties behind it may fit
+                    claimed = self.db.waitlist.find_one_and_update(
+                        {'_id': entry['_id'], 'status': 'waiting'},
+                        {'$set': {'status': 'promoted', 'promoted_at': now}}, session=session
+                    )
+                    if claimed:
+                        promoted.append((entry, pool[:entry['seats']]))
+                        pool = pool[entry['seats']:]
+                for coach_number, seat_number in pool:
+                    released.setdefault(coach_number, []).append(seat_number)
+                if coach_type is not None:
+                    self._fill_rac(key, session)
+
+            # Seats passed on keep their quota; only the quota of released seats goes back
+            shares = [count_by_coach(given) for _, given in promoted]
+            shares.append({coach: len(numbers) for coach, numbers in released.items()})
+            quota_shares = divide_quota(booking.get('quota', []), shares)
+
+            new_bookings = []
+            for (entry, given), quota in zip(promoted, quota_shares):
+                new_booking = {
+                    'user_id': entry['user_id'],
+                    'train_id': train_id,
+                    'train_name': booking.get('train_name'),
+                    'seats': [f'{coach}-{seat}' for coach, seat in given],
+                    'date': booking.get('date'),
+                    'status': 'confirmed',
+                    'waitlist_id': entry['_id'],
+                    'created_at': now
+                }
+                for field in ('from', 'to', 'segments'):
+                    if booking.get(field) is not None:
+                        new_booking[field] = booking[field]
+                if quota:
+                    new_booking['quota'] = quota
+                new_bookings.append(new_booking)
+            if new_bookings:
+                if self.fares is not None:
+                    self.fares.price_bookings(new_bookings)
+                inserted = self.db.bookings.insert_many(new_bookings, session=session).inserted_ids
+                self.db.waitlist.bulk_write([
+                    UpdateOne({'_id': entry['_id']}, {'$set': {'booking_id': booking_id}})
+                    for (entry, _), booking_id in zip(promoted, inserted)
+                ], session=session)
+                for new_booking, booking_id in zip(new_bookings, inserted):
+                    new_booking['_id'] = booking_id
+
+            vacated = []
+            release_seats_bulk(self.db, train_id, released, booking.get('segments'), session, vacated)
+            return {
+                'promoted': [(entry, new_booking) for (entry, _), new_booking in zip(promoted, new_bookings)],
+                'released': released,
+                'vacated': vacated,
+                'quota_released': quota_shares[-1]
+            }
+
+        return run_in_transaction(self.db, commit)
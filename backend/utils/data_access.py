@@ -0,0 +1,110 @@
+import asyncio
+from collections import namedtuple
+
+# Route logic shared by the Flask app (pymongo) and the ASGI app (Motor) is written
+# as generators that yield the steps below instead of calling the driver. run()
+# performs each step with pymongo and run_async() awaits it with Motor, sending the
+# result back into the generator; the value it returns is the handler's result.
+
+# One collection method call: find_one, insert_one, update_one, count_documents, ...
+# ('find' and 'aggregate' return the whole result list)
+Query = namedtuple('Query', 'collection method args kwargs')
+# A read served from the app cache under `key`, loading it with `query` on a miss
+Cached = namedtuple('Cached', 'key query')
+# A blocking call outside MongoDB (Twilio, for example). Async mode awaits
+# `async_func` if given and runs `func` on a worker thread otherwise.
+Call = namedtuple('Call', 'func args async_func')
+
+
+def find_one(collection, *args, **kwargs):
+    return Query(collection, 'find_one', args, kwargs)
+
+
+def find(collection, *args, **kwargs):
+    return Query(collection, 'find', args, kwargs)
+
+
+def aggregate(collection, pipeline):
+    return Query(collection, 'aggregate', (pipeline,), {})
+
+
+def insert_one(collection, document):
+    return Query(collection, 'insert_one', (document,), {})
+
+
+def update_one(collection, *args, **kwargs):
+    return Query(collection, 'update_one', args, kwargs)
+
+
+def delete_many(collection, *args, **kwargs):
+    return Query(collection, 'delete_many', args, kwargs)
+
+
+def count_documents(collection, *args, **kwargs):
+    return Query(collection, 'count_documents', args, kwargs)
+
+
+def call(func, *args, async_func=None):
+    return Call(func, args, async_func)
+
+
+def _execute(db, step, cache):
+    if isinstance(step, Cached):
+        if cache is None:
+            return _execute(db, step.query, cache)
+        return cache.get_or_load(step.key, lambda: _execute(db, step.query, cache))
+    if isinstance(step, Call):
+        return step.func(*step.args)
+    collection = db[step.collection]
+    if step.method in ('find', 'aggregate'):
+        return list(getattr(collection, step.method)(*step.args, **step.kwargs))
+    return getattr(collection, step.method)(*step.args, **step.kwargs)
+
+
+async def _execute_async(db, step, cache):
+    if isinstance(step, Cached):
+        if cache is None:
+            return await _execute_async(db, step.query, cache)
+        # The cache may be Redis, whose client blocks: it is used from a worker thread
+        loop = asyncio.get_running_loop()
+        value = await loop.run_in_executor(None, cache.lookup, step.key)
+        if value is None:
+            value = await _execute_async(db, step.query, cache)
+            await loop.run_in_executor(None, cache.store, step.key, value)
+        return value
+    if isinstance(step, Call):
+        if step.async_func is not None:
+            return await step.async_func(*step.args)
+        return await asyncio.get_running_loop().run_in_executor(None, step.func, *step.args)
+    collection = db[step.collection]
+    if step.method in ('find', 'aggregate'):
+        return await getattr(collection, step.method)(*step.args, **step.kwargs).to_list(length=None)
+    return await getattr(collection, step.method)(*step.args, **step.kwargs)
+
+
+# Function to run a handler generator against a pymongo database
+def run(handler, db, cache=None):
+    value, error = None, None
+    while True:
+        try:
+            step = handler.throw(error) if error is not None else handler.send(value)
+        except StopIteration as done:
+            return done.value
+        try:
+            value, error = _execute(db, step, cache), None
+        except Exception as e:
+            value, error = None, e
+
+
+# Function to run a handler generator against a Motor database from a coroutine
+async def run_async(handler, db, cache=None):
+    value, error = None, None
+    while True:
+        try:
+            step = handler.throw(error) if error is not None else handler.send(value)
+        except StopIteration as done:
+            return done.value
+        try:
+            value, error = await _execute_async(db, step, cache), None
+        except Exception as e:
+            value, error = None, e
@@ -0,0 +1,42 @@
+from pymongo import MongoClient
+
+# app.config keys -> MongoClient options; unset keys keep the driver defaults
+CLIENT_OPTIONS = {
+    'MONGO_MAX_POOL_SIZE': 'maxPoolSize',
+    'MONGO_MIN_POOL_SIZE': 'minPoolSize',
+    'MONGO_MAX_IDLE_TIME_MS': 'maxIdleTimeMS',
+    'MONGO_WAIT_QUEUE_TIMEOUT_MS': 'waitQueueTimeoutMS',
+    'MONGO_CONNECT_TIMEOUT_MS': 'connectTimeoutMS',
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS': 'serverSelectionTimeoutMS',
+    'MONGO_SOCKET_TIMEOUT_MS': 'socketTimeoutMS',
+    'MONGO_READ_PREFERENCE': 'readPreference',
+    'MONGO_WRITE_CONCERN': 'w',
+    'MONGO_WRITE_TIMEOUT_MS': 'wTimeoutMS',
+    'MONGO_JOURNAL': 'journal',
+}
+
+
+# Function to translate app config into MongoClient keyword arguments
+def mongo_client_options(config):
+    options = {}
+    for key, option in CLIENT_OPTIONS.items():
+        value = config.get(key)
+        if value is None or value == '':
+            continue
+        # Write concern is a node count or a tag such as 'majority'
+        if option == 'w' and str(value).isdigit():
+            value = int(value)
+        options[option] = value
+    return options
+
+
+# Function to create the app's MongoClient from config, with optional pymongo event listeners
+def create_mongo_client(config, event_listeners=None):
+    return MongoClient(config['MONGO_URI'], event_listeners=event_listeners or [], **mongo_client_options(config))
+
+
+# Function to create the Motor client used by the async serving mode (backend/asgi.py);
+# takes the same pool and timeout options as the pymongo client
+def create_motor_client(config, event_listeners=None):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    return AsyncIOMotorClient(config['MONGO_URI'], event_listeners=event_listeners or [], **mongo_client_options(config))
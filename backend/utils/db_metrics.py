@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import deque
+from flask import request
+from pymongo import monitoring
+from backend.utils.serialization import json_response
+
+# Commands slower than this are listed individually on /metrics
+SLOW_COMMAND_MS = 100
+# Slow commands kept for /metrics (oldest dropped first)
+MAX_SLOW_COMMANDS = 50
+
+
+class RequestDbStats:
+    """DB activity of one HTTP request."""
+
+    def __init__(self):
+        self.commands = 0
+        self.db_ms = 0.0
+        self.slow = 0
+        self.pool_wait_ms = 0.0
+        self.pool_timeouts = 0
+
+
+class DbMetrics(monitoring.CommandListener, monitoring.ConnectionPoolListener):
+    """pymongo command and pool listener that attributes DB work to Flask routes.
+
+    Listener callbacks run on the thread that issued the command, so activity is
+    charged to the request being served by that thread. Commands from background
+    workers (notifications, tracking watchers) only show up in the pool totals.
+    """
+
+    def __init__(self, slow_ms=SLOW_COMMAND_MS, max_slow_commands=MAX_SLOW_COMMANDS):
+        self.slow_ms = slow_ms
+        self.slow_commands = deque(maxlen=max_slow_commands)
+        self.routes = {}
+        self.connections_in_use = 0
+        self.max_connections_in_use = 0
+        self.checkout_failures = 0
+        self._collections = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    # --- Request scope ---
+    def begin_request(self):
+        self._local.stats = RequestDbStats()
+        self._local.route = None
+
+    def end_request(self, route):
+        stats = getattr(self._local, 'stats', None)
+        self._local.stats = None
+        if stats is None:
+            return None
+        with self._lock:
+            totals = self.routes.setdefault(route, {
+                'requests': 0, 'commands': 0, 'db_ms': 0.0, 'max_commands': 0,
+                'slow_commands': 0, 'pool_wait_ms': 0.0, 'pool_timeouts': 0
+            })
+            totals['requests'] += 1
+            totals['commands'] += stats.commands
+            totals['db_ms'] += stats.db_ms
+            totals['max_commands'] = max(totals['max_commands'], stats.commands)
+            totals['slow_commands'] += stats.slow
+            totals['pool_wait_ms'] += stats.pool_wait_ms
+            totals['pool_timeouts'] += stats.pool_timeouts
+        return stats
+
+    # --- CommandListener ---
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        self._collections[event.request_id] = target if isinstance(target, str) else event.command.get('collection')
+
+    def succeeded(self, event):
+        self._record(event, failed=False)
+
+    def failed(self, event):
+        self._record(event, failed=True)
+
+    def _record(self, event, failed):
+        collection = self._collections.pop(event.request_id, None)
+        duration_ms = event.duration_micros / 1000
+        stats = getattr(self._local, 'stats', None)
+        if stats is not None:
+            stats.commands += 1
+            stats.db_ms += duration_ms
+        if duration_ms >= self.slow_ms:
+            if stats is not None:
+                stats.slow += 1
+            self.slow_commands.append({
+                'route': getattr(self._local, 'route', None) if stats is not None else None,
+                'command': event.command_name,
+                'collection': collection,
+                'duration_ms': round(duration_ms, 2),
+                'failed': failed,
+                'at': time.time()
+            })
+
+    # --- ConnectionPoolListener ---
+    def connection_check_out_started(self, event):
+        self._local.checkout_started = time.monotonic()
+
+    def connection_checked_out(self, event):
+        self._charge_pool_wait()
+        with self._lock:
+            self.connections_in_use += 1
+            self.max_connections_in_use = max(self.max_connections_in_use, self.connections_in_use)
+
+    def connection_check_out_failed(self, event):
+        self._charge_pool_wait()
+        stats = getattr(self._local, 'stats', None)
+        if stats is not None:
+            stats.pool_timeouts += 1
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.connections_in_use -= 1
+
+    def _charge_pool_wait(self):
+        started = getattr(self._local, 'checkout_started', None)
+        stats = getattr(self._local, 'stats', None)
+        if started is not None and stats is not None:
+            stats.pool_wait_ms += (time.monotonic() - started) * 1000
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    # --- Reporting ---
+    def snapshot(self):
+        with self._lock:
+            routes = {route: dict(totals) for route, totals in self.routes.items()}
+            pool = {
+                'connections_in_use': self.connections_in_use,
+                'max_connections_in_use': self.max_connections_in_use,
+                'checkout_failures': self.checkout_failures
+            }
+        for totals in routes.values():
+            totals['avg_commands'] = round(totals['commands'] / totals['requests'], 2)
+            totals['avg_db_ms'] = round(totals['db_ms'] / totals['requests'], 2)
+            totals['db_ms'] = round(totals['db_ms'], 2)
+            totals['pool_wait_ms'] = round(totals['pool_wait_ms'], 2)
+        return {'routes': routes, 'pool': pool, 'slow_commands': list(self.slow_commands)}
+
+    # Function to hook the listener into a Flask app: per-request X-DB-* response
+    # headers and a GET /metrics endpoint
+    def init_app(self, app, headers=True):
+        @app.before_request
+        def begin_db_metrics():
+            self.begin_request()
+            self._local.route = f'{request.method} {request.url_rule.rule if request.url_rule else "<unmatched>"}'
+
+        @app.after_request
+        def end_db_metrics(response):
+            stats = self.end_request(getattr(self._local, 'route', None))
+            if headers and stats is not None:
+                response.headers['X-DB-Commands'] = str(stats.commands)
+                response.headers['X-DB-Time-Ms'] = f'{stats.db_ms:.2f}'
+                response.headers['X-DB-Slow-Commands'] = str(stats.slow)
+                response.headers['X-DB-Pool-Wait-Ms'] = f'{stats.pool_wait_ms:.2f}'
+            return response
+
+        @app.teardown_request
+        def clear_db_metrics(error=None):
+            self._local.stats = None
+
+        @app.route('/metrics', methods=['GET'])
+        def db_metrics():
+            return json_response(self.snapshot())
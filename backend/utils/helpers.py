@@ -1,7 +1,10 @@
 import json
 from bson import ObjectId
 from datetime import datetime
+from functools import lru_cache
 import random
+import numpy as np
+from backend.utils.serialization import dumps, to_json_compatible
 
 # Custom JSON encoder to handle MongoDB ObjectId and datetime
 class JSONEncoder(json.JSONEncoder):
@@ -14,7 +17,40 @@ class JSONEncoder(json.JSONEncoder):
 
 # Function to convert MongoDB document to JSON
 def doc_to_json(doc):
-    return json.loads(json.dumps(doc, cls=JSONEncoder))
+    return to_json_compatible(doc)
+
+# Function to format one Server-Sent Events message; `event_id` lets a reconnecting
+# client resume from its Last-Event-ID
+def format_sse(event, data, event_id=None):
+    prefix = f"id: {event_id}\n" if event_id is not None else ''
+    return f"{prefix}event: {event}\ndata: {dumps(data).decode('utf-8')}\n\n"
+
+# Function to split booking seat ids ('A1-12') into (coach_number, seat_number) pairs.
+# Returns None if the list is empty or any seat id is malformed.
+def parse_booking_seats(seats):
+    if not isinstance(seats, list) or not seats:
+        return None
+    pairs = []
+    for seat in seats:
+        if not isinstance(seat, str) or '-' not in seat:
+            return None
+        coach_number, seat_number = seat.rsplit('-', 1)
+        if not coach_number or not seat_number.isdigit():
+            return None
+        pairs.append((coach_number, seat_number))
+    return pairs
+
+# Function to build a keyset cursor ('<created_at>_<_id>') pointing after a document
+def encode_keyset_cursor(doc):
+    return f"{doc['created_at'].isoformat()}_{doc['_id']}"
+
+# Function to parse a keyset cursor back into (created_at, _id); None if malformed
+def decode_keyset_cursor(cursor):
+    created_at, _, object_id = (cursor or '').partition('_')
+    try:
+        return datetime.fromisoformat(created_at), ObjectId(object_id)
+    except Exception:
+        return None
 
 # Function to validate ObjectId
 def is_valid_object_id(id_str):
@@ -55,37 +91,137 @@ def generate_mock_location(train_id, source, destination):
         "updated_at": datetime.utcnow()
     }
 
+# Berth types along a coach, repeating every len(cycle) seats: seat n is cycle[n % len(cycle)].
+# Coach types without a cycle have only general seats.
+SEAT_TYPE_CYCLES = {
+    'sleeper': ('side upper', 'lower', 'middle', 'upper', 'lower', 'middle', 'upper', 'side lower'),
+    'AC': ('upper', 'lower', 'lower', 'middle', 'middle', 'upper'),
+}
+DEFAULT_SEAT_TYPE = 'general'
+
+# Function to get the seat types of a whole coach, seat 1 first. Computed once per
+# (coach type, size) and shared, so callers must not change the result.
+@lru_cache(maxsize=256)
+def seat_layout(coach_type, total_seats):
+    cycle = SEAT_TYPE_CYCLES.get(coach_type)
+    if cycle is None:
+        return (DEFAULT_SEAT_TYPE,) * total_seats
+    return tuple(np.asarray(cycle)[np.arange(1, total_seats + 1) % len(cycle)].tolist())
+
 # Function to generate seat map for a coach
 def generate_seat_map(total_seats, coach_type):
-    seat_map = {}
-    
-    for i in range(1, total_seats + 1):
-        seat_map[str(i)] = {
-            "available": True,
-            "type": get_seat_type(i, coach_type)
-        }
-    
-    return seat_map
+    return {
+        str(i): {"available": True, "type": seat_type}
+        for i, seat_type in enumerate(seat_layout(coach_type, total_seats), start=1)
+    }
 
 # Function to determine seat type based on seat number and coach type
 def get_seat_type(seat_number, coach_type):
-    if coach_type == "sleeper":
-        if seat_number % 8 in [1, 4]:
-            return "lower"
-        elif seat_number % 8 in [2, 5]:
-            return "middle"
-        elif seat_number % 8 in [3, 6]:
-            return "upper"
-        elif seat_number % 8 == 7:
-            return "side lower"
-        else:  # seat_number % 8 == 0
-            return "side upper"
-    elif coach_type == "AC":
-        if seat_number % 6 in [1, 2]:
-            return "lower"
-        elif seat_number % 6 in [3, 4]:
-            return "middle"
-        else:  # seat_number % 6 in [5, 0]
-            return "upper"
-    else:  # general
-        return "general"
\ No newline at end of file
+    cycle = SEAT_TYPE_CYCLES.get(coach_type)
+    return cycle[int(seat_number) % len(cycle)] if cycle else DEFAULT_SEAT_TYPE
+
+# --- Compact seat inventory ---
+# Coaches store booked seats as a list of 32-bit words ('seat_bits'), one bit per
+# seat (bit set = booked). Seat types are not stored; they come from seat_layout.
+SEAT_WORD_BITS = 32
+
+# Function to build an all-free seat bitmap for a coach
+def generate_seat_bits(total_seats):
+    return [0] * ((total_seats + SEAT_WORD_BITS - 1) // SEAT_WORD_BITS)
+
+# Function to locate a seat in the bitmap: returns (word index, bit mask)
+def seat_bit_position(seat_number):
+    index = int(seat_number) - 1
+    return index // SEAT_WORD_BITS, 1 << (index % SEAT_WORD_BITS)
+
+# Function to check whether a seat is booked in a bitmap
+def is_seat_bit_set(seat_bits, seat_number):
+    word, mask = seat_bit_position(seat_number)
+    return word < len(seat_bits) and bool(seat_bits[word] & mask)
+
+# Function to read a seat_map entry in any of its stored shapes
+# ({'available': bool, 'type': ...} or the bare 'available'/'unavailable' strings)
+def is_seat_entry_available(entry):
+    if isinstance(entry, dict):
+        return entry.get('available', True) is not False
+    return entry != 'unavailable'
+
+# Function to encode a JSON seat map into a seat bitmap
+def encode_seat_map(seat_map, total_seats=None):
+    numbered = {int(n): entry for n, entry in seat_map.items() if str(n).isdigit()}
+    if total_seats is None:
+        total_seats = max(numbered, default=0)
+    seat_bits = generate_seat_bits(total_seats)
+    for seat_number, entry in numbered.items():
+        if not is_seat_entry_available(entry) and 0 < seat_number <= total_seats:
+            word, mask = seat_bit_position(seat_number)
+            seat_bits[word] |= mask
+    return seat_bits
+
+# Function to unpack a seat bitmap into one booked flag per seat (seat 1 first)
+def seat_bits_booked(seat_bits, total_seats):
+    words = np.zeros((total_seats + SEAT_WORD_BITS - 1) // SEAT_WORD_BITS, dtype='<u4')
+    stored = seat_bits[:len(words)]
+    words[:len(stored)] = stored
+    return np.unpackbits(words.view(np.uint8), bitorder='little')[:total_seats].astype(bool).tolist()
+
+# Function to decode a seat bitmap into the JSON seat map returned by the API
+def decode_seat_bits(seat_bits, total_seats, coach_type):
+    return {
+        str(i): {"available": not booked, "type": seat_type}
+        for i, (booked, seat_type) in enumerate(
+            zip(seat_bits_booked(seat_bits, total_seats), seat_layout(coach_type, total_seats)), start=1
+        )
+    }
+
+# Function to get the JSON seat map of a coach document in any storage format.
+# For segment-aware coaches, `segments` limits availability to part of the route.
+def coach_seat_map(coach, segments=None):
+    coach_type = coach.get('coach_type', 'general')
+    if 'segment_bits' in coach:
+        mask = segments or FULL_ROUTE_MASK
+        layout = seat_layout(coach_type, len(coach['segment_bits']))
+        return {
+            str(i): {"available": not occupied & mask, "type": seat_type}
+            for i, (occupied, seat_type) in enumerate(zip(coach['segment_bits'], layout), start=1)
+        }
+    if 'seat_bits' in coach:
+        total_seats = coach.get('total_seats') or len(coach['seat_bits']) * SEAT_WORD_BITS
+        return decode_seat_bits(coach['seat_bits'], total_seats, coach_type)
+    seat_map = coach.get('seat_map', {})
+    total_seats = coach.get('total_seats') or max((int(n) for n in seat_map if str(n).isdigit()), default=0)
+    return decode_seat_bits(encode_seat_map(seat_map, total_seats), total_seats, coach_type)
+
+
+# --- Journey segments ---
+# A train's route is its list of stops; segment k runs from stops[k] to stops[k + 1].
+# Segment-aware coaches keep 'segment_bits': one integer per seat whose bit k is set
+# when the seat is sold on segment k. 62 segments keep every mask a positive int64.
+MAX_SEGMENTS = 62
+FULL_ROUTE_MASK = (1 << MAX_SEGMENTS) - 1
+
+# Function to get the ordered stop list of a train
+def route_stops(train):
+    return train.get('stops') or [train.get('source'), train.get('destination')]
+
+# Function to build the mask of segments travelled between two stop indexes
+def segment_mask(from_index, to_index):
+    return ((1 << to_index) - 1) ^ ((1 << from_index) - 1)
+
+# Function to resolve station names to a segment mask (None = whole route)
+def journey_segment_mask(train, from_station=None, to_station=None):
+    if not from_station and not to_station:
+        return None
+    stops = route_stops(train)
+    try:
+        from_index = stops.index(from_station) if from_station else 0
+        to_index = stops.index(to_station) if to_station else len(stops) - 1
+    except ValueError:
+        raise ValueError('Station is not on this train\'s route')
+    if from_index >= to_index:
+        raise ValueError('Destination must come after the boarding station')
+    return segment_mask(from_index, to_index)
+
+# Function to build an all-free segment inventory for a coach
+def generate_segment_bits(total_seats):
+    return [0] * total_seats
@@ -0,0 +1,77 @@
+import json
+from datetime import date, datetime
+from bson import ObjectId
+from flask import Response
+
+# orjson is optional: it is several times faster and handles datetime natively
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_MIMETYPE = 'application/json'
+
+
+# Types neither encoder knows about: ObjectId, plus datetime for the stdlib encoder
+def _default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+# Function to encode a payload of BSON documents to JSON bytes in a single pass
+if orjson is not None:
+    def dumps(payload):
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_NON_STR_KEYS)
+else:
+    _encoder = json.JSONEncoder(default=_default, ensure_ascii=False, separators=(',', ':'))
+
+    def dumps(payload):
+        return _encoder.encode(payload).encode('utf-8')
+
+
+# Function to decode JSON bytes or text (one NDJSON line, for example); raises ValueError
+if orjson is not None:
+    def loads(data):
+        return orjson.loads(data)
+else:
+    loads = json.loads
+
+
+# Function to build a JSON response straight from BSON documents, replacing
+# jsonify(json.loads(json.dumps(doc, default=str))) which encoded everything three times
+def json_response(payload, status=200):
+    return Response(dumps(payload), status=status, mimetype=JSON_MIMETYPE)
+
+
+# Function to convert a document to plain JSON types in one walk, for callers
+# that need Python objects rather than encoded bytes
+def to_json_compatible(obj):
+    if isinstance(obj, dict):
+        return {str(key): to_json_compatible(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_json_compatible(value) for value in obj]
+    if isinstance(obj, (ObjectId, datetime, date)):
+        return _default(obj)
+    return obj
+
+
+# Function to turn a ?fields=name,source query parameter into a MongoDB projection,
+# so documents are only loaded with the fields the client asked for.
+# Returns None when no fields were requested; unknown fields are dropped if `allowed` is given.
+def parse_fields(value, allowed=None):
+    if not value:
+        return None
+    fields = [f.strip() for f in value.split(',') if f.strip() and not f.strip().startswith('$')]
+    if allowed is not None:
+        fields = [f for f in fields if f in allowed]
+    return {field: 1 for field in sorted(set(fields))} or None
+
+
+# Function to pick projected fields from a document that is already loaded (e.g. cached)
+def project(doc, projection):
+    if not projection or doc is None:
+        return doc
+    return {key: value for key, value in doc.items() if key == '_id' or key in projection}
@@ -0,0 +1,22 @@
+from pymongo.errors import ConfigurationError, OperationFailure
+
+# Server error code for "Transaction numbers are only allowed on a replica set member or mongos"
+ILLEGAL_OPERATION = 20
+
+
+# Function to run callback(session) inside a multi-document transaction.
+# with_transaction retries the whole callback on transient errors, so the callback
+# must not mutate outside state. Deployments without transaction support (standalone
+# mongod, mongomock) run the callback once with session=None instead.
+def run_in_transaction(db, callback):
+    try:
+        session = db.client.start_session()
+    except (ConfigurationError, NotImplementedError):
+        return callback(None)
+    try:
+        with session:
+            return session.with_transaction(callback)
+    except OperationFailure as e:
+        if e.code != ILLEGAL_OPERATION:
+            raise
+    return callback(None)
@@ -0,0 +1,356 @@
+"""
+Booking API load test
+
+Seeds a synthetic timetable (trains, coaches, users and bookings) at the chosen
+scale, then drives the Flask app from register_routes with concurrent clients
+running a weighted mix of passenger requests. Reports p50/p95/p99 latency and
+throughput per endpoint, and can save the run as JSON and compare it with an
+earlier one so regressions show up between commits:
+
+    python benchmarks/api_load.py --mock --trains 50 --clients 8 --requests 2000
+    python benchmarks/api_load.py --mongo-uri mongodb://localhost:27017 --output before.json
+    python benchmarks/api_load.py --mongo-uri mongodb://localhost:27017 --compare before.json
+
+With --url the same mix is sent over HTTP to a running server (seed it first
+with --seed-only against the server's database).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask  # noqa: E402
+from backend.api.routes import register_routes  # noqa: E402
+from backend.models.indexes import ensure_indexes  # noqa: E402
+from backend.utils.helpers import generate_seat_bits, generate_seat_map  # noqa: E402
+
+STATIONS = ['Chennai', 'Mumbai', 'Delhi', 'Kolkata', 'Bengaluru', 'Hyderabad', 'Pune', 'Ahmedabad', 'Jaipur', 'Lucknow']
+COACH_TYPES = [('sleeper', 72), ('3A', 64), ('2A', 48), ('1A', 24)]
+SEEDED_COLLECTIONS = ['trains', 'coaches', 'users', 'bookings', 'seat_holds', 'quotas', 'alerts', 'tracking',
+                      'availability_summary', 'waitlist']
+
+# p95 growth (percent) that --compare reports as a regression
+REGRESSION_THRESHOLD = 20.0
+
+
+def get_db(args):
+    if args.mock:
+        import mongomock
+        return mongomock.MongoClient().railway_reservation_bench
+    from pymongo import MongoClient
+    return MongoClient(args.mongo_uri, maxPoolSize=max(args.clients * 2, 10)).railway_reservation_bench
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)] if ordered else 0.0
+
+
+# Function to fill the database with a synthetic timetable; returns what the clients need
+def seed(db, args):
+    rng = random.Random(args.seed)
+    for name in SEEDED_COLLECTIONS:
+        db[name].drop()
+    ensure_indexes(db)
+
+    trains = []
+    for n in range(args.trains):
+        source, destination = rng.sample(STATIONS, 2)
+        stops = [source] + rng.sample([s for s in STATIONS if s not in (source, destination)], 2) + [destination]
+        trains.append({
+            'name': f'Bench Express {n}', 'source': source, 'destination': destination, 'stops': stops,
+            'departure_time': f'{rng.randrange(24):02d}:{rng.randrange(60):02d}', 'arrival_time': '23:59',
+            'distance': rng.randrange(200, 2500), 'run_days': rng.sample(['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'], 5),
+            'total_seats': 0, 'available_seats': 0, 'status': 'scheduled', 'created_at': datetime.utcnow()
+        })
+    train_ids = db.trains.insert_many(trains).inserted_ids
+
+    coaches = []
+    for train_id in train_ids:
+        for k in range(args.coaches):
+            coach_type, seats = COACH_TYPES[k % len(COACH_TYPES)]
+            coach = {'train_id': train_id, 'coach_number': f'{coach_type[0].upper()}{k + 1}',
+                     'coach_type': coach_type, 'total_seats': seats}
+            # --legacy-seat-maps measures the old JSON seat map format
+            if args.legacy_seat_maps:
+                coach['seat_map'] = generate_seat_map(seats, coach_type)
+            else:
+                coach['seat_bits'] = generate_seat_bits(seats)
+            coaches.append(coach)
+    db.coaches.insert_many(coaches)
+
+    user_ids = db.users.insert_many([
+        {'name': f'Passenger {n}', 'email': f'p{n}@bench.example', 'phone': f'+9198{n:08d}'}
+        for n in range(args.users)
+    ]).inserted_ids
+
+    # Historic bookings for the booking history endpoints (they do not occupy seats)
+    now = datetime.utcnow()
+    bookings = [{
+        'user_id': rng.choice(user_ids), 'train_id': rng.choice(train_ids), 'train_name': 'Bench Express',
+        'seats': [f'S1-{rng.randrange(1, 73)}'], 'date': (now - timedelta(days=rng.randrange(365))).strftime('%Y-%m-%d'),
+        'status': rng.choice(['completed', 'completed', 'cancelled']), 'price': rng.randrange(200, 4000),
+        'created_at': now - timedelta(minutes=n)
+    } for n in range(args.bookings)]
+    if bookings:
+        db.bookings.insert_many(bookings)
+
+    return {
+        'trains': [(train_id, train['source'], train['destination']) for train_id, train in zip(train_ids, trains)],
+        'coaches': [(c['train_id'], c['coach_number'], c['total_seats']) for c in coaches],
+        'users': [str(user_id) for user_id in user_ids],
+    }
+
+
+class InProcessClient:
+    """Requests through the Flask test client: no network, only the app and the database."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpClient:
+    """Requests over HTTP to a running server."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'} if data else {})
+        try:
+            with urllib.request.urlopen(req, timeout=30) as response:
+                return response.status, json.loads(response.read() or b'null')
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+
+# The request mix: (endpoint name, weight, function(client, data, rng) -> status code).
+# 409 (seat taken) and 404 are expected answers under load, not failures.
+def search(client, data, rng):
+    _, source, destination = rng.choice(data['trains'])
+    return client.request('GET', f'/api/trains/search?from={source}&to={destination}&passengers=2')[0]
+
+
+def get_train(client, data, rng):
+    return client.request('GET', f'/api/trains/{rng.choice(data["trains"])[0]}')[0]
+
+
+def availability(client, data, rng):
+    return client.request('GET', f'/api/trains/{rng.choice(data["trains"])[0]}/availability')[0]
+
+
+def seat_map(client, data, rng):
+    train_id, coach_number, _ = rng.choice(data['coaches'])
+    return client.request('GET', f'/api/trains/{train_id}/coaches/{coach_number}/seatmap')[0]
+
+
+def booking_history(client, data, rng):
+    return client.request('GET', f'/api/bookings/{rng.choice(data["users"])}?limit=20')[0]
+
+
+def lock_and_unlock(client, data, rng):
+    train_id, coach_number, seats = rng.choice(data['coaches'])
+    seat = {'train_id': str(train_id), 'coach_number': coach_number, 'seat_number': rng.randrange(1, seats + 1),
+            'user_id': rng.choice(data['users'])}
+    status = client.request('POST', '/api/bookings/lock', seat)[0]
+    if status == 200:
+        client.request('POST', '/api/bookings/unlock', seat)
+    return status
+
+
+def book(client, data, rng):
+    train_id, coach_number, seats = rng.choice(data['coaches'])
+    return client.request('POST', '/api/bookings', {
+        'train_id': str(train_id), 'user_id': rng.choice(data['users']),
+        'seats': [f'{coach_number}-{rng.randrange(1, seats + 1)}'], 'date': datetime.utcnow().strftime('%Y-%m-%d')
+    })[0]
+
+
+def alerts(client, data, rng):
+    return client.request('GET', '/api/alerts')[0]
+
+
+SCENARIOS = [
+    ('GET /api/trains/search', 30, search),
+    ('GET /api/trains/<id>', 10, get_train),
+    ('GET /api/trains/<id>/availability', 10, availability),
+    ('GET .../seatmap', 15, seat_map),
+    ('GET /api/bookings/<user_id>', 10, booking_history),
+    ('POST /api/bookings/lock+unlock', 10, lock_and_unlock),
+    ('POST /api/bookings', 10, book),
+    ('GET /api/alerts', 5, alerts),
+]
+
+
+# Function to run the request mix from `clients` threads; returns {endpoint: [(seconds, status)]}
+def run_load(make_client, data, args):
+    samples = defaultdict(list)
+    lock = threading.Lock()
+    names, weights = [s[0] for s in SCENARIOS], [s[1] for s in SCENARIOS]
+    functions = {name: fn for name, _, fn in SCENARIOS}
+    per_client = args.requests // args.clients
+    barrier = threading.Barrier(args.clients)
+
+    def client_loop(n):
+        rng = random.Random(args.seed * 1000 + n)
+        client = make_client()
+        local = defaultdict(list)
+        barrier.wait()
+        for _ in range(per_client):
+            name = rng.choices(names, weights)[0]
+            began = time.perf_counter()
+            try:
+                status = functions[name](client, data, rng)
+            except Exception:
+                status = 599
+            local[name].append((time.perf_counter() - began, status))
+        with lock:
+            for name, results in local.items():
+                samples[name].extend(results)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        list(pool.map(client_loop, range(args.clients)))
+    return samples, time.perf_counter() - start
+
+
+def summarise(samples, elapsed):
+    endpoints = {}
+    for name, results in sorted(samples.items()):
+        latencies = [seconds for seconds, _ in results]
+        endpoints[name] = {
+            'requests': len(results),
+            'errors': sum(1 for _, status in results if status >= 500),
+            'throughput_rps': round(len(results) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'max_ms': round(max(latencies) * 1000, 2),
+        }
+    every = [seconds for results in samples.values() for seconds, _ in results]
+    total = {
+        'requests': len(every),
+        'errors': sum(e['errors'] for e in endpoints.values()),
+        'throughput_rps': round(len(every) / elapsed, 1),
+        'p50_ms': round(percentile(every, 50) * 1000, 2),
+        'p95_ms': round(percentile(every, 95) * 1000, 2),
+        'p99_ms': round(percentile(every, 99) * 1000, 2),
+        'elapsed_s': round(elapsed, 2),
+    }
+    return endpoints, total
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# Function to print p95 changes against an earlier run; returns the endpoints that regressed
+def compare(baseline, endpoints, threshold):
+    regressions = []
+    print(f'\ncompared with {baseline.get("commit") or "baseline"} ({baseline.get("started_at")}):')
+    for name, current in endpoints.items():
+        before = baseline['endpoints'].get(name)
+        if not before or not before['p95_ms']:
+            continue
+        change = (current['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+        flag = '  REGRESSION' if change > threshold else ''
+        print(f'  {name:36} p95 {before["p95_ms"]:8.2f} -> {current["p95_ms"]:8.2f} ms ({change:+.0f}%){flag}')
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--mock', action='store_true', help='use mongomock instead of a MongoDB server')
+    parser.add_argument('--url', help='send requests to a running server instead of the in-process app')
+    parser.add_argument('--seed-only', action='store_true', help='seed the database and exit')
+    parser.add_argument('--trains', type=int, default=100)
+    parser.add_argument('--coaches', type=int, default=12, help='coaches per train')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--bookings', type=int, default=10000, help='historic bookings')
+    parser.add_argument('--legacy-seat-maps', action='store_true', help='seed coaches with JSON seat maps')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent clients')
+    parser.add_argument('--requests', type=int, default=5000, help='total requests')
+    parser.add_argument('--seed', type=int, default=42, help='random seed, for repeatable runs')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='earlier results JSON to compare p95 latencies with')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help='p95 regression threshold in percent')
+    args = parser.parse_args()
+
+    db = get_db(args)
+    started_at = datetime.utcnow().isoformat()
+    seed_start = time.perf_counter()
+    data = seed(db, args)
+    print(f'seeded {args.trains} trains, {args.trains * args.coaches} coaches, {args.users} users, '
+          f'{args.bookings} bookings in {time.perf_counter() - seed_start:.1f} s')
+    if args.seed_only:
+        return
+
+    if args.url:
+        def make_client():
+            return HttpClient(args.url)
+    else:
+        app = Flask(__name__)
+        app.config.update(TRACKING_CHANGE_STREAMS=False, AVAILABILITY_RECONCILE_SECONDS=0, TELEMETRY_COALESCE_SECONDS=0)
+        register_routes(app, db)
+
+        def make_client():
+            return InProcessClient(app)
+
+    samples, elapsed = run_load(make_client, data, args)
+    endpoints, total = summarise(samples, elapsed)
+
+    print(f'\n{total["requests"]} requests from {args.clients} clients in {elapsed:.1f} s '
+          f'({total["throughput_rps"]} req/s, {total["errors"]} errors)\n')
+    print(f'  {"endpoint":36} {"requests":>8} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>6}')
+    for name, e in endpoints.items():
+        print(f'  {name:36} {e["requests"]:8} {e["throughput_rps"]:8} {e["p50_ms"]:8} {e["p95_ms"]:8} {e["p99_ms"]:8} {e["errors"]:6}')
+
+    results = {
+        'commit': git_commit(),
+        'started_at': started_at,
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'database': 'mongomock' if args.mock else 'mongodb', 'target': args.url or 'in-process'},
+        'config': {key: getattr(args, key) for key in
+                   ('trains', 'coaches', 'users', 'bookings', 'legacy_seat_maps', 'clients', 'requests', 'seed')},
+        'total': total,
+        'endpoints': endpoints,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'\nresults written to {args.output}')
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), endpoints, args.threshold)
+    sys.exit(1 if total['errors'] or regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
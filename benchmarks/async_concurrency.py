@@ -0,0 +1,220 @@
+"""
+Sync vs async serving mode concurrency benchmark
+
+Starts the app twice with the same number of worker processes, once on gunicorn
+sync workers (backend.app:app) and once on hypercorn (backend.asgi:app), and
+drives each with a rising number of concurrent clients sending tracking and OTP
+requests (OTP verification waits on the stub SMS backend for --sms-latency
+seconds, standing in for Twilio). For every level it reports throughput, p50 and
+p95 latency, errors and the servers' total resident memory, and the highest
+level each mode sustains within --slo-ms at p95 without errors:
+
+    python benchmarks/async_concurrency.py --mongo-uri mongodb://localhost:27017
+    python benchmarks/async_concurrency.py --workers 2 --levels 10,50,100,200,400 --sms-latency 0.3
+
+Both servers are separate processes that share the app's database, so this needs
+a MongoDB server (there is no --mock: Motor cannot run on mongomock). The trains,
+OTP requests and users it creates are removed afterwards. Requires gunicorn,
+hypercorn and aiohttp.
+"""
+import argparse
+import asyncio
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import aiohttp  # noqa: E402
+from pymongo import MongoClient  # noqa: E402
+
+# Tag on the trains this benchmark seeds, and the prefix of its OTP phone numbers
+BENCH_TAG = 'async_concurrency'
+PHONE_PREFIX = '+1999'
+# Code the stub SMS backend approves for every OTP
+OTP_CODE = '424242'
+# Share of each request type in the mix
+MIX = [('tracking', 6), ('send_otp', 2), ('verify_otp', 2)]
+
+SERVERS = {
+    'sync': ['gunicorn', '--workers', '{workers}', '--bind', '127.0.0.1:{port}', 'backend.app:app'],
+    'async': ['hypercorn', '--workers', '{workers}', '--bind', '127.0.0.1:{port}', 'backend.asgi:app'],
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)] if ordered else 0.0
+
+
+def seed(db, trains):
+    db.trains.insert_many([
+        {'name': f'Bench {n}', 'source': 'Chennai', 'destination': 'Mumbai', 'benchmark': BENCH_TAG}
+        for n in range(trains)
+    ])
+    return [str(t['_id']) for t in db.trains.find({'benchmark': BENCH_TAG}, {'_id': 1})]
+
+
+def clean_up(db):
+    train_ids = [t['_id'] for t in db.trains.find({'benchmark': BENCH_TAG}, {'_id': 1})]
+    db.tracking.delete_many({'train_id': {'$in': train_ids}})
+    db.trains.delete_many({'benchmark': BENCH_TAG})
+    phones = {'$regex': f'^\\{PHONE_PREFIX}'}
+    db.otp_requests.delete_many({'phone': phones})
+    db.users.delete_many({'phone': phones})
+
+
+# Function to sum the resident memory (MB) of a server and its worker processes (Linux only)
+def server_rss_mb(pid):
+    pids, rss_kb = {pid}, 0
+    try:
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                with open(f'/proc/{entry}/stat') as f:
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        pids.add(int(entry))
+        for p in pids:
+            with open(f'/proc/{p}/status') as f:
+                rss_kb += next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+    except (OSError, StopIteration):
+        return None
+    return round(rss_kb / 1024, 1)
+
+
+def start_server(mode, args, port):
+    command = [part.format(workers=args.workers, port=port) for part in SERVERS[mode]]
+    env = dict(
+        os.environ, MONGO_URI=args.mongo_uri, SMS_BACKEND='stub', STUB_OTP_CODE=OTP_CODE, STUB_LATENCY_SECONDS=str(args.sms_latency),
+        OTP_THROTTLE_SECONDS='0', TRACKING_CHANGE_STREAMS='false', AVAILABILITY_RECONCILE_SECONDS='0'
+    )
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            start_new_session=True)
+
+
+async def wait_ready(session, base_url, train_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(f'{base_url}/api/tracking/{train_id}') as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f'{base_url} did not start within {timeout} s')
+
+
+async def one_request(session, base_url, kind, train_ids, rng):
+    if kind == 'tracking':
+        request = session.get(f'{base_url}/api/tracking/{rng.choice(train_ids)}')
+    elif kind == 'send_otp':
+        request = session.post(f'{base_url}/api/passenger/send_otp', json={'phone': f'{PHONE_PREFIX}{rng.randrange(10 ** 7):07d}'})
+    else:
+        request = session.post(f'{base_url}/api/passenger/verify_otp',
+                               json={'phone': f'{PHONE_PREFIX}{rng.randrange(10 ** 7):07d}', 'otp': OTP_CODE})
+    async with request as response:
+        await response.read()
+        return response.status
+
+
+# Function to keep `clients` requests in flight for `duration` seconds; returns (latencies, errors, elapsed)
+async def run_level(session, base_url, train_ids, clients, args):
+    names, weights = [m[0] for m in MIX], [m[1] for m in MIX]
+    latencies, errors = [], 0
+    deadline = time.monotonic() + args.duration
+
+    async def client_loop(n):
+        nonlocal errors
+        rng = random.Random(args.seed * 1000 + n)
+        while time.monotonic() < deadline:
+            began = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(
+                    one_request(session, base_url, rng.choices(names, weights)[0], train_ids, rng), args.timeout
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                status = 599
+            latencies.append(time.perf_counter() - began)
+            if status >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(n) for n in range(clients)))
+    return latencies, errors, time.perf_counter() - start
+
+
+async def benchmark_mode(mode, args, train_ids, port):
+    server = start_server(mode, args, port)
+    base_url = f'http://127.0.0.1:{port}'
+    results = []
+    try:
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await wait_ready(session, base_url, train_ids[0])
+            for clients in args.levels:
+                latencies, errors, elapsed = await run_level(session, base_url, train_ids, clients, args)
+                results.append({
+                    'clients': clients,
+                    'requests': len(latencies),
+                    'throughput_rps': round(len(latencies) / elapsed, 1),
+                    'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+                    'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+                    'errors': errors,
+                    'rss_mb': server_rss_mb(server.pid),
+                })
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+    return results
+
+
+# Highest client count served within the p95 SLO with no errors
+def concurrency_limit(results, slo_ms):
+    passing = [r['clients'] for r in results if r['errors'] == 0 and r['p95_ms'] <= slo_ms]
+    return max(passing) if passing else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--workers', type=int, default=2, help='server processes in both modes')
+    parser.add_argument('--levels', default='10,25,50,100,200,400',
+                        type=lambda value: [int(n) for n in value.split(',')], help='concurrent clients per step')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per step')
+    parser.add_argument('--sms-latency', type=float, default=0.2, help='simulated Twilio round trip in seconds')
+    parser.add_argument('--slo-ms', type=float, default=1000, help='p95 latency a step must stay under')
+    parser.add_argument('--timeout', type=float, default=10, help='seconds before a request counts as failed')
+    parser.add_argument('--trains', type=int, default=100)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--modes', default='sync,async')
+    parser.add_argument('--seed', type=int, default=42, help='random seed, for repeatable runs')
+    args = parser.parse_args()
+
+    db = MongoClient(args.mongo_uri).railway_reservation
+    clean_up(db)
+    train_ids = seed(db, args.trains)
+    limits = {}
+    try:
+        for offset, mode in enumerate(args.modes.split(',')):
+            print(f'\n{mode}: {SERVERS[mode][0]} with {args.workers} workers, '
+                  f'{args.sms_latency * 1000:.0f} ms SMS latency')
+            print(f'  {"clients":>7} {"requests":>8} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"errors":>6} {"RSS MB":>7}')
+            results = asyncio.run(benchmark_mode(mode, args, train_ids, args.port + offset))
+            for r in results:
+                print(f'  {r["clients"]:7} {r["requests"]:8} {r["throughput_rps"]:8} {r["p50_ms"]:8} '
+                      f'{r["p95_ms"]:8} {r["errors"]:6} {r["rss_mb"] if r["rss_mb"] is not None else "-":>7}')
+            limits[mode] = concurrency_limit(results, args.slo_ms)
+    finally:
+        clean_up(db)
+
+    print(f'\nconcurrency limit (p95 <= {args.slo_ms:.0f} ms, no errors) with {args.workers} workers:')
+    for mode, limit in limits.items():
+        print(f'  {mode:6} {limit} clients')
+
+
+if __name__ == '__main__':
+    main()
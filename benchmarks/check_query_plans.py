@@ -0,0 +1,346 @@
+"""
+Query plan regression check
+
+Drives the Flask app from register_routes through one request to each API route
+(plus the background jobs they start), records the filter and sort of every
+query the routes and services send, and exits non-zero if any of them is
+planned as a collection scan (COLLSCAN). The queries come from the app itself,
+so a route that changes its query is checked as it is now. Indexes are created
+with backend.models.indexes.ensure_indexes first, exactly as app.py does at
+startup.
+
+    python benchmarks/check_query_plans.py --mongo-uri mongodb://localhost:27017
+
+mongomock has no query planner, so with --mock each query is instead checked
+against the declared indexes: some index must start with a field the query
+filters or sorts on.
+
+    python benchmarks/check_query_plans.py --mock
+
+Queries with an empty filter read or clear a whole collection on purpose
+(GET /api/trains, the availability rebuild) and are not checked.
+"""
+import argparse
+import copy
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask  # noqa: E402
+from backend.api.routes import register_routes  # noqa: E402
+from backend.models.indexes import INDEXES, ensure_indexes  # noqa: E402
+
+# Code the stub SMS backend approves during the tour
+OTP_CODE = '424242'
+# Collection methods whose first argument is a filter
+FILTER_METHODS = (
+    'find', 'find_one', 'find_one_and_update', 'find_one_and_delete', 'find_one_and_replace',
+    'update_one', 'update_many', 'replace_one', 'delete_one', 'delete_many', 'count_documents'
+)
+
+
+class RecordedCursor:
+    """Passes a cursor through, adding its sort() to the recorded query."""
+
+    def __init__(self, cursor, entry):
+        self._cursor = cursor
+        self._entry = entry
+
+    def sort(self, key, direction=None):
+        self._entry['sort'] = [(key, direction or 1)] if isinstance(key, str) else list(key)
+        self._cursor = self._cursor.sort(key, direction) if direction is not None else self._cursor.sort(key)
+        return self
+
+    def skip(self, n):
+        self._cursor = self._cursor.skip(n)
+        return self
+
+    def limit(self, n):
+        self._cursor = self._cursor.limit(n)
+        return self
+
+    def batch_size(self, n):
+        self._cursor = self._cursor.batch_size(n)
+        return self
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __next__(self):
+        return next(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class RecordedCollection:
+    """Passes calls through to a collection, recording the filter of each query."""
+
+    def __init__(self, collection, recorder):
+        self._collection = collection
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if name in FILTER_METHODS:
+            def call(*args, **kwargs):
+                query = args[0] if args else kwargs.get('filter')
+                entry = self._recorder.record(self._collection.name, query, kwargs.get('sort'))
+                result = attribute(*args, **kwargs)
+                return RecordedCursor(result, entry) if name == 'find' else result
+            return call
+        if name == 'distinct':
+            def call(key, query=None, *args, **kwargs):
+                self._recorder.record(self._collection.name, query, None)
+                return attribute(key, query, *args, **kwargs)
+            return call
+        if name == 'aggregate':
+            def call(pipeline, *args, **kwargs):
+                if pipeline and '$match' in pipeline[0]:
+                    self._recorder.record(self._collection.name, pipeline[0]['$match'], None)
+                return attribute(pipeline, *args, **kwargs)
+            return call
+        if name == 'bulk_write':
+            def call(requests, *args, **kwargs):
+                for request in requests:
+                    self._recorder.record(self._collection.name, getattr(request, '_filter', None), None)
+                return attribute(requests, *args, **kwargs)
+            return call
+        return attribute
+
+
+class RecordingDatabase:
+    """A database whose collections record every query sent through them.
+
+    Each query is stored with a label: the route being requested on the calling
+    thread ('background' for worker threads)."""
+
+    def __init__(self, db):
+        self._db = db
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.queries = []
+
+    def __getitem__(self, name):
+        return RecordedCollection(self._db[name], self)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._db, name)
+        if type(attribute).__name__ == 'Collection':
+            return RecordedCollection(attribute, self)
+        return attribute
+
+    @property
+    def label(self):
+        return getattr(self._local, 'label', 'background')
+
+    @label.setter
+    def label(self, value):
+        self._local.label = value
+
+    def record(self, collection, query, sort):
+        if not query:
+            return {}
+        entry = {'query': copy.deepcopy(query), 'sort': list(sort) if sort else None}
+        with self._lock:
+            self.queries.append((self.label, collection, entry))
+        return entry
+
+    # (route, collection, filter, sort) for every query recorded, once per route and query shape
+    def recorded(self):
+        seen, queries = set(), []
+        for label, collection, entry in self.queries:
+            key = (label, collection, shape(entry['query']), str(entry['sort']))
+            if key not in seen:
+                seen.add(key)
+                queries.append((label, collection, entry['query'], entry['sort']))
+        return sorted(queries, key=lambda q: (q[1], q[0]))
+
+
+# The fields and operators of a filter, without its values
+def shape(query):
+    if isinstance(query, dict):
+        return tuple(sorted((key, shape(value)) for key, value in query.items()))
+    if isinstance(query, list):
+        return tuple(shape(value) for value in query if isinstance(value, (dict, list)))
+    return None
+
+
+def build_app(db):
+    app = Flask(__name__)
+    app.config.update(
+        TWILIO_ACCOUNT_SID=None, TWILIO_AUTH_TOKEN=None, SMS_BACKEND='stub', STUB_OTP_CODE=OTP_CODE,
+        OTP_THROTTLE_SECONDS=0, TRACKING_CHANGE_STREAMS=False, TELEMETRY_COALESCE_SECONDS=0,
+        AVAILABILITY_RECONCILE_SECONDS=0, NOTIFICATION_SWEEP_SECONDS=0
+    )
+    register_routes(app, db)
+    return app
+
+
+# Function to send one request to every route of the app (except the endless streams)
+# with a small timetable of its own. Returns the recorded queries.
+def route_tour(db):
+    recording = RecordingDatabase(db)
+    app = build_app(recording)
+    client = app.test_client()
+    rules = app.url_map.bind('localhost')
+
+    def visit(method, path, **kwargs):
+        rule, _ = rules.match(path.split('?')[0], method=method, return_rule=True)
+        recording.label = f'{method} {rule.rule}'
+        response = client.open(path, method=method, **kwargs)
+        recording.label = 'background'
+        assert response.status_code < 500, f'{method} {path}: {response.status_code} {response.data[:200]}'
+        return response.get_json(silent=True) or {}
+
+    user_id = visit('POST', '/api/users/register', json={'name': 'Plan', 'email': 'plan@example.com', 'password': 'x'})['user_id']
+    db.users.update_one({'email': 'plan@example.com'}, {'$set': {'phone': '+919000000000'}})
+    visit('POST', '/api/users/login', json={'email': 'plan@example.com', 'password': 'x'})
+    visit('GET', '/api/users/by_email?email=plan@example.com')
+    train = {'name': '12627', 'source': 'Chennai', 'destination': 'Mumbai', 'departure_time': '08:00',
+             'arrival_time': '20:00', 'total_seats': 16, 'stops': ['Chennai', 'Pune', 'Mumbai'], 'stop_km': [0, 900, 1200]}
+    train_id = visit('POST', '/api/admin/trains', json=train)['train_id']
+    visit('POST', f'/api/admin/trains/{train_id}/coaches', json={'consist': [
+        {'coach_number': 'S1', 'coach_type': 'sleeper', 'total_seats': 8},
+        {'coach_number': 'S2', 'coach_type': 'sleeper', 'total_seats': 8}
+    ]})
+
+    visit('GET', '/api/trains')
+    visit('GET', '/api/trains/search?from=Chennai&to=Mumbai&date=2024-01-01')
+    visit('GET', '/api/trains/lookup?name=12627')
+    visit('GET', f'/api/trains/{train_id}')
+    visit('GET', f'/api/trains/{train_id}/coaches')
+    visit('GET', f'/api/trains/{train_id}/availability')
+    visit('GET', f'/api/trains/{train_id}/availability/summary')
+    visit('GET', f'/api/trains/{train_id}/coaches/S1/seatmap')
+    visit('POST', f'/api/trains/{train_id}/coaches/S2/seatmap', json={'seat_map': {'8': {'available': False}}})
+    visit('POST', f'/api/quotas/{train_id}/S1', json={'quota_type': 'general', 'total_seats': 8, 'available_seats': 8})
+    visit('GET', f'/api/quotas/{train_id}/S1')
+
+    seat = {'train_id': train_id, 'coach_number': 'S1', 'user_id': user_id}
+    visit('POST', '/api/bookings/lock', json=dict(seat, seat_number='1'))
+    visit('POST', '/api/bookings/unlock', json=dict(seat, seat_number='1'))
+    visit('POST', '/api/bookings/lock', json=dict(seat, seat_number='1'))
+    booking = {'user_id': user_id, 'train_id': train_id, 'date': '2024-01-01'}
+    booking_id = visit('POST', '/api/bookings', json=dict(booking, seats=['S1-1']))['booking_id']
+    visit('POST', '/api/bookings/allocate', json={'train_id': train_id, 'party_size': 2, 'user_id': user_id})
+    visit('POST', '/api/bookings/bulk', json={'bookings': [
+        dict(booking, seats=['S1-3']), dict(booking, seats=['S1-4'], **{'from': 'Chennai', 'to': 'Pune'})
+    ]})
+    waitlist = dict(booking, coach_type='sleeper')
+    entry_id = visit('POST', '/api/waitlist', json=waitlist)['waitlist_id']
+    visit('GET', f'/api/waitlist/{train_id}?date=2024-01-01&coach_type=sleeper')
+    visit('GET', f'/api/waitlist/entry/{entry_id}')
+    visit('POST', f'/api/bookings/{booking_id}/cancel')
+    entry_id = visit('POST', '/api/waitlist', json=waitlist)['waitlist_id']
+    visit('DELETE', f'/api/waitlist/entry/{entry_id}')
+    visit('GET', f'/api/bookings/{user_id}')
+    visit('GET', f'/api/bookings/{user_id}?status=confirmed')
+    visit('GET', '/api/bookings/all')
+    visit('GET', f'/api/bookings/all?after={booking_id}')
+
+    visit('POST', f'/api/coach_positions/{train_id}/S1',
+          json={'platform_number': 1, 'position_on_platform': 3, 'station': 'Pune', 'eta': '12:00'})
+    visit('GET', f'/api/coach_positions/{train_id}')
+    visit('POST', '/api/telemetry', json=[
+        {'train_id': train_id, 'coach_number': 'S1', 'station': 'Pune'},
+        {'train_id': train_id, 'current_station': 'Pune', 'speed': 80}
+    ])
+    visit('GET', '/api/telemetry/stats')
+    visit('GET', f'/api/tracking/{train_id}')
+    visit('POST', '/api/admin/alerts', json={'message': 'Platform change', 'type': 'platform_change', 'train_id': train_id})
+    job_id = visit('POST', '/api/alerts/route_deviation', json={'train_id': train_id, 'message': 'Diverted'})['job_id']
+    visit('GET', '/api/alerts')
+    visit('GET', f'/api/alerts/{train_id}')
+
+    tracking_id = visit('POST', '/api/passenger/send_otp', json={'phone': '+919000000000'}).get('tracking_id')
+    if tracking_id:
+        visit('GET', f'/api/passenger/otp/{tracking_id}')
+    visit('POST', '/api/passenger/verify_otp', json={'phone': '+919000000000', 'otp': OTP_CODE})
+    visit('POST', '/api/admin/availability/reconcile', json={'train_id': train_id})
+
+    # Let the notification job finish so its queries are recorded too
+    for _ in range(50):
+        if visit('GET', f'/api/notifications/jobs/{job_id}').get('job', {}).get('status') in ('completed', 'failed'):
+            break
+        time.sleep(0.1)
+    return recording.recorded()
+
+
+def get_db(args):
+    if args.mock:
+        import mongomock
+        return mongomock.MongoClient().railway_reservation_plans
+    from pymongo import MongoClient
+    return MongoClient(args.mongo_uri).railway_reservation_plans
+
+
+# Every stage name in an explain() plan tree
+def plan_stages(plan):
+    stages = [plan.get('stage')]
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            stages += plan_stages(plan[key])
+    for child in plan.get('inputStages', []):
+        stages += plan_stages(child)
+    return stages
+
+
+def explain_stages(db, collection, query, sort):
+    command = {'find': collection, 'filter': query}
+    if sort:
+        command['sort'] = dict(sort)
+    explained = db.command('explain', command, verbosity='queryPlanner')
+    return plan_stages(explained['queryPlanner']['winningPlan'])
+
+
+# Fallback for mongomock: the query can use an index if one starts with a field it filters
+# or sorts on. An $or needs an index for every branch.
+def declared_stages(collection, query, sort):
+    if list(query) == ['$or']:
+        branches = [declared_stages(collection, branch, sort) for branch in query['$or']]
+        return ['OR'] + [stage for branch in branches for stage in branch]
+    if '_id' in query:
+        return ['IDHACK']
+    fields = set(query) | {field for field, _ in sort or []}
+    for index in INDEXES.get(collection, []):
+        if next(iter(index.document['key'])) in fields:
+            return ['IXSCAN']
+    return ['COLLSCAN']
+
+
+# Function to reset a database to empty collections with the app's indexes
+def prepare(db):
+    for collection in INDEXES:
+        db[collection].drop()
+    ensure_indexes(db)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--mock', action='store_true', help='check against declared indexes instead of a MongoDB server')
+    args = parser.parse_args()
+
+    db = get_db(args)
+    prepare(db)
+    queries = route_tour(db)
+
+    failures = 0
+    for route, collection, query, sort in queries:
+        stages = declared_stages(collection, query, sort) if args.mock else explain_stages(db, collection, query, sort)
+        scan = 'COLLSCAN' in stages
+        failures += scan
+        print(f'{"FAIL" if scan else "ok":>4}  {collection:<18} {route:<48} {" > ".join(s for s in stages if s)}')
+
+    print(f'\n{len(queries)} queries, {failures} collection scans')
+    if not args.mock:
+        db.client.drop_database(db.name)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Notification fan-out benchmark
+
+Seeds one train with N passengers holding confirmed bookings, then runs a route
+deviation job through NotificationDispatcher with the stub SMS backend and reports
+messages per second for each worker pool size.
+
+    python benchmarks/notification_fanout.py --mock --passengers 1500 --latency 0.05
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bson import ObjectId  # noqa: E402
+from backend.services.messaging import StubBackend  # noqa: E402
+from backend.services.notifications import NotificationDispatcher  # noqa: E402
+
+
+def get_db(args):
+    if args.mock:
+        import mongomock
+        return mongomock.MongoClient().railway_reservation_bench
+    from pymongo import MongoClient
+    return MongoClient(args.mongo_uri).railway_reservation_bench
+
+
+def seed(db, passengers):
+    for name in ['trains', 'users', 'bookings', 'notification_jobs']:
+        db[name].drop()
+    train_id = db.trains.insert_one({'name': 'Bench Express'}).inserted_id
+    user_ids = db.users.insert_many(
+        [{'name': f'P{i}', 'phone': f'+9190000{i:05d}'} for i in range(passengers)]
+    ).inserted_ids
+    # Some passengers hold more than one booking; they must still get one SMS
+    bookings = [{'train_id': train_id, 'user_id': user_id, 'status': 'confirmed'} for user_id in user_ids]
+    bookings += [{'train_id': train_id, 'user_id': user_id, 'status': 'confirmed'} for user_id in user_ids[::10]]
+    db.bookings.insert_many(bookings)
+    return db.trains.find_one({'_id': train_id})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--mock', action='store_true', help='use mongomock instead of a MongoDB server')
+    parser.add_argument('--passengers', type=int, default=1500)
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated seconds per SMS API call')
+    parser.add_argument('--workers', default='1,8,32', help='comma-separated pool sizes to compare')
+    parser.add_argument('--rate', type=float, default=0, help='rate limit in messages/s (0 = unlimited)')
+    args = parser.parse_args()
+
+    db = get_db(args)
+    train = seed(db, args.passengers)
+    print(f'{args.passengers} passengers, {args.latency * 1000:.0f} ms per send\n')
+    for workers in [int(w) for w in args.workers.split(',')]:
+        sender = StubBackend(latency=args.latency)
+        dispatcher = NotificationDispatcher(db, sender, max_workers=workers, rate_per_second=args.rate or None)
+        start = time.perf_counter()
+        job_id = dispatcher.submit_route_deviation(train, ObjectId(), 'Diverted via bench route')
+        submitted = time.perf_counter() - start
+        while dispatcher.get_job(job_id)['status'] in ('queued', 'running'):
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        job = dispatcher.get_job(job_id)
+        dispatcher.shutdown()
+        print(f'workers={workers:<4} submit={submitted * 1000:6.1f} ms  sent={job["sent"]:<6} '
+              f'failed={job["failed"]:<4} {job["sent"] / elapsed:8,.0f} msg/s')
+
+
+if __name__ == '__main__':
+    main()
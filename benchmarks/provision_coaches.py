@@ -0,0 +1,93 @@
+"""
+Coach provisioning benchmark
+
+Creates the coaches of a fleet of --trains trains in two ways and reports
+coaches and seats per second for each:
+
+  per_seat  a JSON seat map per coach built seat by seat with get_seat_type,
+            one insert_one per coach (the old way)
+  bulk      create_coaches: every coach's empty inventory built from the seat
+            layout tables, one insert_many per train
+
+    python benchmarks/provision_coaches.py --mock --trains 500
+    python benchmarks/provision_coaches.py --mongo-uri mongodb://localhost:27017 --trains 5000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend.models.indexes import ensure_indexes  # noqa: E402
+from backend.services.provisioning import create_coaches  # noqa: E402
+from backend.utils.helpers import get_seat_type  # noqa: E402
+
+# A typical long-distance consist: (coach type, coaches, seats per coach)
+CONSIST = [('sleeper', 12, 72), ('AC', 6, 64), ('AC', 4, 48), ('general', 2, 90)]
+
+
+def get_db(args):
+    if args.mock:
+        import mongomock
+        return mongomock.MongoClient().railway_reservation_bench
+    from pymongo import MongoClient
+    return MongoClient(args.mongo_uri).railway_reservation_bench
+
+
+def consist():
+    coaches, n = [], 0
+    for coach_type, count, seats in CONSIST:
+        for _ in range(count):
+            n += 1
+            coaches.append({'coach_number': f'{coach_type[0].upper()}{n}', 'coach_type': coach_type, 'total_seats': seats})
+    return coaches
+
+
+def provision_per_seat(db, train, coaches):
+    for coach in coaches:
+        seat_map = {}
+        for i in range(1, coach['total_seats'] + 1):
+            seat_map[str(i)] = {'available': True, 'type': get_seat_type(i, coach['coach_type'])}
+        db.coaches.insert_one(dict(coach, train_id=train['_id'], seat_map=seat_map))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--mock', action='store_true', help='use mongomock instead of a MongoDB server')
+    parser.add_argument('--trains', type=int, default=500)
+    args = parser.parse_args()
+
+    db = get_db(args)
+    db.trains.drop()
+    trains = [{'name': f'Bench Express {n}', 'source': 'A', 'destination': 'B'} for n in range(args.trains)]
+    db.trains.insert_many(trains)
+    coaches = consist()
+    documents = args.trains * len(coaches)
+    seats = args.trains * sum(c['total_seats'] for c in coaches)
+    print(f'{args.trains} trains x {len(coaches)} coaches = {documents} coaches, {seats} seats\n')
+
+    timings = {}
+    for name in ('per_seat', 'bulk'):
+        db.coaches.drop()
+        ensure_indexes(db, ['coaches'])
+        began = time.perf_counter()
+        for train in trains:
+            if name == 'per_seat':
+                provision_per_seat(db, train, coaches)
+            else:
+                create_coaches(db, train['_id'], coaches)
+        timings[name] = time.perf_counter() - began
+        written = db.coaches.count_documents({})
+        print(f'{name:9} {timings[name]:7.2f} s  ({documents / timings[name]:,.0f} coaches/s, '
+              f'{seats / timings[name]:,.0f} seats/s), {written} documents')
+
+    # A train that already has coaches is left alone
+    again = create_coaches(db, trains[0]['_id'], coaches)
+    print(f'\nspeed-up: {timings["per_seat"] / timings["bulk"]:.1f}x; re-run created {len(again)}')
+    sys.exit(0 if not again and written == documents else 1)
+
+
+if __name__ == '__main__':
+    main()
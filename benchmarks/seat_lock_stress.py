@@ -0,0 +1,102 @@
+"""
+Seat lock stress benchmark
+
+Runs N concurrent clients against a single coach, each trying to lock seats
+through SeatHoldEngine until the coach is full, and checks that no seat was
+ever handed to two clients.
+
+    python benchmarks/seat_lock_stress.py --clients 500 --seats 72
+    python benchmarks/seat_lock_stress.py --mock   # mongomock, no server needed
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bson import ObjectId  # noqa: E402
+from backend.models.indexes import ensure_indexes  # noqa: E402
+from backend.services.seat_holds import SeatHoldEngine  # noqa: E402
+from backend.utils.helpers import generate_seat_bits  # noqa: E402
+
+
+def get_db(args):
+    if args.mock:
+        import mongomock
+        return mongomock.MongoClient().railway_reservation_bench
+    from pymongo import MongoClient
+    return MongoClient(args.mongo_uri, maxPoolSize=args.clients).railway_reservation_bench
+
+
+def run_round(engine, train_id, coach_number, clients, seats):
+    barrier = threading.Barrier(clients)
+    attempts = Counter()
+
+    def client(client_id):
+        order = [str(n) for n in range(1, seats + 1)]
+        random.shuffle(order)
+        barrier.wait()
+        for seat_number in order:
+            attempts[client_id] += 1
+            hold, error = engine.hold(train_id, coach_number, seat_number, holder=f'client-{client_id}')
+            if hold:
+                return seat_number
+        return None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        won = list(pool.map(client, range(clients)))
+    elapsed = time.perf_counter() - start
+    return [seat for seat in won if seat is not None], sum(attempts.values()), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--mock', action='store_true', help='use mongomock instead of a MongoDB server')
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--seats', type=int, default=72)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    db = get_db(args)
+    db.coaches.drop()
+    db.seat_holds.drop()
+    engine = SeatHoldEngine(db)
+    ensure_indexes(db, ['seat_holds'])
+
+    train_id = ObjectId()
+    db.coaches.insert_one({
+        'train_id': train_id, 'coach_number': 'S1', 'coach_type': 'sleeper',
+        'total_seats': args.seats, 'seat_bits': generate_seat_bits(args.seats)
+    })
+
+    double_locks = 0
+    total_locks = total_attempts = 0
+    total_time = 0.0
+    for round_number in range(1, args.rounds + 1):
+        won, attempts, elapsed = run_round(engine, train_id, 'S1', args.clients, args.seats)
+        duplicates = [seat for seat, count in Counter(won).items() if count > 1]
+        stored = db.seat_holds.count_documents({'train_id': train_id})
+        double_locks += len(duplicates)
+        total_locks += len(won)
+        total_attempts += attempts
+        total_time += elapsed
+        print(f'round {round_number}: {len(won)} locks, {attempts} attempts, {stored} holds stored, '
+              f'{len(duplicates)} double-locked, {elapsed:.3f}s')
+        db.seat_holds.delete_many({'train_id': train_id})
+
+    print(f'\nclients={args.clients} seats={args.seats} rounds={args.rounds}')
+    print(f'double locks:      {double_locks}')
+    print(f'locks/s:           {total_locks / total_time:,.0f}')
+    print(f'lock attempts/s:   {total_attempts / total_time:,.0f}')
+    sys.exit(1 if double_locks else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Response serialization micro-benchmark
+
+Builds N train documents shaped like the `trains` collection (ObjectId, datetime,
+nested stops) and times encoding a GET /api/trains payload with:
+
+  - legacy:     jsonify({'trains': json.loads(json.dumps(trains, default=str))})
+  - stdlib:     json_response() with the json module encoder
+  - orjson:     json_response() with orjson (skipped if orjson is not installed)
+  - projected:  json_response() on documents loaded with ?fields=name,source,destination,departure_time
+
+No database is needed.
+
+    python benchmarks/serialization_bench.py --trains 10000 --repeat 5
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bson import ObjectId  # noqa: E402
+from flask import Flask, jsonify  # noqa: E402
+from backend.utils import serialization  # noqa: E402
+
+STATIONS = ['Chennai', 'Bengaluru', 'Mumbai', 'Delhi', 'Kolkata', 'Hyderabad', 'Pune', 'Jaipur']
+
+
+def make_trains(count):
+    created = datetime(2024, 1, 1)
+    trains = []
+    for i in range(count):
+        source, destination = random.sample(STATIONS, 2)
+        trains.append({
+            '_id': ObjectId(),
+            'name': f'Express {i}',
+            'source': source,
+            'destination': destination,
+            'departure_time': f'{random.randint(0, 23):02d}:{random.choice(["00", "30"])}',
+            'arrival_time': f'{random.randint(0, 23):02d}:{random.choice(["00", "30"])}',
+            'run_days': random.sample(['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'], 4),
+            'distance': random.randint(100, 2500),
+            'duration': f'{random.randint(2, 40)}h',
+            'available_seats': random.randint(0, 800),
+            'stops': [source] + random.sample(STATIONS, 3) + [destination],
+            'created_at': created + timedelta(minutes=i)
+        })
+    return trains
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = len(fn())
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trains', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    trains = make_trains(args.trains)
+    projection = serialization.parse_fields('name,source,destination,departure_time')
+    projected = [serialization.project(train, projection) for train in trains]
+
+    stdlib_encoder = json.JSONEncoder(default=serialization._default, ensure_ascii=False, separators=(',', ':'))
+    cases = [
+        ('legacy', lambda: jsonify({'trains': json.loads(json.dumps(trains, default=str))}).get_data()),
+        ('stdlib', lambda: stdlib_encoder.encode({'trains': trains}).encode('utf-8')),
+    ]
+    if serialization.orjson is not None:
+        cases.append(('orjson', lambda: serialization.json_response({'trains': trains}).get_data()))
+    else:
+        print('orjson is not installed; json_response uses the stdlib encoder\n')
+    cases.append(('projected', lambda: serialization.json_response({'trains': projected}).get_data()))
+
+    app = Flask(__name__)
+    with app.app_context():
+        baseline = None
+        print(f'{args.trains} trains, median of {args.repeat} runs\n')
+        print(f'{"encoder":>10} {"ms":>9} {"bytes":>11} {"speedup":>8}')
+        for name, fn in cases:
+            seconds, size = timed(fn, args.repeat)
+            baseline = baseline or seconds
+            print(f'{name:>10} {seconds * 1000:9.1f} {size:11d} {baseline / seconds:7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
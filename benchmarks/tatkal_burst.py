@@ -0,0 +1,112 @@
+"""
+Tatkal burst benchmark
+
+Simulates tatkal opening: N booking requests arrive evenly over a window (10k in
+60 s by default) and each one takes 1-4 seats of tatkal quota on one coach,
+falling back to general quota once tatkal is gone. Requests are issued by a
+thread pool through QuotaAllocator, exactly as POST /api/bookings does.
+
+Fails if any quota ends below zero or more seats are handed out than exist.
+Run with several --shards values to compare counter sharding:
+
+    python benchmarks/tatkal_burst.py --mongo-uri mongodb://localhost:27017 --shards 1
+    python benchmarks/tatkal_burst.py --mongo-uri mongodb://localhost:27017 --shards 8
+    python benchmarks/tatkal_burst.py --mock --requests 2000 --window 5
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bson import ObjectId  # noqa: E402
+from backend.models.indexes import ensure_indexes  # noqa: E402
+from backend.services.quota_allocation import QuotaAllocator  # noqa: E402
+
+
+def get_db(args):
+    if args.mock:
+        import mongomock
+        return mongomock.MongoClient().railway_reservation_bench
+    from pymongo import MongoClient
+    return MongoClient(args.mongo_uri, maxPoolSize=args.threads).railway_reservation_bench
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)] if ordered else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--mock', action='store_true', help='use mongomock instead of a MongoDB server')
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--window', type=float, default=60, help='seconds over which requests arrive')
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--tatkal-seats', type=int, default=2000)
+    parser.add_argument('--general-seats', type=int, default=3000)
+    parser.add_argument('--shards', type=int, default=1, help='counter documents per quota')
+    args = parser.parse_args()
+
+    db = get_db(args)
+    db.quotas.drop()
+    ensure_indexes(db, ['quotas'])
+    allocator = QuotaAllocator(db, fallback_order=['tatkal', 'general'])
+    train_id = ObjectId()
+    allocator.set_quota(train_id, 'S1', 'tatkal', args.tatkal_seats, args.tatkal_seats, shards=args.shards)
+    allocator.set_quota(train_id, 'S1', 'general', args.general_seats, args.general_seats, shards=args.shards)
+
+    outcomes = Counter()
+    seats_taken = Counter()
+    latencies = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def request(n):
+        # Requests arrive on a fixed schedule, like users refreshing at opening time
+        delay = start + n * args.window / args.requests - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        seats = random.randint(1, 4)
+        began = time.perf_counter()
+        allocations, error = allocator.allocate(train_id, 'S1', seats, 'tatkal')
+        elapsed = time.perf_counter() - began
+        with lock:
+            latencies.append(elapsed)
+            outcomes[allocations[0]['quota_type'] if allocations else error] += 1
+            for allocation in allocations:
+                seats_taken[allocation['quota_type']] += allocation['seats']
+
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(request, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    remaining = {q['quota_type']: q['available_seats'] for q in allocator.summary(train_id, 'S1')}
+    negative = db.quotas.count_documents({'available_seats': {'$lt': 0}})
+    oversold = any(
+        seats_taken[quota] + remaining[quota] != total
+        for quota, total in (('tatkal', args.tatkal_seats), ('general', args.general_seats))
+    )
+
+    print(f'{args.requests} requests over {args.window:.0f} s, {args.threads} threads, {args.shards} shard(s)\n')
+    print(f'wall time:        {elapsed:.1f} s')
+    print(f'allocations:      tatkal={outcomes["tatkal"]} general={outcomes["general"]} '
+          f'rejected={outcomes["quota_exhausted"]}')
+    print(f'seats taken:      tatkal={seats_taken["tatkal"]}/{args.tatkal_seats} '
+          f'general={seats_taken["general"]}/{args.general_seats}')
+    print(f'latency ms:       p50={percentile(latencies, 50) * 1000:.2f} p95={percentile(latencies, 95) * 1000:.2f} '
+          f'p99={percentile(latencies, 99) * 1000:.2f} mean={statistics.mean(latencies) * 1000:.2f}')
+    print(f'negative counters: {negative}')
+    print(f'seat accounting:  {"MISMATCH" if oversold else "ok"}')
+    sys.exit(1 if negative or oversold else 0)
+
+
+if __name__ == '__main__':
+    main()
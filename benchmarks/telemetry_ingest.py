@@ -0,0 +1,86 @@
+"""
+Telemetry ingest benchmark
+
+Simulates a fleet of trains whose coaches report their position every cycle and
+pushes the reports through the Flask app in two ways:
+
+  single   one POST /api/coach_positions/<train>/<coach> per report (the old path)
+  batched  one POST /api/telemetry per cycle carrying every report as NDJSON
+
+and reports requests and reports per second for each.
+
+    python benchmarks/telemetry_ingest.py --mock --trains 20 --coaches 24 --cycles 5
+    python benchmarks/telemetry_ingest.py --mongo-uri mongodb://localhost:27017 --trains 200
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bson import ObjectId  # noqa: E402
+from flask import Flask  # noqa: E402
+from backend.api.routes import register_routes  # noqa: E402
+from backend.models.indexes import ensure_indexes  # noqa: E402
+from backend.utils.serialization import dumps  # noqa: E402
+
+
+def get_db(args):
+    if args.mock:
+        import mongomock
+        return mongomock.MongoClient().railway_reservation_bench
+    from pymongo import MongoClient
+    return MongoClient(args.mongo_uri).railway_reservation_bench
+
+
+def reports(train_ids, coaches, cycle):
+    return [
+        {'train_id': str(train_id), 'coach_number': f'C{n}', 'platform_number': str(cycle % 8),
+         'position_on_platform': str(n * 22), 'station': f'S{cycle}', 'eta': f'{cycle:02d}:00'}
+        for train_id in train_ids for n in range(coaches)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--mock', action='store_true', help='use mongomock instead of a MongoDB server')
+    parser.add_argument('--trains', type=int, default=20)
+    parser.add_argument('--coaches', type=int, default=24)
+    parser.add_argument('--cycles', type=int, default=5, help='reporting rounds')
+    args = parser.parse_args()
+
+    db = get_db(args)
+    db.coach_positions.drop()
+    ensure_indexes(db, ['coach_positions'])
+    app = Flask(__name__)
+    app.config.update(TRACKING_CHANGE_STREAMS=False, TELEMETRY_COALESCE_SECONDS=0, AVAILABILITY_RECONCILE_SECONDS=0)
+    register_routes(app, db)
+    client = app.test_client()
+    train_ids = [ObjectId() for _ in range(args.trains)]
+    total = args.trains * args.coaches * args.cycles
+    print(f'{args.trains} trains x {args.coaches} coaches x {args.cycles} cycles = {total} reports\n')
+
+    start = time.perf_counter()
+    for cycle in range(args.cycles):
+        for report in reports(train_ids, args.coaches, cycle):
+            client.post(f"/api/coach_positions/{report.pop('train_id')}/{report.pop('coach_number')}", json=report)
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for cycle in range(args.cycles):
+        body = b'\n'.join(dumps(report) for report in reports(train_ids, args.coaches, cycle))
+        response = client.post('/api/telemetry', data=body, content_type='application/x-ndjson')
+        assert response.get_json()['rejected'] == 0, response.get_json()
+    batched = time.perf_counter() - start
+
+    written = db.coach_positions.count_documents({})
+    print(f'single:   {total} requests in {single:.2f} s  ({total / single:,.0f} reports/s)')
+    print(f'batched:  {args.cycles} requests in {batched:.2f} s  ({total / batched:,.0f} reports/s)')
+    print(f'speed-up: {single / batched:.1f}x, {written} coach positions stored')
+    sys.exit(0 if written == args.trains * args.coaches else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -541,12 +541,15 @@ function updateSeatMap(coachId) {
         .then(data => {
             seatMap.innerHTML = '';
             const seat_map = data.seat_map || {};
+            const held = data.held || [];
             const totalSeats = Object.keys(seat_map).length || 40;
             for (let i = 1; i <= totalSeats; i++) {
                 const seat = document.createElement('div');
                 seat.className = 'seat';
                 // Determine seat status
-                const status = seat_map[i] || 'available';
+                const entry = seat_map[i] || 'available';
+                const booked = entry === 'unavailable' || entry.available === false;
+                const status = (booked || held.includes(String(i))) ? 'unavailable' : 'available';
                 if (status === 'unavailable') {
                     seat.classList.add('booked');
                     seat.setAttribute('data-status', 'booked');
@@ -566,7 +569,8 @@ function updateSeatMap(coachId) {
                             body: JSON.stringify({
                                 train_id: selectedTrain.id,
                                 coach_number: coachId,
-                                seat_number: i
+                                seat_number: i,
+                                user_id: sessionStorage.getItem('userId') || undefined
                             })
                         });
                         if (lockRes.ok) {
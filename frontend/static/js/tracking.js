@@ -107,70 +107,118 @@ function trackByPNR(pnrNumber) {
     }, 1500);
 }
 
+// Look a train up by its id or name (the train number); resolves to null if unknown
+function findTrain(trainNumber) {
+    if (/^[0-9a-fA-F]{24}$/.test(trainNumber)) {
+        return fetch(`/api/trains/${trainNumber}`)
+            .then(res => (res.ok ? res.json() : { train: null }))
+            .then(data => data.train);
+    }
+    return fetch(`/api/trains/lookup?name=${encodeURIComponent(trainNumber)}`)
+        .then(res => (res.ok ? res.json() : { train: null }))
+        .then(data => data.train);
+}
+
+// Tracking data for a train known to the backend; live values arrive over the stream
+function serverTrainData(train, trainNumber, bookingData) {
+    const stops = train.stops || [train.source, train.destination];
+    return {
+        trainId: train._id,
+        trainNumber: trainNumber,
+        trainName: train.name,
+        source: train.source,
+        destination: train.destination,
+        departureTime: train.departure_time || bookingData?.departureTime || '',
+        arrivalTime: train.arrival_time || bookingData?.arrivalTime || '',
+        currentStation: train.source,
+        nextStation: stops[1] || train.destination,
+        status: 'Scheduled',
+        delay: '0 min',
+        lastUpdated: new Date().toLocaleTimeString(),
+        progress: 0,
+        route: stops.map((station, i) => ({
+            station: station,
+            arrival: i === stops.length - 1 ? train.arrival_time || '' : '',
+            departure: i === 0 ? train.departure_time || '' : '',
+            status: i === 0 ? 'current' : 'upcoming'
+        }))
+    };
+}
+
+// Demo tracking data for trains the backend does not know
+function mockTrainData(trainNumber, bookingData) {
+    return {
+        trainNumber: trainNumber,
+        trainName: bookingData?.trainName || `Train ${trainNumber}`,
+        source: bookingData?.source || 'New Delhi',
+        destination: bookingData?.destination || 'Mumbai',
+        departureTime: bookingData?.departureTime || '08:00',
+        arrivalTime: bookingData?.arrivalTime || '16:30',
+        currentStation: 'Surat',
+        nextStation: 'Vadodara',
+        status: 'Running',
+        delay: '10 min',
+        lastUpdated: new Date().toLocaleTimeString(),
+        progress: 65, // Percentage of journey completed
+        coordinates: { lat: 21.1702, lng: 72.8311 }, // Surat coordinates
+        route: [
+            { station: 'New Delhi', arrival: '', departure: '08:00', status: 'departed' },
+            { station: 'Mathura', arrival: '09:30', departure: '09:35', status: 'departed' },
+            { station: 'Agra', arrival: '10:30', departure: '10:40', status: 'departed' },
+            { station: 'Gwalior', arrival: '12:00', departure: '12:10', status: 'departed' },
+            { station: 'Jhansi', arrival: '13:30', departure: '13:40', status: 'departed' },
+            { station: 'Bhopal', arrival: '15:30', departure: '15:40', status: 'departed' },
+            { station: 'Surat', arrival: '19:30', departure: '19:40', status: 'current' },
+            { station: 'Vadodara', arrival: '20:45', departure: '20:55', status: 'upcoming' },
+            { station: 'Ahmedabad', arrival: '22:00', departure: '22:10', status: 'upcoming' },
+            { station: 'Mumbai', arrival: '16:30', departure: '', status: 'upcoming' }
+        ]
+    };
+}
+
 // Track by Train Number
 function trackByTrainNumber(trainNumber, bookingData = null) {
     showTrackingLoading();
     
-    // In a real application, this would fetch data from the server
-    // For demo purposes, we'll use mock data
-    setTimeout(() => {
-        // Mock train data
-        const trainData = {
-            trainNumber: trainNumber,
-            trainName: bookingData?.trainName || `Train ${trainNumber}`,
-            source: bookingData?.source || 'New Delhi',
-            destination: bookingData?.destination || 'Mumbai',
-            departureTime: bookingData?.departureTime || '08:00',
-            arrivalTime: bookingData?.arrivalTime || '16:30',
-            currentStation: 'Surat',
-            nextStation: 'Vadodara',
-            status: 'Running',
-            delay: '10 min',
-            lastUpdated: new Date().toLocaleTimeString(),
-            progress: 65, // Percentage of journey completed
-            coordinates: { lat: 21.1702, lng: 72.8311 }, // Surat coordinates
-            route: [
-                { station: 'New Delhi', arrival: '', departure: '08:00', status: 'departed' },
-                { station: 'Mathura', arrival: '09:30', departure: '09:35', status: 'departed' },
-                { station: 'Agra', arrival: '10:30', departure: '10:40', status: 'departed' },
-                { station: 'Gwalior', arrival: '12:00', departure: '12:10', status: 'departed' },
-                { station: 'Jhansi', arrival: '13:30', departure: '13:40', status: 'departed' },
-                { station: 'Bhopal', arrival: '15:30', departure: '15:40', status: 'departed' },
-                { station: 'Surat', arrival: '19:30', departure: '19:40', status: 'current' },
-                { station: 'Vadodara', arrival: '20:45', departure: '20:55', status: 'upcoming' },
-                { station: 'Ahmedabad', arrival: '22:00', departure: '22:10', status: 'upcoming' },
-                { station: 'Mumbai', arrival: '16:30', departure: '', status: 'upcoming' }
-            ]
-        };
-        
-        // Display train tracking information
-        displayTrackingInfo(trainData, bookingData);
-        
-        // Update map with train location
-        updateTrackingMap(trainData);
-        
-        // Hide loading
-        hideTrackingLoading();
-        
-        // Show tracking result
-        showTrackingResult();
-        
-        // Start real-time updates
-        startRealTimeUpdates(trainData);
-    }, 1500);
+    findTrain(trainNumber)
+        .catch(() => null)
+        .then(train => {
+            const trainData = train ? serverTrainData(train, trainNumber, bookingData) : mockTrainData(trainNumber, bookingData);
+            
+            // Display train tracking information
+            displayTrackingInfo(trainData, bookingData);
+            
+            // Update map with train location
+            updateTrackingMap(trainData);
+            
+            // Hide loading
+            hideTrackingLoading();
+            
+            // Show tracking result
+            showTrackingResult();
+            
+            // Start real-time updates
+            startRealTimeUpdates(trainData);
+        });
+}
+
+// Set the text of an element if the page has it
+function setText(id, value) {
+    const element = document.getElementById(id);
+    if (element) element.textContent = value;
 }
 
 // Display Tracking Information
 function displayTrackingInfo(trainData, bookingData) {
     // Set train information
-    document.getElementById('tracking-train-number')?.textContent = trainData.trainNumber;
-    document.getElementById('tracking-train-name')?.textContent = trainData.trainName;
-    document.getElementById('tracking-route')?.textContent = `${trainData.source} to ${trainData.destination}`;
-    document.getElementById('tracking-status')?.textContent = trainData.status;
-    document.getElementById('tracking-delay')?.textContent = trainData.delay;
-    document.getElementById('tracking-current-station')?.textContent = trainData.currentStation;
-    document.getElementById('tracking-next-station')?.textContent = trainData.nextStation;
-    document.getElementById('tracking-last-updated')?.textContent = trainData.lastUpdated;
+    setText('tracking-train-number', trainData.trainNumber);
+    setText('tracking-train-name', trainData.trainName);
+    setText('tracking-route', `${trainData.source} to ${trainData.destination}`);
+    setText('tracking-status', trainData.status);
+    setText('tracking-delay', trainData.delay);
+    setText('tracking-current-station', trainData.currentStation);
+    setText('tracking-next-station', trainData.nextStation);
+    setText('tracking-last-updated', trainData.lastUpdated);
     
     // Set progress bar
     const progressBar = document.getElementById('tracking-progress-bar');
@@ -185,9 +233,9 @@ function displayTrackingInfo(trainData, bookingData) {
             bookingSection.style.display = 'block';
         }
         
-        document.getElementById('tracking-booking-id')?.textContent = bookingData.id;
-        document.getElementById('tracking-pnr')?.textContent = bookingData.pnr;
-        document.getElementById('tracking-booking-status')?.textContent = bookingData.status;
+        setText('tracking-booking-id', bookingData.id);
+        setText('tracking-pnr', bookingData.pnr);
+        setText('tracking-booking-status', bookingData.status);
         
         // Display passenger information
         const passengerList = document.getElementById('tracking-passenger-list');
@@ -390,13 +438,59 @@ function updateTrackingMap(trainData) {
     }
 }
 
+// Merge a server tracking snapshot/delta into the displayed train data
+function applyTrackingUpdate(trainData, update) {
+    if ('current_station' in update) trainData.currentStation = update.current_station;
+    if ('next_station' in update) trainData.nextStation = update.next_station;
+    if ('status' in update) trainData.status = update.status;
+    if ('progress' in update) trainData.progress = update.progress;
+    if ('delay' in update) trainData.delay = `${update.delay} min`;
+    trainData.lastUpdated = new Date().toLocaleTimeString();
+    return trainData;
+}
+
 // Start Real-time Updates
 function startRealTimeUpdates(initialData) {
-    // In a real application, this would use WebSockets or polling to get updates
-    // For demo purposes, we'll simulate updates every 10 seconds
-    
     // Store initial data
     let trainData = { ...initialData };
+
+    // Stop the updates of a previous search
+    if (window.trackingStream) {
+        window.trackingStream.close();
+        window.trackingStream = null;
+    }
+    if (window.trackingInterval) {
+        clearInterval(window.trackingInterval);
+        window.trackingInterval = null;
+    }
+
+    const onUpdate = update => {
+        trainData = applyTrackingUpdate(trainData, update);
+        displayTrackingInfo(trainData);
+        updateTrackingMap(trainData);
+    };
+
+    // Trains known to the backend get pushed updates over Server-Sent Events
+    if (initialData.trainId && window.EventSource) {
+        const stream = new EventSource(`/api/tracking/${initialData.trainId}/stream`);
+        stream.addEventListener('snapshot', event => onUpdate(JSON.parse(event.data)));
+        stream.addEventListener('delta', event => onUpdate(JSON.parse(event.data)));
+        window.trackingStream = stream;
+        return;
+    }
+
+    // Browsers without EventSource poll the tracking API every 10 seconds instead
+    if (initialData.trainId) {
+        const poll = () => fetch(`/api/tracking/${initialData.trainId}`)
+            .then(res => (res.ok ? res.json() : null))
+            .then(update => update && onUpdate(update))
+            .catch(() => {});
+        poll();
+        window.trackingInterval = setInterval(poll, 10000);
+        return;
+    }
+
+    // Demo trains: simulate updates every 10 seconds
     
     // Update function
     const updateTrainData = () => {
@@ -437,25 +531,7 @@ function startRealTimeUpdates(initialData) {
     };
     
     // Start interval
-    const updateInterval = setInterval(updateTrainData, 10000);
-    
-    // Store interval ID for cleanup
-    document.getElementById('tracking-result')?.dataset.updateInterval = updateInterval;
-    
-    // Add event listener to stop updates when tracking result is hidden
-    const trackingForm = document.getElementById('tracking-form');
-    if (trackingForm) {
-        trackingForm.addEventListener('submit', function() {
-            // Clear previous interval
-            const trackingResult = document.getElementById('tracking-result');
-            if (trackingResult) {
-                const previousInterval = trackingResult.dataset.updateInterval;
-                if (previousInterval) {
-                    clearInterval(previousInterval);
-                }
-            }
-        });
-    }
+    window.trackingInterval = setInterval(updateTrainData, 10000);
 }
 
 // Initialize Alert Subscription
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import mongomock
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from backend.models.indexes import ensure_indexes  # noqa: E402
+
+
+# An empty in-process database with the app's indexes
+@pytest.fixture
+def db():
+    database = mongomock.MongoClient().railway_reservation_test
+    ensure_indexes(database)
+    return database
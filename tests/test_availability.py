@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+from backend.services import availability as availability_module
+from backend.services.availability import RECONCILE_LEASE, AvailabilityIndex
+from backend.services.seat_holds import SeatHoldEngine
+from backend.services.seat_inventory import release_seats_bulk
+
+FIRST_LEG = 0b01
+SECOND_LEG = 0b10
+
+
+def add_train(db, total_seats=4):
+    train_id = db.trains.insert_one({'name': 'Test Express', 'stops': ['A', 'B', 'C']}).inserted_id
+    coach = {
+        'train_id': train_id, 'coach_number': 'S1', 'coach_type': 'sleeper',
+        'total_seats': total_seats, 'segment_bits': [0] * total_seats
+    }
+    db.coaches.insert_one(coach)
+    AvailabilityIndex(db).record_coaches(train_id, [(None, coach)], new_train=True)
+    return train_id
+
+
+def summary(db, train_id):
+    return db.availability_summary.find_one({'train_id': train_id, 'coach_type': 'sleeper'})
+
+
+def test_partial_journeys_count_a_seat_once(db):
+    train_id = add_train(db)
+    index, holds = AvailabilityIndex(db), SeatHoldEngine(db)
+
+    for segments in (FIRST_LEG, SECOND_LEG):
+        claimed = []
+        assert holds.confirm(train_id, [('S1', 1)], segments=segments, claimed=claimed) == []
+        index.record(train_id, claimed)
+    assert (summary(db, train_id)['booked'], summary(db, train_id)['available']) == (1, 3)
+
+    for segments, expected in ((FIRST_LEG, 1), (SECOND_LEG, 0)):
+        vacated = []
+        release_seats_bulk(db, train_id, {'S1': ['1']}, segments, freed=vacated)
+        index.record(train_id, vacated, booked=False)
+        assert summary(db, train_id)['booked'] == expected
+    assert db.trains.find_one({'_id': train_id})['available_seats'] == 4
+
+
+def test_rebuild_leaves_summaries_moved_while_counting(db, monkeypatch):
+    train_id = add_train(db)
+    index = AvailabilityIndex(db)
+    counts = availability_module.coach_counts
+
+    def count_during_booking(coach):
+        # A booking lands between the recount reading the coach and writing the summary
+        SeatHoldEngine(db).confirm(train_id, [('S1', 2)])
+        index.record(train_id, [('S1', '2')])
+        return counts(coach)
+
+    monkeypatch.setattr(availability_module, 'coach_counts', count_during_booking)
+    assert index.rebuild([train_id]) == 0
+    assert summary(db, train_id)['booked'] == 1
+    assert db.trains.find_one({'_id': train_id})['available_seats'] == 3
+
+    monkeypatch.setattr(availability_module, 'coach_counts', counts)
+    assert index.rebuild([train_id]) == 1
+    assert summary(db, train_id)['booked'] == 1
+
+
+def test_seat_map_edit_into_a_new_class_recounts_the_train(db):
+    train_id = add_train(db)
+    index = AvailabilityIndex(db)
+    before = db.coaches.find_one({'train_id': train_id})
+    after = dict(before, coach_type='ac3', segment_bits=[SECOND_LEG, 0, 0, 0])
+    db.coaches.replace_one({'_id': before['_id']}, after)
+    index.record_coaches(train_id, [(before, after)])
+
+    assert summary(db, train_id) is None
+    moved = db.availability_summary.find_one({'train_id': train_id, 'coach_type': 'ac3'})
+    assert (moved['total_seats'], moved['booked'], moved['available']) == (4, 1, 3)
+
+
+def test_one_process_holds_the_reconcile_lease(db):
+    first, second = AvailabilityIndex(db), AvailabilityIndex(db)
+    assert first._acquire_lease(60)
+    assert not second._acquire_lease(60)
+    assert first._acquire_lease(60)
+
+    db.leases.update_one({'_id': RECONCILE_LEASE}, {'$set': {'expires_at': datetime.utcnow() - timedelta(seconds=1)}})
+    assert second._acquire_lease(60)
+    assert not first._acquire_lease(60)
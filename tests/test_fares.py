@@ -0,0 +1,55 @@
+from backend.services.fares import FareEngine
+
+
+def add_train(db, fares, **train):
+    train['timetable_version'] = fares.next_version()
+    train['_id'] = db.trains.insert_one(train).inserted_id
+    fares.add_trains([train])
+    return train['_id']
+
+
+def test_prices_intermediate_stops_from_stop_km(db):
+    fares = FareEngine(db, rate_per_km=2).load()
+    train_id = add_train(db, fares, source='A', destination='D', stops=['A', 'B', 'C', 'D'], stop_km=[0, 100, 250, 400])
+    assert fares.price_journeys([(train_id, 'B', 'C', 3), (train_id, None, None, 1)]) == [
+        {'distance': 150, 'fare_per_seat': 300, 'price': 900},
+        {'distance': 400, 'fare_per_seat': 800, 'price': 800},
+    ]
+
+
+def test_keeps_the_shortest_distance_any_train_covers(db):
+    fares = FareEngine(db, rate_per_km=1).load()
+    add_train(db, fares, source='A', destination='D', stops=['A', 'B', 'D'], stop_km=[0, 100, 400])
+    add_train(db, fares, source='A', destination='D', distance=380)
+    assert fares.quote('A', 'D') == (380, 380)
+    assert fares.quote('A', 'B') == (100, 100)
+
+
+def test_unknown_pairs_are_not_priced(db):
+    fares = FareEngine(db).load()
+    add_train(db, fares, source='A', destination='B', distance=50)
+    add_train(db, fares, source='C', destination='D', distance=70)
+    assert fares.quote('A', 'D') == (None, None)
+    assert fares.quote('A', 'X') == (None, None)
+    assert fares.price_journeys([(None, 'B', 'A', 1)])[0] == {'distance': 50, 'fare_per_seat': 500, 'price': 500}
+
+
+def test_another_worker_loads_a_new_train_without_a_rebuild(db):
+    db.trains.insert_one({'source': 'A', 'destination': 'B', 'distance': 10})
+    worker, other = FareEngine(db).load(), FareEngine(db).load()
+    train_id = add_train(db, worker, source='A', destination='C', distance=30)
+    other._checked_at -= 60
+    assert other.price_journeys([(train_id, None, None, 2)]) == [{'distance': 30, 'fare_per_seat': 300, 'price': 600}]
+    assert other.version == worker.version == 1
+
+
+def test_refresh_waits_for_a_missing_version(db):
+    fares = FareEngine(db).load()
+    first, second = fares.next_version(), fares.next_version()
+    # The second train lands before the first one
+    db.trains.insert_one({'source': 'A', 'destination': 'B', 'distance': 10, 'timetable_version': second})
+    fares.refresh(0)
+    assert fares.version == 0 and fares.quote('A', 'B') == (100, 10)
+    db.trains.insert_one({'source': 'B', 'destination': 'C', 'distance': 20, 'timetable_version': first})
+    fares.refresh(0)
+    assert fares.version == 2 and fares.quote('B', 'C') == (200, 20)
@@ -0,0 +1,56 @@
+"""Every query the routes send must be able to use an index.
+
+benchmarks/check_query_plans.py drives the app through one request per route and
+records the queries it sends. With a MongoDB server at MONGO_URI (default
+mongodb://localhost:27017) each one is explain()ed and fails on a collection
+scan; without one the tour runs on mongomock and each query is checked against
+the declared indexes instead."""
+import functools
+import os
+
+import mongomock
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from check_query_plans import declared_stages, explain_stages, prepare, route_tour
+
+
+# The database the tour ran against (a server if one answers, else mongomock) and its queries
+@functools.lru_cache(maxsize=None)
+def recorded_queries():
+    client = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017'), serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command('ping')
+        db = client.railway_reservation_plans_test
+    except PyMongoError:
+        db = mongomock.MongoClient().railway_reservation_plans_test
+    prepare(db)
+    return db, route_tour(db)
+
+
+def pytest_generate_tests(metafunc):
+    if 'query' in metafunc.fixturenames:
+        _, queries = recorded_queries()
+        metafunc.parametrize('route, collection, query, sort', queries, ids=[f'{q[1]}: {q[0]}' for q in queries])
+
+
+@pytest.fixture(scope='module')
+def plan_db():
+    db, _ = recorded_queries()
+    yield db
+    if not isinstance(db, mongomock.Database):
+        db.client.drop_database(db.name)
+
+
+def test_tour_records_queries():
+    _, queries = recorded_queries()
+    assert len({route for route, _, _, _ in queries}) > 20
+
+
+def test_query_uses_an_index(plan_db, route, collection, query, sort):
+    if isinstance(plan_db, mongomock.Database):
+        stages = declared_stages(collection, query, sort)
+    else:
+        stages = explain_stages(plan_db, collection, query, sort)
+    assert 'COLLSCAN' not in stages, f'{route} scans {collection}: {" > ".join(s for s in stages if s)}'
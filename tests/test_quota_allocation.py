@@ -0,0 +1,78 @@
+from backend.services.quota_allocation import QuotaAllocator, split_seats
+
+TRAIN_ID = 'train'
+
+
+def available(db, quota_type):
+    return sum(doc['available_seats'] for doc in db.quotas.find({'quota_type': quota_type}))
+
+
+def test_split_seats_spreads_the_remainder():
+    assert split_seats(10, 4) == [3, 3, 2, 2]
+    assert split_seats(2, 4) == [1, 1, 0, 0]
+
+
+def test_coach_without_quotas_is_unrestricted(db):
+    assert QuotaAllocator(db).allocate(TRAIN_ID, 'S1', 3) == ([], None)
+
+
+def test_allocate_decrements_the_counter(db):
+    allocator = QuotaAllocator(db)
+    allocator.set_quota(TRAIN_ID, 'S1', 'general', 10, 10)
+    allocations, error = allocator.allocate(TRAIN_ID, 'S1', 3)
+    assert error is None
+    assert allocations == [{'coach_number': 'S1', 'quota_type': 'general', 'shard': 0, 'seats': 3}]
+    assert available(db, 'general') == 7
+
+
+def test_falls_back_to_the_next_quota_type(db):
+    allocator = QuotaAllocator(db, fallback_order='tatkal,general')
+    allocator.set_quota(TRAIN_ID, 'S1', 'tatkal', 4, 1)
+    allocator.set_quota(TRAIN_ID, 'S1', 'general', 10, 10)
+    allocations, error = allocator.allocate(TRAIN_ID, 'S1', 2, 'tatkal')
+    assert error is None and [a['quota_type'] for a in allocations] == ['general']
+    assert (available(db, 'tatkal'), available(db, 'general')) == (1, 8)
+
+
+def test_never_falls_back_to_an_earlier_quota_type(db):
+    allocator = QuotaAllocator(db, fallback_order='tatkal,general')
+    allocator.set_quota(TRAIN_ID, 'S1', 'tatkal', 4, 4)
+    allocator.set_quota(TRAIN_ID, 'S1', 'general', 1, 0)
+    assert allocator.allocate(TRAIN_ID, 'S1', 1, 'general') == ([], 'quota_exhausted')
+    assert available(db, 'tatkal') == 4
+
+
+def test_party_is_split_over_shards_when_no_shard_has_room(db):
+    allocator = QuotaAllocator(db)
+    allocator.set_quota(TRAIN_ID, 'S1', 'tatkal', 4, 4, shards=4)
+    allocations, error = allocator.allocate(TRAIN_ID, 'S1', 3, 'tatkal')
+    assert error is None
+    assert sorted(a['shard'] for a in allocations) == [0, 1, 2]
+    assert sum(a['seats'] for a in allocations) == 3
+    assert available(db, 'tatkal') == 1
+
+
+def test_failed_split_gives_every_part_back(db):
+    allocator = QuotaAllocator(db)
+    allocator.set_quota(TRAIN_ID, 'S1', 'tatkal', 4, 3, shards=4)
+    assert allocator.allocate(TRAIN_ID, 'S1', 4, 'tatkal') == ([], 'quota_exhausted')
+    assert available(db, 'tatkal') == 3
+    assert db.quotas.count_documents({'available_seats': {'$lt': 0}}) == 0
+
+
+def test_release_returns_seats_to_their_shard(db):
+    allocator = QuotaAllocator(db)
+    allocator.set_quota(TRAIN_ID, 'S1', 'tatkal', 4, 4, shards=4)
+    allocations, _ = allocator.allocate(TRAIN_ID, 'S1', 3, 'tatkal')
+    for allocation in allocations:
+        allocator.release(TRAIN_ID, allocation)
+    assert [doc['available_seats'] for doc in db.quotas.find().sort('shard', 1)] == [1, 1, 1, 1]
+
+
+def test_allocate_booking_is_all_or_nothing(db):
+    allocator = QuotaAllocator(db)
+    allocator.set_quota(TRAIN_ID, 'S1', 'general', 5, 5)
+    allocator.set_quota(TRAIN_ID, 'S2', 'general', 1, 1)
+    seats = [('S1', '1'), ('S1', '2'), ('S2', '1'), ('S2', '2')]
+    assert allocator.allocate_booking(TRAIN_ID, seats) == ([], 'quota_exhausted')
+    assert available(db, 'general') == 6
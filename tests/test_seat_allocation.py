@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+
+from backend.services.seat_allocation import SeatAllocator, SeatIndex, find_seats
+from backend.services.seat_holds import SeatHoldEngine
+from backend.utils.helpers import segment_mask
+
+TRAIN_ID = 'train'
+
+
+def coach(coach_number, booked=(), coach_type='sleeper', total_seats=16):
+    bits = 0
+    for seat_number in booked:
+        bits |= 1 << (seat_number - 1)
+    return {'coach_number': coach_number, 'coach_type': coach_type, 'total_seats': total_seats, 'seat_bits': [bits]}
+
+
+def numbers(allocation):
+    return [(coach_number, int(seat)) for coach_number, seat in allocation['seats']]
+
+
+def test_adjacent_window_with_the_most_preferences():
+    index = SeatIndex([coach('S1')], held=[])
+    allocation = find_seats(index, 2, ['side lower', 'side upper'], keep_together='adjacent')
+    assert numbers(allocation) == [('S1', 7), ('S1', 8)]
+    assert allocation['preferences_met'] == 2
+
+
+def test_adjacent_windows_skip_booked_and_held_seats():
+    index = SeatIndex([coach('S1', booked=[2, 5], total_seats=8)], held=[('S1', '7')])
+    # Free runs are 1, 3-4, 6, 8: only one run of two
+    assert numbers(find_seats(index, 2, keep_together='adjacent')) == [('S1', 3), ('S1', 4)]
+    assert find_seats(index, 3, keep_together='adjacent') is None
+
+
+def test_bay_keeps_the_party_in_one_compartment():
+    # Only seat 1 is taken in the first bay (1-8), so 4 of its 7 free seats would do,
+    # but the party of 8 needs the whole second bay
+    index = SeatIndex([coach('S1', booked=[1])], held=[])
+    assert numbers(find_seats(index, 8, keep_together='bay')) == [('S1', n) for n in range(9, 17)]
+    assert find_seats(index, 9, keep_together='bay') is None
+
+
+def test_bay_falls_back_to_adjacent_seats_without_a_berth_cycle():
+    index = SeatIndex([coach('G1', booked=[2], coach_type='general', total_seats=6)], held=[])
+    assert numbers(find_seats(index, 3, keep_together='bay')) == [('G1', 3), ('G1', 4), ('G1', 5)]
+
+
+def test_coach_mode_meets_preferences_then_stays_close():
+    index = SeatIndex([coach('S1')], held=[])
+    allocation = find_seats(index, 3, ['side lower', 'side lower'], keep_together='coach')
+    # Both side lowers (7 and 15), then the free seat closest to them
+    assert allocation['preferences_met'] == 2
+    assert numbers(allocation) == [('S1', 7), ('S1', 11), ('S1', 15)]
+
+
+def test_preferences_decide_between_coaches():
+    index = SeatIndex([coach('S1', booked=[7, 15]), coach('S2')], held=[])
+    allocation = find_seats(index, 1, ['side lower'], keep_together='coach')
+    assert numbers(allocation) == [('S2', 7)]
+
+
+def test_none_keeps_the_party_in_one_coach_when_it_can():
+    index = SeatIndex([coach('S1', booked=range(1, 15)), coach('S2', booked=range(1, 13))], held=[])
+    assert {c for c, _ in numbers(find_seats(index, 3, keep_together='none'))} == {'S2'}
+
+
+def test_none_spreads_over_coaches_when_no_coach_fits():
+    index = SeatIndex([coach('S1', booked=range(1, 15)), coach('S2', booked=range(1, 15))], held=[])
+    assert find_seats(index, 3, keep_together='coach') is None
+    allocation = find_seats(index, 3, keep_together='none')
+    assert len(allocation['seats']) == 3
+    assert {c for c, _ in numbers(allocation)} == {'S1', 'S2'}
+
+
+def test_seats_sold_on_other_segments_are_free():
+    first_leg, second_leg = segment_mask(0, 1), segment_mask(1, 2)
+    sold = {'coach_number': 'S1', 'coach_type': 'sleeper', 'total_seats': 2, 'segment_bits': [first_leg, 0]}
+    assert len(find_seats(SeatIndex([sold], held=[], segments=second_leg), 2)['seats']) == 2
+    assert find_seats(SeatIndex([sold], held=[], segments=first_leg), 2) is None
+
+
+def add_coaches(db, *coaches):
+    db.coaches.insert_many([dict(c, train_id=TRAIN_ID) for c in coaches])
+
+
+def test_allocate_holds_every_seat(db):
+    add_coaches(db, coach('S1'))
+    allocator = SeatAllocator(db, SeatHoldEngine(db))
+    allocation, error = allocator.allocate(TRAIN_ID, 3, ['lower'], holder='u1')
+    assert error is None
+    assert db.seat_holds.count_documents({'holder': 'u1'}) == 3
+    assert allocation['types'][allocation['passengers'][0]] == 'lower'
+
+
+def test_allocate_searches_again_when_a_seat_is_taken_first(db, monkeypatch):
+    add_coaches(db, coach('S1', total_seats=4))
+    seat_holds = SeatHoldEngine(db)
+    hold_many = seat_holds.hold_many
+    calls = []
+
+    # Another passenger holds the first chosen seat just before this request does
+    def racing_hold_many(train_id, seats, holder=None):
+        if not calls:
+            coach_number, seat_number = seats[0]
+            now = datetime.utcnow()
+            db.seat_holds.insert_one({'train_id': train_id, 'coach_number': coach_number, 'seat_number': seat_number,
+                                      'holder': 'rival', 'created_at': now, 'expires_at': now + timedelta(minutes=5)})
+        calls.append(seats)
+        return hold_many(train_id, seats, holder)
+
+    monkeypatch.setattr(seat_holds, 'hold_many', racing_hold_many)
+    allocation, error = SeatAllocator(db, seat_holds).allocate(TRAIN_ID, 2, holder='u1')
+    assert error is None and len(calls) == 2
+    rival = db.seat_holds.find_one({'holder': 'rival'})
+    assert ('S1', rival['seat_number']) not in allocation['seats']
+    assert db.seat_holds.count_documents({'holder': 'u1'}) == 2
+
+
+def test_allocate_reports_why_it_failed(db):
+    add_coaches(db, coach('S1', booked=range(1, 15)))
+    allocator = SeatAllocator(db, SeatHoldEngine(db))
+    assert allocator.allocate(TRAIN_ID, 3) == (None, 'no_seats')
+    assert allocator.allocate(TRAIN_ID, 1, ['lower'], require_preferences=True) == (None, 'preferences_unavailable')
+    assert db.seat_holds.count_documents({}) == 0
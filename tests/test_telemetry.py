@@ -0,0 +1,82 @@
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from backend.services.telemetry import HISTORY_COLLECTION, TelemetryIngest
+
+TRAINS = [str(ObjectId()) for _ in range(3)]
+
+
+class FailingDatabase:
+    """Wraps a database so chosen writes fail the way a server reports them."""
+
+    def __init__(self, db):
+        self.db = db
+        self.write_errors = {}  # collection -> [(index, code)] for the next write
+        self.down = False
+
+    def __getitem__(self, name):
+        return FailingCollection(self, self.db[name])
+
+
+class FailingCollection:
+    def __init__(self, owner, collection):
+        self.owner, self.collection = owner, collection
+
+    def _write(self, method, documents):
+        if self.owner.down:
+            raise AutoReconnect('connection refused')
+        failures = dict(self.owner.write_errors.pop(self.collection.name, []))
+        ok = [document for index, document in enumerate(documents) if index not in failures]
+        if ok:
+            getattr(self.collection, method)(ok, ordered=False)
+        if failures:
+            raise BulkWriteError({'writeErrors': [
+                {'index': index, 'code': code, 'errmsg': 'failed'} for index, code in sorted(failures.items())
+            ]})
+
+    def bulk_write(self, requests, ordered=True):
+        self._write('bulk_write', requests)
+
+    def insert_many(self, documents, ordered=True):
+        self._write('insert_many', documents)
+
+
+def report(train, location):
+    return {'kind': 'tracking', 'train_id': train, 'current_location': location}
+
+
+def test_only_transient_failures_are_retried(db):
+    failing = FailingDatabase(db)
+    ingest = TelemetryIngest(failing, window=60, history=True)
+    ingest.submit([report(train, 'A') for train in TRAINS])
+    # First report fails validation, second hits a stepdown
+    failing.write_errors = {'tracking': [(0, 121), (1, 189)], HISTORY_COLLECTION: [(0, 121), (1, 189)]}
+
+    assert ingest.flush() == 1
+    stats = ingest.snapshot()
+    assert (stats['written'], stats['rejected'], stats['pending']) == (1, 2, 1)
+
+    assert ingest.flush() == 1
+    assert db.tracking.count_documents({}) == 2
+    assert db[HISTORY_COLLECTION].count_documents({}) == 2
+    assert ingest.snapshot()['pending'] == 0
+    ingest.stopped.set()
+
+
+def test_stored_history_is_not_written_twice(db):
+    failing = FailingDatabase(db)
+    ingest = TelemetryIngest(failing, window=60, history=True)
+    ingest.submit([report(TRAINS[0], 'A')])
+    failing.down = True
+    try:
+        ingest.flush()
+    except AutoReconnect:
+        pass
+    # The history insert may have reached the server before the connection dropped
+    db[HISTORY_COLLECTION].insert_many(list(ingest.pending_history))
+    failing.down = False
+
+    assert ingest.flush() == 1
+    assert db[HISTORY_COLLECTION].count_documents({}) == 1
+    assert ingest.snapshot()['history'] == 1
+    ingest.stopped.set()
@@ -0,0 +1,132 @@
+from backend.services.seat_inventory import book_seat
+from backend.services.waitlist import RAC, WAITLIST, WaitlistEngine, divide_quota
+from backend.utils.helpers import generate_seat_bits, is_seat_bit_set
+
+DATE = '2026-01-01'
+
+
+def add_train(db, total_seats=8):
+    train_id = db.trains.insert_one({'name': 'Test Express', 'source': 'A', 'destination': 'B'}).inserted_id
+    db.coaches.insert_one({
+        'train_id': train_id, 'coach_number': 'S1', 'coach_type': 'sleeper',
+        'total_seats': total_seats, 'seat_bits': generate_seat_bits(total_seats)
+    })
+    return train_id
+
+
+def add_booking(db, train_id, seat_numbers, quota=None):
+    for seat_number in seat_numbers:
+        assert book_seat(db, train_id, 'S1', seat_number)
+    booking = {
+        'user_id': 'owner', 'train_id': train_id, 'train_name': 'Test Express', 'date': DATE,
+        'seats': [f'S1-{n}' for n in seat_numbers], 'status': 'confirmed'
+    }
+    if quota:
+        booking['quota'] = quota
+    booking['_id'] = db.bookings.insert_one(booking).inserted_id
+    return booking
+
+
+def seat_booked(db, train_id, seat_number):
+    return is_seat_bit_set(db.coaches.find_one({'train_id': train_id})['seat_bits'], seat_number)
+
+
+def test_divide_quota_follows_each_share():
+    allocations = [
+        {'coach_number': 'S1', 'quota_type': 'tatkal', 'shard': 0, 'seats': 2},
+        {'coach_number': 'S1', 'quota_type': 'general', 'shard': 0, 'seats': 1},
+        {'coach_number': 'B1', 'quota_type': 'general', 'shard': 0, 'seats': 1},
+    ]
+    first, second = divide_quota(allocations, [{'S1': 2}, {'S1': 1, 'B1': 1}])
+    assert first == [{'coach_number': 'S1', 'quota_type': 'tatkal', 'shard': 0, 'seats': 2}]
+    assert second == [
+        {'coach_number': 'S1', 'quota_type': 'general', 'shard': 0, 'seats': 1},
+        {'coach_number': 'B1', 'quota_type': 'general', 'shard': 0, 'seats': 1},
+    ]
+    # The caller's allocations are left as they were
+    assert allocations[0]['seats'] == 2
+
+
+def test_divide_quota_splits_one_allocation_over_shares():
+    allocations = [
+        {'coach_number': 'S1', 'quota_type': 'tatkal', 'shard': 0, 'seats': 1},
+        {'coach_number': 'S1', 'quota_type': 'tatkal', 'shard': 1, 'seats': 2},
+    ]
+    first, second = divide_quota(allocations, [{'S1': 2}, {'S1': 1}])
+    assert [(a['shard'], a['seats']) for a in first] == [(0, 1), (1, 1)]
+    assert [(a['shard'], a['seats']) for a in second] == [(1, 1)]
+
+
+def test_divide_quota_without_quota():
+    assert divide_quota([], [{'S1': 2}, {}]) == [[], []]
+
+
+def test_rac_fills_from_the_waitlist(db):
+    train_id = add_train(db)
+    engine = WaitlistEngine(db, rac_limit=1)
+    first = engine.join('u1', train_id, DATE, 'sleeper', 1)
+    second = engine.join('u2', train_id, DATE, 'sleeper', 1)
+    assert (first['tier'], second['tier']) == (RAC, WAITLIST)
+    assert engine.describe(second)['position'] == 2
+
+    assert engine.leave(first['_id'])
+    assert engine.get(second['_id'])['tier'] == RAC
+    assert not engine.leave(first['_id'])
+
+
+def test_cancel_promotes_the_parties_that_fit(db):
+    train_id = add_train(db)
+    booking = add_booking(db, train_id, [1, 2, 3])
+    engine = WaitlistEngine(db)
+    too_big = engine.join('u1', train_id, DATE, 'sleeper', 4)
+    pair = engine.join('u2', train_id, DATE, 'sleeper', 2)
+    single = engine.join('u3', train_id, DATE, 'sleeper', 1)
+
+    outcome = engine.cancel_booking(booking)
+
+    assert [entry['_id'] for entry, _ in outcome['promoted']] == [pair['_id'], single['_id']]
+    assert [new['seats'] for _, new in outcome['promoted']] == [['S1-1', 'S1-2'], ['S1-3']]
+    assert outcome['released'] == {}
+    assert engine.get(too_big['_id'])['status'] == 'waiting'
+    # Promoted seats change hands without leaving the inventory
+    assert all(seat_booked(db, train_id, n) for n in (1, 2, 3))
+    assert db.bookings.count_documents({'waitlist_id': {'$in': [pair['_id'], single['_id']]}}) == 2
+
+
+def test_cancel_looks_past_parties_too_big_for_the_seats(db):
+    train_id = add_train(db)
+    booking = add_booking(db, train_id, [1, 2])
+    engine = WaitlistEngine(db)
+    engine.join('u1', train_id, DATE, 'sleeper', 5)
+    engine.join('u2', train_id, DATE, 'sleeper', 5)
+    single = engine.join('u3', train_id, DATE, 'sleeper', 1)
+
+    outcome = engine.cancel_booking(booking)
+
+    assert [entry['_id'] for entry, _ in outcome['promoted']] == [single['_id']]
+    assert outcome['released'] == {'S1': ['2']}
+    assert seat_booked(db, train_id, 1) and not seat_booked(db, train_id, 2)
+
+
+def test_cancel_releases_only_the_quota_of_released_seats(db):
+    train_id = add_train(db)
+    quota = [{'coach_number': 'S1', 'quota_type': 'tatkal', 'shard': 0, 'seats': 2}]
+    booking = add_booking(db, train_id, [1, 2], quota=quota)
+    engine = WaitlistEngine(db)
+    engine.join('u1', train_id, DATE, 'sleeper', 1)
+
+    outcome = engine.cancel_booking(booking)
+
+    (_, promoted), = outcome['promoted']
+    assert promoted['quota'] == [dict(quota[0], seats=1)]
+    assert outcome['quota_released'] == [dict(quota[0], seats=1)]
+    assert outcome['released'] == {'S1': ['2']}
+
+
+def test_cancel_is_applied_once(db):
+    train_id = add_train(db)
+    booking = add_booking(db, train_id, [1])
+    engine = WaitlistEngine(db)
+    assert engine.cancel_booking(booking) is not None
+    assert engine.cancel_booking(booking) is None
+    assert db.bookings.find_one({'_id': booking['_id']})['status'] == 'cancelled'